@@ -36,6 +36,7 @@ AUDITED_MODELS = [
     'orders.payment',
     'returns.returnrequest',
     'returns.returnitem',
+    'returns.returnprocessing',
     'crm.lead',
     'crm.contactlog',
     'crm.sampledelivery',
@@ -203,6 +204,131 @@ def _build_update_summary(instance, diff):
     return changes
 
 
+def log_stock_movements(movements, products=None, user=None):
+    """
+    Write one AuditLog per StockMovement for core.product.
+    Stock services change Product.stock_quantity with a single UPDATE (no
+    save signals), so the movement is the audited change instead of a
+    full-model diff. products: optional {product_id: Product} holding the
+    new stock_quantity, used for a readable summary.
+    """
+    if not movements or 'core.product' not in AUDITED_MODELS:
+        return
+    from .models import AuditLog
+    user = user or get_current_user()
+    products = products or {}
+    # Several movements per product (e.g. one per batch): walk forward from
+    # the stock level before the first one so each row shows its own step.
+    running = {}
+    for movement in movements:
+        product = products.get(movement.product_id)
+        if product is not None:
+            running[movement.product_id] = running.get(movement.product_id, product.stock_quantity) - movement.quantity
+    entries = []
+    for movement in movements:
+        product = products.get(movement.product_id)
+        label = _get_object_label(product) if product else f'Product #{movement.product_id}'
+        changes = {
+            'movement': {
+                'type': movement.movement_type,
+                'quantity': movement.quantity,
+                'reference': f'{movement.reference_type} #{movement.reference_id}'
+                if movement.reference_id else movement.reference_type,
+            },
+        }
+        summary = f'{label}: stock {movement.movement_type} {movement.quantity:+d}'
+        if product is not None:
+            old_qty = running[movement.product_id]
+            new_qty = old_qty + movement.quantity
+            running[movement.product_id] = new_qty
+            changes['diff'] = {'stock_quantity': {'old': str(old_qty), 'new': str(new_qty)}}
+            summary += f' ({old_qty} → {new_qty})'
+        changes['summary'] = summary
+        entries.append(AuditLog(
+            user=user,
+            action='update',
+            model_name='core.product',
+            object_id=movement.product_id,
+            changes=changes,
+        ))
+    AuditLog.objects.bulk_create(entries)
+
+
+def log_bulk_create(instances, user=None):
+    """
+    Write 'create' AuditLogs for rows inserted with bulk_create (which sends
+    no save signals). Same payload as audit_post_save, in one INSERT.
+    """
+    instances = [instance for instance in instances if _should_audit(instance)]
+    if not instances:
+        return
+    from .models import AuditLog
+    user = user or get_current_user()
+    entries = []
+    for instance in instances:
+        new_values = _get_instance_values(instance)
+        entries.append(AuditLog(
+            user=user,
+            action='create',
+            model_name=_get_model_label(instance),
+            object_id=instance.pk,
+            changes=_build_audit_changes(instance, True, new_values),
+        ))
+    AuditLog.objects.bulk_create(entries)
+
+
+def log_bulk_update(instances, old_values, user=None):
+    """
+    Write 'update' AuditLogs for rows changed with a queryset UPDATE (no save
+    signals). instances hold the new values; old_values: {pk: {field: old value}}
+    for the fields that were written. One INSERT.
+    """
+    instances = [instance for instance in instances if _should_audit(instance)]
+    if not instances:
+        return
+    from .models import AuditLog
+    user = user or get_current_user()
+    entries = []
+    for instance in instances:
+        diff = {}
+        for field, old in old_values.get(instance.pk, {}).items():
+            old, new = _to_json_safe(old), _to_json_safe(getattr(instance, field, None))
+            if old != new:
+                diff[field] = {'old': old, 'new': new}
+        if not diff:
+            continue
+        entries.append(AuditLog(
+            user=user,
+            action='update',
+            model_name=_get_model_label(instance),
+            object_id=instance.pk,
+            changes={'diff': diff, 'summary': _build_update_summary(instance, diff)},
+        ))
+    AuditLog.objects.bulk_create(entries)
+
+
+def log_bulk_delete(instances, user=None):
+    """
+    Write 'delete' AuditLogs for rows removed without delete signals, from the
+    instances as loaded before the delete. Same payload as audit_post_delete, one INSERT.
+    """
+    instances = [instance for instance in instances if _should_audit(instance)]
+    if not instances:
+        return
+    from .models import AuditLog
+    user = user or get_current_user()
+    AuditLog.objects.bulk_create([
+        AuditLog(
+            user=user,
+            action='delete',
+            model_name=_get_model_label(instance),
+            object_id=instance.pk,
+            changes={'old': _get_instance_values(instance), 'summary': 'Deleted: ' + str(instance)[:100]},
+        )
+        for instance in instances
+    ])
+
+
 @receiver(post_delete)
 def audit_post_delete(sender, instance, **kwargs):
     """Log delete actions with deleted values."""
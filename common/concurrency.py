@@ -0,0 +1,181 @@
+"""
+Optimistic concurrency - models with an integer version column.
+
+An edit form (or API payload) carries the version the user loaded. Saving
+claims it with a compare-and-swap UPDATE ... SET version = version + 1
+WHERE id = %s AND version = %s; if another edit got there first nothing
+matches and the edit is refused instead of overwriting. Nothing is locked
+while the user has the form open.
+"""
+from django import forms
+from django.contrib.admin.utils import flatten_fieldsets
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.serializers import raise_errors_on_nested_writes
+from rest_framework.utils import model_meta
+
+CONFLICT_MESSAGE = _("This record was changed by someone else while you were editing. Reload it and try again.")
+
+
+class ConcurrentEditError(ValueError):
+    """The row's version moved since the editor loaded it."""
+
+    def __init__(self, message=CONFLICT_MESSAGE):
+        super().__init__(str(message))
+
+
+class VersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = CONFLICT_MESSAGE
+    default_code = 'conflict'
+
+
+def claim_version(instance, version=None):
+    """
+    Compare-and-swap instance's version (default: the version it was loaded with).
+    On success the row and instance.version are version + 1; the caller then
+    saves its changes in the same transaction.
+    Raises ConcurrentEditError when the stored version differs.
+    """
+    version = instance.version if version is None else int(version)
+    updated = type(instance)._base_manager.filter(pk=instance.pk, version=version).update(
+        version=F('version') + 1
+    )
+    if not updated:
+        raise ConcurrentEditError()
+    instance.version = version + 1
+
+
+def service_fields(model):
+    """
+    Columns kept by service-layer UPDATEs (stock counters, paid amounts) that
+    never bump version, listed in the model's SERVICE_FIELDS. Edits must not
+    write them: a stale value would silently undo concurrent changes.
+    """
+    return tuple(getattr(model, 'SERVICE_FIELDS', ()))
+
+
+def _update_fields(instance, names):
+    """names (edited model fields) minus service fields, plus version and auto_now stamps."""
+    skip = service_fields(type(instance))
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in skip
+        and (field.name in names or field.name == 'version' or getattr(field, 'auto_now', False))
+    ]
+
+
+def form_update_fields(form, instance):
+    """
+    Columns a versioned form save may write: the model fields the form edits,
+    the version and auto_now stamps. Everything else (stock counters kept by
+    services, denormalized flags) keeps its stored value instead of being
+    overwritten from the instance the form was built on.
+    """
+    return _update_fields(instance, form.fields)
+
+
+class VersionFormMixin(forms.Form):
+    """
+    ModelForm mixin (list it before forms.ModelForm): round-trips the instance
+    version in a hidden field. clean() rejects a stale version early; save()
+    claims it atomically with the save and writes only the form's columns.
+    """
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['version'].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        version = cleaned_data.get('version')
+        if self.instance.pk and version is not None:
+            stored = type(self.instance)._base_manager.filter(pk=self.instance.pk).values_list('version', flat=True)
+            if stored.first() != version:
+                raise ValidationError(CONFLICT_MESSAGE, code='conflict')
+        return cleaned_data
+
+    def save(self, commit=True):
+        if not commit or not self.instance.pk:
+            return super().save(commit=commit)
+        with transaction.atomic():
+            claim_version(self.instance, self.cleaned_data.get('version'))
+            instance = super().save(commit=False)
+            instance.save(update_fields=form_update_fields(self, instance))
+            self._save_m2m()
+        return instance
+
+
+class VersionedModelForm(VersionFormMixin, forms.ModelForm):
+    """Plain versioned ModelForm (e.g. for ModelAdmin.form)."""
+
+
+class VersionedAdminMixin:
+    """ModelAdmin mixin: the change form carries the version and saving claims it."""
+    form = VersionedModelForm
+
+    def get_readonly_fields(self, request, obj=None):
+        readonly = list(super().get_readonly_fields(request, obj))
+        return readonly + [name for name in service_fields(self.model) if name not in readonly]
+
+    def get_form(self, request, obj=None, change=False, **kwargs):
+        # version is a declared form field, not an editable model field
+        if 'fields' not in kwargs:
+            kwargs['fields'] = flatten_fieldsets(self.get_fieldsets(request, obj))
+        if kwargs['fields']:
+            kwargs['fields'] = [name for name in kwargs['fields'] if name != 'version']
+        return super().get_form(request, obj, change, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            claim_version(obj, form.cleaned_data.get('version'))
+            obj.save(update_fields=form_update_fields(form, obj))
+        else:
+            super().save_model(request, obj, form, change)
+
+
+class VersionedSerializerMixin:
+    """
+    ModelSerializer mixin: updates claim the version sent in the payload (or the
+    one loaded for the request) and answer 409 on a conflict.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # set on create, but only services change them afterwards
+            for name in service_fields(self.Meta.model):
+                if name in fields:
+                    fields[name].read_only = True
+        fields['version'] = serializers.IntegerField(required=False)
+        return fields
+
+    def update(self, instance, validated_data):
+        """ModelSerializer.update, saving only the columns in validated_data (plus version)."""
+        version = validated_data.pop('version', None)
+        raise_errors_on_nested_writes('update', self, validated_data)
+        info = model_meta.get_field_info(instance)
+        many = {}
+        for attr, value in validated_data.items():
+            if attr in info.relations and info.relations[attr].to_many:
+                many[attr] = value
+            else:
+                setattr(instance, attr, value)
+        with transaction.atomic():
+            try:
+                claim_version(instance, version)
+            except ConcurrentEditError:
+                raise VersionConflict()
+            instance.save(update_fields=_update_fields(instance, set(validated_data) - set(many)))
+            for attr, value in many.items():
+                getattr(instance, attr).set(value)
+        return instance
+
+    def create(self, validated_data):
+        validated_data.pop('version', None)
+        return super().create(validated_data)
@@ -6,6 +6,7 @@ PAGE_SIZE_ORDERS = 20
 PAGE_SIZE_RETURNS = 20
 PAGE_SIZE_PRODUCTS = 25
 PAGE_SIZE_CUSTOMERS = 25
+PAGE_SIZE_TYPEAHEAD = 20
 
 # List limits
 LIMIT_RECENT_ORDERS = 10
@@ -19,3 +20,6 @@ LIMIT_STOCK_MOVEMENTS = 50
 LIMIT_EXPORT_ROWS = 1000
 LIMIT_AUDIT_LOG_DISPLAY = 500
 LIMIT_AUDIT_LOG_EXPORT = 5000
+
+# API
+IDEMPOTENCY_KEY_TTL_HOURS = 24  # stored responses older than this are discarded
@@ -0,0 +1,104 @@
+"""
+Idempotent API writes - an Idempotency-Key header makes a retried request
+return the stored response of the first one instead of running again.
+
+The key row is inserted in the same transaction as the write, so a concurrent
+retry waits on the unique index and then replays the committed response.
+Failed requests (exceptions or 4xx/5xx) are rolled back with their key, so the
+client can correct the request and retry with the same key. Keys older than
+IDEMPOTENCY_KEY_TTL_HOURS are purged by the purge_idempotency_keys command.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from common.constants import IDEMPOTENCY_KEY_TTL_HOURS
+from common.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(data):
+    """sha256 of the request body, independent of key order."""
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': f"{IDEMPOTENCY_HEADER} was already used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def purge_expired_keys(batch_size=1000):
+    """
+    Delete keys past their TTL in batches of batch_size (short transactions).
+    Returns: number of keys deleted.
+    """
+    deleted = 0
+    cutoff = _expiry_cutoff()
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff).order_by('created_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+def idempotent_response(request, scope, handler):
+    """
+    Run handler() (returns a DRF Response) at most once per (user, scope, key).
+    Without the header the handler just runs. A reused key with a different
+    body gets 422; one whose first request is still running gets 409.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key:
+        return handler()
+    if len(key) > 255:
+        return Response(
+            {'error': f"{IDEMPOTENCY_HEADER} must be at most 255 characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    user = request.user if request.user.is_authenticated else None
+    fingerprint = request_fingerprint(request.data)
+    keys = IdempotencyKey.objects.filter(user=user, scope=scope, key=key)
+    keys.filter(created_at__lt=_expiry_cutoff()).delete()
+
+    record = keys.filter(response_status__isnull=False).first()
+    if record:
+        return _replay(record, fingerprint)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(user=user, scope=scope, key=key, fingerprint=fingerprint)
+        except IntegrityError:
+            record = keys.filter(response_status__isnull=False).first()
+            if record:
+                return _replay(record, fingerprint)
+            return Response(
+                {'error': f"A request with this {IDEMPOTENCY_HEADER} is still being processed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        response = handler()
+        if response.status_code >= 400:
+            transaction.set_rollback(True)
+            return response
+        record.response_status = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=['response_status', 'response_body'])
+    return response
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from common.constants import IDEMPOTENCY_KEY_TTL_HOURS
+from common.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = f'Delete Idempotency-Key records older than {IDEMPOTENCY_KEY_TTL_HOURS} hours (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Keys deleted per statement (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        count = purge_expired_keys(options['batch_size'])
+        if count:
+            self.stdout.write(self.style.SUCCESS(f"Purged {count} expired idempotency key(s)."))
+        else:
+            self.stdout.write("No expired idempotency keys.")
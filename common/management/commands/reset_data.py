@@ -10,7 +10,10 @@ from returns.models import ReturnProcessing, ReturnItem, ReturnRequest
 from orders.models import Payment, OrderItem, SalesOrder
 from crm.models import SampleDelivery, ContactLog, Lead
 from purchasing.models import PurchaseItem, PurchaseOrder
-from core.models import StockMovement, Batch, ProductPriceTier, ProductVariant, Product
+from core.models import (
+    StockCheckpoint, StockMovement, StockMovementArchive, StockReservation,
+    Batch, ProductPriceTier, ProductVariant, Product,
+)
 from accounting.models import Expense, ExpenseCategory
 from customers.models import Customer, Salesperson
 from common.models import AuditLog
@@ -45,7 +48,10 @@ class Command(BaseCommand):
             (Lead, 'Lead'),
             (PurchaseItem, 'PurchaseItem'),
             (PurchaseOrder, 'PurchaseOrder'),
+            (StockReservation, 'StockReservation'),
+            (StockCheckpoint, 'StockCheckpoint'),
             (StockMovement, 'StockMovement'),
+            (StockMovementArchive, 'StockMovementArchive'),
             (Batch, 'Batch'),
             (ProductPriceTier, 'ProductPriceTier'),
             (ProductVariant, 'ProductVariant'),
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_auditlogarchive_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=30)),
+                ('period', models.CharField(max_length=10)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Document sequence',
+                'verbose_name_plural': 'Document sequences',
+                'unique_together': {('doc_type', 'period')},
+            },
+        ),
+    ]
@@ -2,6 +2,7 @@
 Common models - Audit logging, Soft Delete functionality.
 """
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -148,3 +149,43 @@ class AuditLogArchive(models.Model):
 
     def __str__(self):
         return f"ARCHIVED: {self.action} - {self.model_name} #{self.object_id}"
+
+
+class DocumentSequence(models.Model):
+    """Last issued number per document type and period (see common.sequences)."""
+    doc_type = models.CharField(max_length=30)  # e.g. ORDER, PAYMENT, RETURN
+    period = models.CharField(max_length=10)  # e.g. 20250131 (daily) or 2025 (yearly)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'common'
+        verbose_name = _("Document sequence")
+        verbose_name_plural = _("Document sequences")
+        unique_together = ['doc_type', 'period']
+
+    def __str__(self):
+        return f"{self.doc_type} {self.period}: {self.last_value}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of an API write, replayed when a client retries with the same key (see common.idempotency)."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True,
+        related_name='idempotency_keys'
+    )
+    scope = models.CharField(max_length=50)  # e.g. orders.create
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of the request body
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        app_label = 'common'
+        verbose_name = _("Idempotency key")
+        verbose_name_plural = _("Idempotency keys")
+        unique_together = ['user', 'scope', 'key']
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
@@ -0,0 +1,107 @@
+"""
+Document number sequences - one counter row per (document type, period).
+
+Numbers are taken with a single UPDATE ... SET last_value = last_value + n
+(RETURNING on PostgreSQL), so concurrent writers only contend on one small row
+instead of scanning and locking the day's documents. Numbers are unique but not
+gap-free: a rolled back transaction or an unused preallocated block leaves gaps.
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from common.models import DocumentSequence
+
+_local = threading.local()
+
+
+def _increment(doc_type, period, count):
+    table = connection.ops.quote_name(DocumentSequence._meta.db_table)
+    sql = (
+        f'UPDATE {table} SET last_value = last_value + %s, updated_at = %s '
+        f'WHERE doc_type = %s AND period = %s'
+    )
+    returning = connection.vendor == 'postgresql'
+    if returning:
+        sql += ' RETURNING last_value'
+    params = [count, connection.ops.adapt_datetimefield_value(timezone.now()), doc_type, period]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if not cursor.rowcount:
+            return None
+        if returning:
+            return cursor.fetchone()[0]
+    # Other backends: the UPDATE above holds the row lock until commit
+    return DocumentSequence.objects.filter(doc_type=doc_type, period=period).values_list(
+        'last_value', flat=True
+    ).get()
+
+
+def reserve_numbers(doc_type, period, count=1, seed=None):
+    """
+    Reserve count consecutive numbers for (doc_type, period).
+    seed: callable returning the highest number already issued, used only when
+    the period's row is first created (documents numbered before sequences existed).
+    Returns: (first, last).
+    """
+    with transaction.atomic():
+        last = _increment(doc_type, period, count)
+        if last is None:
+            try:
+                with transaction.atomic():
+                    DocumentSequence.objects.create(
+                        doc_type=doc_type, period=period, last_value=seed() if seed else 0
+                    )
+            except IntegrityError:
+                pass  # created concurrently
+            last = _increment(doc_type, period, count)
+    return last - count + 1, last
+
+
+def _pending(block):
+    """
+    True while the transaction (or savepoint) that reserved block is still open.
+    A rollback drops its on_commit callback along with the reserving UPDATE, so
+    the block stops matching even when a later transaction reuses the same
+    Atomic object.
+    """
+    return any(func is block['on_commit'] for _sids, func, _robust in connection.run_on_commit)
+
+
+def next_number(doc_type, period, seed=None):
+    """
+    Next number for (doc_type, period). With DOCUMENT_SEQUENCE_BLOCK_SIZE > 1 each
+    worker thread reserves a block and hands numbers out locally. A block is reused
+    only once its reservation committed (or inside the transaction that reserved it),
+    so a rolled back reservation is never handed out again.
+    """
+    block_size = getattr(settings, 'DOCUMENT_SEQUENCE_BLOCK_SIZE', 1)
+    if block_size <= 1:
+        return reserve_numbers(doc_type, period, 1, seed)[0]
+
+    blocks = _local.__dict__.setdefault('blocks', {})
+    key = (doc_type, period)
+    block = blocks.get(key)
+    usable = block and block['next'] <= block['last'] and (block['committed'] or _pending(block))
+    if not usable:
+        first, last = reserve_numbers(doc_type, period, block_size, seed)
+        block = {'next': first, 'last': last, 'committed': False}
+        block['on_commit'] = lambda b=block: b.update(committed=True)
+        blocks[key] = block
+        transaction.on_commit(block['on_commit'])
+    number = block['next']
+    block['next'] += 1
+    return number
+
+
+def max_issued(queryset, field, prefix):
+    """Highest trailing sequence among values of field starting with prefix (seed helper)."""
+    highest = 0
+    for value in queryset.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True):
+        try:
+            highest = max(highest, int(value.split('-')[-1]))
+        except (ValueError, IndexError):
+            continue
+    return highest
@@ -61,3 +61,57 @@ class AuditLogTest(TestCase):
         
         self.assertIsNotNone(log)
         self.assertIn('deleted_at', log.changes['diff'])
+
+
+class DocumentSequenceTest(TestCase):
+    def test_seeded_then_incremented(self):
+        from common.sequences import next_number, reserve_numbers
+        self.assertEqual(next_number('ORDER', '20250101', seed=lambda: 7), 8)
+        self.assertEqual(next_number('ORDER', '20250101', seed=lambda: 99), 9)  # seed only on first use
+        self.assertEqual(reserve_numbers('ORDER', '20250101', count=5), (10, 14))
+        self.assertEqual(next_number('ORDER', '20250102'), 1)
+
+    def test_block_preallocation(self):
+        from django.test import override_settings
+        from common.models import DocumentSequence
+        from common.sequences import next_number
+        with override_settings(DOCUMENT_SEQUENCE_BLOCK_SIZE=10):
+            numbers = [next_number('PAYMENT', '20250101') for _ in range(12)]
+        self.assertEqual(numbers, list(range(1, 13)))
+        self.assertEqual(DocumentSequence.objects.get(doc_type='PAYMENT').last_value, 20)
+
+    def test_block_not_reused_after_rollback(self):
+        from django.db import transaction
+        from django.test import override_settings
+        from common.sequences import next_number, reserve_numbers
+        atomic = transaction.atomic()  # one Atomic object reused, like a decorator
+        with override_settings(DOCUMENT_SEQUENCE_BLOCK_SIZE=10):
+            try:
+                with atomic:
+                    self.assertEqual(next_number('RETURN', '20250101'), 1)
+                    raise ValueError('roll back')
+            except ValueError:
+                pass
+            with atomic:
+                number = next_number('RETURN', '20250101')
+        self.assertEqual(number, 1)  # the rolled back block was reserved again, not reused
+        self.assertGreater(reserve_numbers('RETURN', '20250101')[0], number)
+
+
+class IdempotencyKeyPurgeTest(TestCase):
+    def test_purge_deletes_only_expired_keys(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from common.constants import IDEMPOTENCY_KEY_TTL_HOURS
+        from common.models import IdempotencyKey
+        old = [IdempotencyKey.objects.create(scope='orders.create', key=f'old-{n}', fingerprint='x') for n in range(3)]
+        fresh = IdempotencyKey.objects.create(scope='orders.create', key='fresh', fingerprint='x')
+        IdempotencyKey.objects.filter(id__in=[key.id for key in old]).update(
+            created_at=timezone.now() - timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS + 1)
+        )
+        out = StringIO()
+        call_command('purge_idempotency_keys', '--batch-size=2', stdout=out)
+        self.assertIn('Purged 3', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('id', flat=True)), [fresh.id])
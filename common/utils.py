@@ -97,6 +97,23 @@ def get_countries_with_regions():
     ).order_by('name_en')
 
 
+def typeahead_page(queryset, page, page_size=None):
+    """
+    One page of a typeahead search. Fetches page_size + 1 rows instead of
+    counting, so deep tables cost the same as small ones.
+    Returns (rows, page, has_more).
+    """
+    from common.constants import PAGE_SIZE_TYPEAHEAD
+    page_size = page_size or PAGE_SIZE_TYPEAHEAD
+    try:
+        page = max(int(page), 1)
+    except (TypeError, ValueError):
+        page = 1
+    offset = (page - 1) * page_size
+    rows = list(queryset[offset:offset + page_size + 1])
+    return rows[:page_size], page, len(rows) > page_size
+
+
 def reset_model_sequences(models_list):
     """
     Reset database auto-increment counters for the given models.
@@ -0,0 +1,40 @@
+"""
+Common form widgets.
+"""
+from django import forms
+from django.urls import reverse
+
+
+class TypeaheadSelect(forms.Select):
+    """
+    Select for large model choices: renders only the empty and selected
+    options; static/js/typeahead.js searches the rest from url_name
+    (an endpoint returning {results: [{id, display_name}], has_more}).
+    """
+
+    def __init__(self, url_name, attrs=None, min_chars=2):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.min_chars = min_chars
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-typeahead-url'] = reverse(self.url_name)
+        context['widget']['attrs']['data-min-chars'] = self.min_chars
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = {str(v) for v in value if v not in (None, '')}
+        choices = []
+        field = getattr(self.choices, 'field', None)
+        if field is not None:
+            if field.empty_label is not None:
+                choices.append(('', field.empty_label))
+            if selected:
+                choices.extend(self.choices.choice(obj) for obj in self.choices.queryset.filter(pk__in=selected))
+        else:
+            choices = [(v, label) for v, label in self.choices if v in ('', None) or str(v) in selected]
+        return [
+            (None, [self.create_option(name, v, label, str(v) in selected, index, attrs=attrs)], index)
+            for index, (v, label) in enumerate(choices)
+        ]
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Product, ProductVariant, ProductPriceTier, Batch, StockMovement
+from common.concurrency import VersionedAdminMixin
+from .models import (
+    Product, ProductVariant, ProductPriceTier, Batch, StockMovement, StockMovementArchive, StockReservation,
+)
 
 
 class ProductPriceTierInline(admin.TabularInline):
@@ -8,8 +11,8 @@ class ProductPriceTierInline(admin.TabularInline):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'sku', 'category', 'stock_quantity', 'base_price', 'is_active']
+class ProductAdmin(VersionedAdminMixin, admin.ModelAdmin):
+    list_display = ['name', 'sku', 'category', 'stock_quantity', 'reserved_quantity', 'base_price', 'is_active']
     list_filter = ['is_active', 'category']
     search_fields = ['name', 'sku']
     inlines = [ProductPriceTierInline]
@@ -28,3 +31,15 @@ class BatchAdmin(admin.ModelAdmin):
 @admin.register(StockMovement)
 class StockMovementAdmin(admin.ModelAdmin):
     list_display = ['product', 'movement_type', 'quantity', 'reference_type', 'created_at']
+
+
+@admin.register(StockMovementArchive)
+class StockMovementArchiveAdmin(admin.ModelAdmin):
+    list_display = ['product', 'movement_type', 'quantity', 'reference_type', 'created_at', 'archived_at']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'quantity', 'status', 'reference_type', 'reference_id', 'expires_at', 'created_at']
+    list_filter = ['status', 'reference_type']
+    readonly_fields = ['product', 'quantity', 'status', 'reference_type', 'reference_id']
@@ -0,0 +1,65 @@
+"""
+Product catalog - compact JSON of active products for order forms.
+
+The serialized payload is kept in the cache per version. Product saves that
+touch catalog fields bump the version (see core.signals), so browsers can
+cache a versioned catalog URL. The version token expires after
+CACHE_VERSION_TIMEOUT, so a process a bump doesn't reach (per-process cache
+backend) still moves on within that bound. Queryset .update() on those
+fields bypasses signals: call invalidate_catalog() after it.
+Stock is not part of the catalog; it changes too often (see product_search).
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Product
+
+CATALOG_VERSION_KEY = 'core:catalog_version'
+CATALOG_FIELDS = ('name', 'sku', 'unit', 'base_price', 'is_active', 'deleted_at')
+CATALOG_COLUMNS = ['id', 'name', 'sku', 'unit', 'base_price']
+
+
+def invalidate_catalog():
+    """Bump the shared version now and again on commit (readers between the two reload committed data)."""
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+    transaction.on_commit(
+        lambda: cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+    )
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def get_catalog():
+    """
+    Returns (version, payload): payload is the JSON text
+    {"version", "columns", "products": [[id, name, sku, unit, base_price], ...]}.
+    """
+    version = catalog_version()
+    key = f'core:catalog:{version}'
+    payload = cache.get(key)
+    if payload is None:
+        rows = (
+            Product.objects.filter(is_active=True)
+            .order_by('name', 'id')
+            .values_list('id', 'name', 'sku', 'unit__name_en', 'base_price')
+        )
+        payload = json.dumps({
+            'version': version,
+            'columns': CATALOG_COLUMNS,
+            'products': [
+                [product_id, name, sku, unit or '', str(base_price)]
+                for product_id, name, sku, unit, base_price in rows
+            ],
+        }, ensure_ascii=False, separators=(',', ':'))
+        cache.set(key, payload, settings.CACHE_VERSION_TIMEOUT)
+    return version, payload
@@ -3,19 +3,20 @@ Core forms - Product with price tiers.
 """
 from django import forms
 from django.utils.translation import gettext_lazy as _, get_language
+from common.concurrency import VersionFormMixin
 from .models import Product, ProductPriceTier
 from master_data.models import CustomerType
 
 
-class ProductForm(forms.ModelForm):
-    """Product form with optional price tier fields per customer type."""
+class ProductForm(VersionFormMixin, forms.ModelForm):
+    """Product form with optional price tier fields per customer type (versioned edits)."""
 
     class Meta:
         model = Product
         fields = [
             'name', 'description', 'sku', 'category', 'unit',
             'base_price', 'cost_price',
-            'stock_quantity', 'low_stock_threshold', 'expiry_date',
+            'low_stock_threshold', 'expiry_date',
             'expiry_alert_days', 'is_active',
         ]
         widgets = {
@@ -28,6 +29,11 @@ class ProductForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['category'].empty_label = _('-- Select Category --')
         self.fields['unit'].empty_label = _('-- Select Unit --')
+        # Stock only changes through movements; new products may book an opening quantity
+        if not self.instance.pk:
+            self.fields['opening_stock'] = forms.IntegerField(
+                min_value=0, required=False, label=_('Opening Stock'),
+            )
         # Add price tier fields for each customer type
         lang = get_language()
         for ct in CustomerType.objects.filter(
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from core.services import refresh_expired_batch_summaries, sync_batch_summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill Product.next_expiry_date and active_batch_count from batches (run once after migrating; '
+        '--expired daily)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Products refreshed per query (default: 500)',
+        )
+        parser.add_argument(
+            '--expired',
+            action='store_true',
+            help='Only products whose next expiry date has passed (daily job)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['expired']:
+            count = refresh_expired_batch_summaries(batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Batch summary refreshed for {count} product(s) past expiry."))
+            return
+        product_ids = list(Product.all_objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(product_ids), batch_size):
+            sync_batch_summary(product_ids[start:start + batch_size])
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Refreshed {min(start + batch_size, len(product_ids))}/{len(product_ids)} products")
+        self.stdout.write(self.style.SUCCESS(f"Batch summary refreshed for {len(product_ids)} products."))
@@ -0,0 +1,58 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import StockMovement
+from core.services import compact_movements
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive StockMovement rows older than a cutoff into StockMovementArchive, '
+        'leaving one opening-balance ADJUST row per product. Movements of documents that '
+        'may still be cancelled or returned should stay live (batch give-back reads them).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=str, help='Archive movements created before YYYY-MM-DD')
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Archive movements older than this many days when --before is not given (default: 365)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Movements archived per transaction (default: 1000)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff_date = datetime.datetime.strptime(options['before'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--before must be YYYY-MM-DD')
+        else:
+            cutoff_date = timezone.localdate() - datetime.timedelta(days=options['days'])
+        cutoff = timezone.make_aware(datetime.datetime.combine(cutoff_date, datetime.time.min))
+
+        if options['dry_run']:
+            count = StockMovement.objects.filter(created_at__lt=cutoff).exclude(
+                reference_type=StockMovement.OPENING_BALANCE
+            ).count()
+            self.stdout.write(f"{count} movements before {cutoff_date} would be archived.")
+            return
+
+        total = 0
+        while True:
+            archived = compact_movements(cutoff, limit=max(options['chunk_size'], 1))
+            if not archived:
+                break
+            total += archived
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Archived {total} movements...")
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} movements before {cutoff_date}."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Expire stock reservations past their expires_at and give the stock back to available-to-promise'
+
+    def handle(self, *args, **options):
+        count = expire_reservations()
+        if count:
+            self.stdout.write(self.style.SUCCESS(f"Expired {count} reservation(s)."))
+        else:
+            self.stdout.write("No reservations to expire.")
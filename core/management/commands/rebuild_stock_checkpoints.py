@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from core.services import rebuild_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily StockCheckpoint balances from StockMovement history (run once after migrating)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Products rebuilt per transaction (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.all_objects.order_by('id').values_list('id', flat=True))
+        total = 0
+        for start in range(0, len(product_ids), batch_size):
+            total += rebuild_checkpoints(product_ids[start:start + batch_size])
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Rebuilt {min(start + batch_size, len(product_ids))}/{len(product_ids)} products")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total} checkpoints for {len(product_ids)} products."
+        ))
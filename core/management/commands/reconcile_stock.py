@@ -1,7 +1,98 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.db.models import Sum
-from core.models import Product, StockMovement
+from django.db import connection, connections, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Product
+
+
+def _calculated_stock(queryset):
+    """Annotate each product with Sum(StockMovement.quantity) via one LEFT JOIN ... GROUP BY product."""
+    return queryset.annotate(calculated=Coalesce(Sum('stock_movements__quantity'), Value(0)))
+
+
+def reconcile_range(start_id, end_id, fix=False):
+    """
+    Reconcile products with start_id <= id < end_id (soft-deleted included).
+    One grouped query finds the mismatches; with fix, those rows are locked
+    in id order, re-checked and repaired with a single bulk_update.
+    Returns: dict with products checked, mismatches and timing for the chunk.
+    """
+    started = time.monotonic()
+    products = Product.all_objects.filter(id__gte=start_id, id__lt=end_id)
+    checked = products.count()
+    mismatches = list(
+        _calculated_stock(products)
+        .exclude(calculated=F('stock_quantity'))
+        .order_by('id')
+        .values('id', 'name', 'stock_quantity', 'calculated')
+    )
+    fixed_ids = set()
+    if fix and mismatches:
+        with transaction.atomic():
+            # Lock, then recompute under the lock so concurrent stock
+            # movements between the scan and the write are not lost.
+            ids = [m['id'] for m in mismatches]
+            locked = {
+                p.id: p for p in Product.all_objects.select_for_update().filter(id__in=ids).order_by('id')
+            }
+            calculated = dict(
+                _calculated_stock(Product.all_objects.filter(id__in=ids)).values_list('id', 'calculated')
+            )
+            to_update = []
+            for product_id, product in locked.items():
+                new_stock = calculated.get(product_id, 0)
+                if new_stock < 0 or new_stock == product.stock_quantity:
+                    continue
+                product.stock_quantity = new_stock
+                to_update.append(product)
+            Product.all_objects.bulk_update(to_update, ['stock_quantity'])
+            fixed_ids = {p.id for p in to_update}
+    return {
+        'start_id': start_id,
+        'end_id': end_id,
+        'products': checked,
+        'seconds': round(time.monotonic() - started, 3),
+        'mismatches': [
+            {
+                'product_id': m['id'],
+                'name': m['name'],
+                'current': m['stock_quantity'],
+                'calculated': m['calculated'],
+                'fixed': m['id'] in fixed_ids,
+            }
+            for m in mismatches
+        ],
+    }
+
+
+def _init_worker():
+    """Worker processes must open their own DB connections (and set up Django on spawn platforms)."""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _reconcile_chunk(args):
+    return reconcile_range(*args)
+
+
+def _id_chunks(batch_size):
+    """Split the product id range into [start, end) chunks of batch_size products."""
+    ids = list(Product.all_objects.order_by('id').values_list('id', flat=True))
+    chunks = []
+    for i in range(0, len(ids), batch_size):
+        end = ids[i + batch_size] if i + batch_size < len(ids) else ids[-1] + 1
+        chunks.append((ids[i], end))
+    return chunks
+
 
 class Command(BaseCommand):
     help = 'Reconcile Product.stock_quantity based on StockMovement history (Rule 1: Stock is derived from movements)'
@@ -12,42 +103,87 @@ class Command(BaseCommand):
             action='store_true',
             help='Actually update the product stock quantity to match movements',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Products per chunk (one aggregate query per chunk, default: 5000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Reconcile chunks in this many parallel processes (default: 1)',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write a JSON report of mismatches and timings to this path ("-" for stdout)',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write("Starting stock reconciliation...")
-        
-        products = Product.all_objects.all().iterator() # Include soft-deleted products just in case
-        mismatch_count = 0
-        
-        for product in products:
-            # Calculate expected stock from movements
-            # IN, RETURN, ADJUST (positive quantity in DB?)
-            # Wait, looking at core/models.py:
-            # quantity = models.IntegerField() # Positive for IN/RETURN, negative for OUT
-            # So we just Sum('quantity')
-            
-            aggregated = StockMovement.objects.filter(product=product).aggregate(total=Sum('quantity'))
-            calculated_stock = aggregated['total'] or 0
-            
-            current_stock = product.stock_quantity
-            
-            if current_stock != calculated_stock:
-                mismatch_count += 1
-                msg = f"MISMATCH: {product.name} (ID: {product.id}) | Current: {current_stock} | Calculated: {calculated_stock}"
-                self.stdout.write(self.style.WARNING(msg))
-                
-                if options['fix']:
-                    with transaction.atomic():
-                        product.stock_quantity = calculated_stock
-                        product.save(update_fields=['stock_quantity'])
-                    self.stdout.write(self.style.SUCCESS(f"  -> FIXED: Updated to {calculated_stock}"))
-            else:
-                if options['verbosity'] > 1:
-                    self.stdout.write(f"OK: {product.name} ({current_stock})")
+        started_at = timezone.now()
+        started = time.monotonic()
 
-        if mismatch_count == 0:
+        chunks = [(start, end, options['fix']) for start, end in _id_chunks(max(options['batch_size'], 1))]
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite allows a single writer; parallel chunks would only contend for the lock
+            self.stdout.write(self.style.WARNING("SQLite backend: ignoring --workers, running chunks serially."))
+            workers = 1
+        if workers > 1 and len(chunks) > 1:
+            # Children must not share the parent's DB connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                results = list(pool.map(_reconcile_chunk, chunks))
+        else:
+            results = [_reconcile_chunk(chunk) for chunk in chunks]
+
+        mismatches = [m for result in results for m in result['mismatches']]
+        for m in mismatches:
+            msg = (
+                f"MISMATCH: {m['name']} (ID: {m['product_id']}) | "
+                f"Current: {m['current']} | Calculated: {m['calculated']}"
+            )
+            self.stdout.write(self.style.WARNING(msg))
+            if m['fixed']:
+                self.stdout.write(self.style.SUCCESS(f"  -> FIXED: Updated to {m['calculated']}"))
+            elif options['fix'] and m['calculated'] < 0:
+                self.stdout.write(self.style.ERROR("  -> NOT FIXED: movements sum below zero, check the ledger"))
+
+        products_checked = sum(result['products'] for result in results)
+        if options['verbosity'] > 1:
+            for result in results:
+                self.stdout.write(
+                    f"Chunk {result['start_id']}-{result['end_id'] - 1}: "
+                    f"{result['products']} products, {len(result['mismatches'])} mismatches, {result['seconds']}s"
+                )
+
+        if not mismatches:
             self.stdout.write(self.style.SUCCESS("All products are in sync!"))
         else:
-            self.stdout.write(self.style.WARNING(f"Found {mismatch_count} products with stock mismatches."))
+            self.stdout.write(self.style.WARNING(f"Found {len(mismatches)} products with stock mismatches."))
             if not options['fix']:
                 self.stdout.write("Run with --fix to update product stock quantities.")
+
+        if options['report']:
+            report = {
+                'started_at': started_at.isoformat(),
+                'duration_seconds': round(time.monotonic() - started, 3),
+                'fix': options['fix'],
+                'workers': workers,
+                'products_checked': products_checked,
+                'mismatch_count': len(mismatches),
+                'fixed_count': sum(1 for m in mismatches if m['fixed']),
+                'chunks': [
+                    {**result, 'mismatches': len(result['mismatches'])} for result in results
+                ],
+                'mismatches': mismatches,
+            }
+            payload = json.dumps(report, indent=2)
+            if options['report'] == '-':
+                self.stdout.write(payload)
+            else:
+                with open(options['report'], 'w', encoding='utf-8') as fh:
+                    fh.write(payload)
+                self.stdout.write(f"Report written to {options['report']}")
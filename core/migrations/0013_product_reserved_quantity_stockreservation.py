@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0012_alter_product_base_price_alter_product_category_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved_quantity',
+            field=models.PositiveIntegerField(default=0, help_text='Held by active reservations (maintained by core.services)', verbose_name='Reserved Quantity'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('RELEASED', 'Released'), ('CONVERTED', 'Converted'), ('EXPIRED', 'Expired')], default='ACTIVE', max_length=20)),
+                ('reference_type', models.CharField(max_length=50)),
+                ('reference_id', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='reservations', to='core.product')),
+            ],
+            options={
+                'verbose_name': 'Stock reservation',
+                'verbose_name_plural': 'Stock reservations',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['reference_type', 'reference_id', 'status'], name='core_stockr_referen_523bc1_idx'), models.Index(fields=['status', 'expires_at'], name='core_stockr_status_1d8a8b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_product_reserved_quantity_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['product', 'expiry_date'], name='core_batch_product_fe7459_idx'),
+        ),
+    ]
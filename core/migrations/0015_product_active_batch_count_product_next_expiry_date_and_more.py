@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_batch_core_batch_product_fe7459_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='active_batch_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Batches with stock (maintained by core.services)', verbose_name='Active Batches'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='next_expiry_date',
+            field=models.DateField(blank=True, editable=False, help_text='Earliest expiry among batches in stock, else Expiry Date (maintained by core.services)', null=True, verbose_name='Next Expiry Date'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['next_expiry_date'], name='core_produc_next_ex_25b22c_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_product_active_batch_count_product_next_expiry_date_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('balance', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='core.product')),
+            ],
+            options={
+                'verbose_name': 'Stock checkpoint',
+                'verbose_name_plural': 'Stock checkpoints',
+                'ordering': ['-date', 'product'],
+                'unique_together': {('product', 'date')},
+            },
+        ),
+    ]
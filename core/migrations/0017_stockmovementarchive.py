@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0016_stockcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovementArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_id', models.BigIntegerField(unique=True)),
+                ('movement_type', models.CharField(choices=[('IN', 'Stock In'), ('OUT', 'Stock Out'), ('ADJUST', 'Adjustment'), ('RETURN', 'Return')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('reference_type', models.CharField(blank=True, max_length=50)),
+                ('reference_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_movements', to='core.batch')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_stock_movements', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_movements', to='core.product')),
+            ],
+            options={
+                'verbose_name': 'Archived stock movement',
+                'verbose_name_plural': 'Archived stock movements',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', 'created_at'], name='core_stockm_product_58fb5a_idx'), models.Index(fields=['reference_type', 'reference_id'], name='core_stockm_referen_cf0168_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_stockmovementarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_product_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='reserved_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Held by active reservations (maintained by core.services)', verbose_name='Reserved Quantity'),
+        ),
+    ]
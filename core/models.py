@@ -29,8 +29,23 @@ class Product(SoftDeleteMixin):
         help_text='For margin calculation', verbose_name=_("Cost Price")
     )
     stock_quantity = models.PositiveIntegerField(default=0, verbose_name=_("Stock Quantity"))
+    reserved_quantity = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text=_('Held by active reservations (maintained by core.services)'),
+        verbose_name=_("Reserved Quantity")
+    )
     low_stock_threshold = models.PositiveIntegerField(default=10, verbose_name=_("Low Stock Threshold"))
     expiry_date = models.DateField(null=True, blank=True, verbose_name=_("Expiry Date"))
+    next_expiry_date = models.DateField(
+        null=True, blank=True, editable=False,
+        help_text=_('Earliest expiry among batches in stock, else Expiry Date (maintained by core.services)'),
+        verbose_name=_("Next Expiry Date")
+    )
+    active_batch_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text=_('Batches with stock (maintained by core.services)'),
+        verbose_name=_("Active Batches")
+    )
     expiry_alert_days = models.PositiveIntegerField(
         default=LIMIT_EXPIRY_DAYS,
         help_text=_('Days before expiry to trigger alert'),
@@ -39,6 +54,11 @@ class Product(SoftDeleteMixin):
     is_active = models.BooleanField(default=True, verbose_name=_("Is active"))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created at"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
+    # Bumped by every edit; edits compare-and-swap it (common.concurrency)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    # Kept by core.services UPDATEs that don't bump version; edits never write them
+    SERVICE_FIELDS = ('stock_quantity', 'reserved_quantity', 'next_expiry_date', 'active_batch_count')
 
     class Meta:
         verbose_name = _("Product")
@@ -50,6 +70,7 @@ class Product(SoftDeleteMixin):
             models.Index(fields=['deleted_at']),
             models.Index(fields=['name']),
             models.Index(fields=['sku']),
+            models.Index(fields=['next_expiry_date']),
         ]
         constraints = [
             models.CheckConstraint(check=models.Q(base_price__gte=0), name='product_base_price_gte_0'),
@@ -69,12 +90,33 @@ class Product(SoftDeleteMixin):
         """Alias for stock_quantity for compatibility."""
         return self.stock_quantity
 
+    @property
+    def available_quantity(self):
+        """Available-to-promise: physical stock minus active reservations."""
+        return self.stock_quantity - self.reserved_quantity
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded base_price so price cache invalidation can skip unchanged saves."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_base_price = dict(zip(field_names, values)).get('base_price')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Without batches in stock, next_expiry_date follows the product's own expiry_date."""
+        if not self.active_batch_count:
+            self.next_expiry_date = self.expiry_date
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'expiry_date' in update_fields:
+                kwargs['update_fields'] = list(update_fields) + ['next_expiry_date']
+        super().save(*args, **kwargs)
+
     def get_price_for_customer_type(self, customer_type):
-        """Get price from ProductPriceTier or base price for given customer type."""
-        tier = ProductPriceTier.objects.filter(
-            product=self, customer_type=customer_type
-        ).first()
-        return tier.price if tier else self.base_price
+        """Get price from ProductPriceTier or base price for given customer type (cached matrix)."""
+        from core.pricing import resolve_prices
+        if self.pk is None:
+            return self.base_price
+        return resolve_prices([self.pk], customer_type).get(self.pk, self.base_price)
 
 
 class ProductVariant(SoftDeleteMixin):
@@ -140,23 +182,31 @@ class Batch(SoftDeleteMixin):
         indexes = [
             models.Index(fields=['batch_number']),
             models.Index(fields=['expiry_date']),
+            models.Index(fields=['product', 'expiry_date']),
             models.Index(fields=['deleted_at']),
         ]
 
     def __str__(self):
         return f"{self.product} - {self.batch_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded quantity so save() can post the delta without re-fetching."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_quantity = dict(zip(field_names, values)).get('quantity')
+        return instance
+
     def save(self, *args, **kwargs):
         """Save batch. Stock updates go through core.services (don't update stock directly)."""
         from django.db import transaction
-        from django.utils import timezone
-        from core.services import add_stock_from_batch, adjust_stock_from_batch
+        from core.services import add_stock_from_batch, adjust_stock_from_batch, sync_batch_summary
 
         creating = self.pk is None
         old_quantity = None
         if not creating:
-            old = type(self).objects.get(pk=self.pk)
-            old_quantity = old.quantity
+            old_quantity = getattr(self, '_loaded_quantity', None)
+            if old_quantity is None:
+                old_quantity = type(self).all_objects.filter(pk=self.pk).values_list('quantity', flat=True).first()
 
         with transaction.atomic():
             super().save(*args, **kwargs)
@@ -175,19 +225,9 @@ class Batch(SoftDeleteMixin):
                     batch_id=self.id,
                     reference_id=self.id,
                 )
-            
-            # Sync product expiry date to the earliest batch expiry with stock
-            today = timezone.now().date()
-            earliest_batch = Batch.objects.filter(
-                product=self.product,
-                quantity__gt=0,
-                expiry_date__isnull=False,
-                expiry_date__gte=today
-            ).order_by('expiry_date').first()
-            
-            if earliest_batch:
-                self.product.expiry_date = earliest_batch.expiry_date
-                self.product.save(update_fields=['expiry_date'])
+            # Keep Product.next_expiry_date / active_batch_count current
+            sync_batch_summary([self.product_id])
+        self._loaded_quantity = self.quantity
 
 class StockMovement(models.Model):
     """All inventory changes with audit trail."""
@@ -197,6 +237,8 @@ class StockMovement(models.Model):
         ('ADJUST', 'Adjustment'),
         ('RETURN', 'Return'),
     ]
+    # reference_type of the ADJUST row standing in for archived movements
+    OPENING_BALANCE = 'OpeningBalance'
     product = models.ForeignKey(
         Product, on_delete=models.PROTECT, related_name='stock_movements'
     )
@@ -226,4 +268,105 @@ class StockMovement(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.product} - {self.movement_type} - {self.quantity}"
\ No newline at end of file
+        return f"{self.product} - {self.movement_type} - {self.quantity}"
+
+
+class StockMovementArchive(models.Model):
+    """
+    Cold copy of StockMovement rows moved out of the live ledger by
+    compact_stock_movements. Live ledger keeps one opening-balance row per product instead.
+    """
+    movement_id = models.BigIntegerField(unique=True)  # id in StockMovement
+    product = models.ForeignKey(
+        Product, on_delete=models.PROTECT, related_name='archived_movements'
+    )
+    batch = models.ForeignKey(
+        Batch, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_movements'
+    )
+    movement_type = models.CharField(max_length=20, choices=StockMovement.MOVEMENT_TYPES)
+    quantity = models.IntegerField()
+    reference_type = models.CharField(max_length=50, blank=True)
+    reference_id = models.PositiveIntegerField(null=True, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_stock_movements'
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Archived stock movement")
+        verbose_name_plural = _("Archived stock movements")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+            models.Index(fields=['reference_type', 'reference_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.product} - {self.movement_type} - {self.quantity} (archived)"
+
+
+class StockReservation(models.Model):
+    """Stock held for a document (e.g. pre-order) without a physical movement."""
+    STATUS_ACTIVE = 'ACTIVE'
+    STATUS_RELEASED = 'RELEASED'
+    STATUS_CONVERTED = 'CONVERTED'
+    STATUS_EXPIRED = 'EXPIRED'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_RELEASED, 'Released'),
+        (STATUS_CONVERTED, 'Converted'),
+        (STATUS_EXPIRED, 'Expired'),
+    ]
+    product = models.ForeignKey(
+        Product, on_delete=models.PROTECT, related_name='reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    reference_type = models.CharField(max_length=50)  # e.g. SalesOrder
+    reference_id = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='stock_reservations'
+    )
+
+    class Meta:
+        verbose_name = _("Stock reservation")
+        verbose_name_plural = _("Stock reservations")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['reference_type', 'reference_id', 'status']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product} - {self.status} - {self.quantity}"
+
+
+class StockCheckpoint(models.Model):
+    """
+    Running stock balance per product at the end of a day, i.e. the sum of
+    all its StockMovement quantities up to that day. Rows exist only for days
+    with movements; maintained by core.services.
+    """
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='stock_checkpoints'
+    )
+    date = models.DateField()
+    balance = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Stock checkpoint")
+        verbose_name_plural = _("Stock checkpoints")
+        ordering = ['-date', 'product']
+        unique_together = ['product', 'date']
+
+    def __str__(self):
+        return f"{self.product} @ {self.date}: {self.balance}"
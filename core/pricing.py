@@ -0,0 +1,84 @@
+"""
+Price resolver - customer-type price matrix cached per process.
+
+Each process keeps {product_id: base_price} and {(product_id, customer_type_id): price}
+in memory. A version token in the cache tells processes when to reload;
+Product.base_price and ProductPriceTier writes bump it (see core.signals).
+Processes only share bumps through a shared cache backend (CACHE_URL); the
+token expires after CACHE_VERSION_TIMEOUT, which bounds staleness either way.
+Queryset .update() on prices bypasses signals: call invalidate_prices() after it.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Product, ProductPriceTier
+
+PRICE_VERSION_KEY = 'core:price_matrix_version'
+
+_lock = threading.Lock()
+_matrix = {'version': None, 'base': {}, 'tiers': {}}
+
+
+def invalidate_prices():
+    """Bump the shared version now and again on commit (readers between the two reload committed data)."""
+    cache.set(PRICE_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+    transaction.on_commit(
+        lambda: cache.set(PRICE_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+    )
+
+
+def _current_version():
+    version = cache.get(PRICE_VERSION_KEY)
+    if version is None:
+        cache.add(PRICE_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(PRICE_VERSION_KEY)
+    return version
+
+
+def _load_matrix():
+    """Return the process matrix, reloading it (two queries) when the shared version moved."""
+    version = _current_version()
+    if _matrix['version'] != version:
+        with _lock:
+            if _matrix['version'] != version:
+                base = dict(Product.all_objects.order_by().values_list('id', 'base_price'))
+                tiers = {
+                    (product_id, customer_type_id): price
+                    for product_id, customer_type_id, price in ProductPriceTier.objects.order_by().values_list(
+                        'product_id', 'customer_type_id', 'price'
+                    )
+                }
+                _matrix.update(version=version, base=base, tiers=tiers)
+    return _matrix
+
+
+def resolve_prices(product_ids, customer_type):
+    """
+    Unit price per product for a customer type (tier price, else base price).
+    customer_type: CustomerType, its id, or None for base prices.
+    No queries while the matrix is current; ids unknown to it are read directly.
+    Returns: {product_id: Decimal}; unknown products are left out.
+    """
+    customer_type_id = getattr(customer_type, 'pk', customer_type)
+    matrix = _load_matrix()
+    base, tiers = matrix['base'], matrix['tiers']
+    prices = {}
+    missing = []
+    for product_id in product_ids:
+        if product_id in base:
+            prices[product_id] = tiers.get((product_id, customer_type_id), base[product_id])
+        else:
+            missing.append(product_id)
+    if missing:
+        prices.update(Product.all_objects.filter(id__in=missing).values_list('id', 'base_price'))
+        if customer_type_id is not None:
+            prices.update(
+                ProductPriceTier.objects.filter(
+                    product_id__in=missing, customer_type_id=customer_type_id
+                ).values_list('product_id', 'price')
+            )
+    return prices
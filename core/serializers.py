@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.concurrency import VersionedSerializerMixin
 from core.models import Product, ProductCategory, ProductVariant, ProductPriceTier, Batch, StockMovement
 from master_data.models import UnitOfMeasure, CustomerType
 from master_data.serializers import CustomerTypeSerializer
@@ -13,18 +14,20 @@ class UnitOfMeasureSimpleSerializer(serializers.ModelSerializer):
         model = UnitOfMeasure
         fields = ['id', 'code', 'name_en', 'name_my']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(VersionedSerializerMixin, serializers.ModelSerializer):
     category_detail = ProductCategorySerializer(source='category', read_only=True)
     unit_detail = UnitOfMeasureSimpleSerializer(source='unit', read_only=True)
     is_low_stock = serializers.BooleanField(read_only=True)
+    available_quantity = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'sku', 'category', 'category_detail', 'unit', 'unit_detail',
-            'base_price', 'stock_quantity', 'is_low_stock',
-            'expiry_date', 'is_active', 'created_at', 'updated_at'
+            'base_price', 'stock_quantity', 'reserved_quantity', 'available_quantity', 'is_low_stock',
+            'expiry_date', 'next_expiry_date', 'active_batch_count', 'is_active', 'created_at', 'updated_at'
         ]
+        read_only_fields = ['reserved_quantity']
 
 class ProductVariantSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
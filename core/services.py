@@ -1,96 +1,789 @@
 """
 Stock services - deduct, restore, adjust.
 """
+import datetime
+from collections import defaultdict
+
 from django.db import transaction
-from django.db.models import F
+from django.db.models import (
+    Case, Count, DateField, F, Min, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from common.audit import log_stock_movements
+from core.models import (
+    Batch, Product, StockCheckpoint, StockMovement, StockMovementArchive, StockReservation,
+)
+
+
+def checkpoint_balances(product_ids, date):
+    """
+    Stock at the end of date from the nearest StockCheckpoint on or before it
+    (one indexed lookup per product). Returns: {product_id: balance}.
+    """
+    latest = StockCheckpoint.objects.filter(
+        product=OuterRef('pk'), date__lte=date
+    ).order_by('-date').values('balance')[:1]
+    rows = Product.all_objects.filter(id__in=product_ids).annotate(
+        balance=Subquery(latest)
+    ).values_list('id', 'balance')
+    return {product_id: balance or 0 for product_id, balance in rows}
 
-from core.models import Batch, Product, StockMovement
 
+def post_checkpoints(movements):
+    """
+    Add movement quantities to each product's checkpoint for the movement's
+    day, opening the day's row from the previous checkpoint when missing.
+    Callers hold the product row locks, so per-product updates don't race.
+    """
+    by_day = defaultdict(lambda: defaultdict(int))
+    for movement in movements:
+        by_day[timezone.localdate(movement.created_at)][movement.product_id] += movement.quantity
+    for day, deltas in by_day.items():
+        existing = set(
+            StockCheckpoint.objects.filter(date=day, product_id__in=deltas).values_list('product_id', flat=True)
+        )
+        if existing:
+            StockCheckpoint.objects.filter(date=day, product_id__in=existing).update(
+                balance=Case(
+                    *[When(product_id=pid, then=F('balance') + Value(deltas[pid])) for pid in existing],
+                    default=F('balance'),
+                )
+            )
+        missing = [pid for pid in deltas if pid not in existing]
+        if missing:
+            opening = checkpoint_balances(missing, day - datetime.timedelta(days=1))
+            StockCheckpoint.objects.bulk_create([
+                StockCheckpoint(product_id=pid, date=day, balance=opening.get(pid, 0) + deltas[pid])
+                for pid in missing
+            ])
 
-def deduct_stock(product_id, quantity, reference_type, reference_id, batch_id=None, user=None):
-    """Create OUT movement, update Product.stock_quantity."""
+
+def rebuild_checkpoints(product_ids):
+    """
+    Recompute StockCheckpoint rows for products from their full movement
+    history, live and archived. Locks the products while rewriting.
+    """
     with transaction.atomic():
-        product = Product.objects.select_for_update().get(id=product_id)
-        if product.stock_quantity < quantity:
-            raise ValueError(f"Insufficient stock for {product.name}. Available: {product.stock_quantity}")
-        product.stock_quantity -= quantity
-        product.save()
-        if batch_id:
-            batch = Batch.objects.select_for_update().get(id=batch_id)
-            if batch.quantity < quantity:
-                raise ValueError(f"Insufficient batch stock for {product.name} ({batch.batch_number}). Available: {batch.quantity}")
-            batch.quantity -= quantity
-            batch.save()
-        StockMovement.objects.create(
-            product=product,
-            batch_id=batch_id,
-            movement_type='OUT',
-            quantity=-quantity,
-            reference_type=reference_type,
-            reference_id=reference_id,
-            created_by=user,
+        product_ids = list(
+            Product.all_objects.select_for_update().filter(id__in=product_ids).order_by('id').values_list('id', flat=True)
         )
-    return product
+        totals = _ledger_totals(['product_id', 'day'], product_id__in=product_ids)
+        checkpoints = []
+        running = defaultdict(int)
+        for (product_id, day), total in sorted(totals.items()):
+            running[product_id] += total
+            checkpoints.append(StockCheckpoint(product_id=product_id, date=day, balance=running[product_id]))
+        StockCheckpoint.objects.filter(product_id__in=product_ids).delete()
+        StockCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+    return len(checkpoints)
 
 
-def restore_stock(product_id, quantity, reference_type, reference_id, batch_id=None, user=None):
-    """Create RETURN movement, update Product.stock_quantity."""
+def _unbooked_stock(product_ids):
+    """
+    Stock that no movement accounts for (seed data, quantities set before the
+    ledger existed): current stock_quantity minus the latest checkpoint.
+    Returns: {product_id: quantity}.
+    """
+    latest = StockCheckpoint.objects.filter(product=OuterRef('pk')).order_by('-date').values('balance')[:1]
+    rows = Product.all_objects.filter(id__in=product_ids).annotate(
+        balance=Subquery(latest)
+    ).values_list('id', 'stock_quantity', 'balance')
+    return {product_id: stock - (balance or 0) for product_id, stock, balance in rows}
+
+
+def stock_as_of(product_ids, when):
+    """
+    Stock per product at a point in time: current stock minus the movements
+    booked after it, so stock that never went through a movement is carried
+    back unchanged instead of reading as zero.
+    when: a date (end of that day) or a datetime. For a datetime only the
+    movements of that one day are summed on top of the previous checkpoint,
+    so the cost does not grow with ledger history.
+    Returns: {product_id: quantity}.
+    """
+    product_ids = list(product_ids)
+    unbooked = _unbooked_stock(product_ids)
+    if not isinstance(when, datetime.datetime):
+        balances = checkpoint_balances(product_ids, when)
+    else:
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        day = timezone.localdate(when)
+        balances = checkpoint_balances(product_ids, day - datetime.timedelta(days=1))
+        day_start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        totals = _ledger_totals(
+            ['product_id'], product_id__in=product_ids, created_at__gte=day_start, created_at__lte=when
+        )
+        for (product_id,), total in totals.items():
+            balances[product_id] += total
+    return {product_id: balance + unbooked.get(product_id, 0) for product_id, balance in balances.items()}
+
+
+def _ledger_totals(group_by, **filters):
+    """
+    Sum movement quantities over the live ledger plus its archive.
+    Opening-balance rows are skipped: they only stand in for archived rows.
+    Returns: {tuple of group_by values: total}.
+    """
+    totals = defaultdict(int)
+    for model in (StockMovement, StockMovementArchive):
+        rows = model.objects.filter(**filters).exclude(
+            reference_type=StockMovement.OPENING_BALANCE
+        ).annotate(day=TruncDate('created_at')).values(*group_by).annotate(total=Sum('quantity')).order_by()
+        for row in rows:
+            totals[tuple(row[key] for key in group_by)] += row['total']
+    return totals
+
+
+def compact_movements(cutoff, limit=1000):
+    """
+    Move up to limit StockMovement rows created before cutoff into
+    StockMovementArchive, folding their quantities into one opening-balance
+    ADJUST row per product dated just before cutoff. Sum(quantity) per
+    product is unchanged, so reconcile_stock and checkpoints still agree.
+    One short transaction per call; no product or table locks.
+    Returns: number of movements archived.
+    """
+    opening_at = cutoff - datetime.timedelta(microseconds=1)
     with transaction.atomic():
-        product = Product.objects.select_for_update().get(id=product_id)
-        product.stock_quantity += quantity
-        product.save()
-        if batch_id:
-            batch = Batch.objects.select_for_update().get(id=batch_id)
-            batch.quantity += quantity
-            batch.save()
-        StockMovement.objects.create(
-            product=product,
-            batch_id=batch_id,
-            movement_type='RETURN',
-            quantity=quantity,
+        chunk = list(
+            StockMovement.objects.filter(created_at__lt=cutoff)
+            .exclude(reference_type=StockMovement.OPENING_BALANCE, created_at=opening_at)
+            .order_by('id')[:limit]
+        )
+        if not chunk:
+            return 0
+        StockMovementArchive.objects.bulk_create([
+            StockMovementArchive(
+                movement_id=m.id,
+                product_id=m.product_id,
+                batch_id=m.batch_id,
+                movement_type=m.movement_type,
+                quantity=m.quantity,
+                reference_type=m.reference_type,
+                reference_id=m.reference_id,
+                notes=m.notes,
+                created_at=m.created_at,
+                created_by_id=m.created_by_id,
+            )
+            for m in chunk
+        ])
+        deltas = defaultdict(int)
+        for m in chunk:
+            deltas[m.product_id] += m.quantity
+        StockMovement.objects.filter(id__in=[m.id for m in chunk]).delete()
+
+        openings = StockMovement.objects.filter(
+            reference_type=StockMovement.OPENING_BALANCE, created_at=opening_at, product_id__in=deltas
+        )
+        existing = set(openings.values_list('product_id', flat=True))
+        if existing:
+            openings.update(quantity=Case(
+                *[When(product_id=pid, then=F('quantity') + Value(deltas[pid])) for pid in existing],
+                default=F('quantity'),
+            ))
+        created = StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=pid,
+                movement_type='ADJUST',
+                quantity=delta,
+                reference_type=StockMovement.OPENING_BALANCE,
+                notes=f"Opening balance: movements before {cutoff:%Y-%m-%d} archived",
+            )
+            for pid, delta in deltas.items() if pid not in existing
+        ])
+        if created:
+            # created_at is auto_now_add; backdate so the row precedes the kept history
+            StockMovement.objects.filter(id__in=[m.id for m in created]).update(created_at=opening_at)
+    return len(chunk)
+
+
+def deduct_stock(product_id, quantity, reference_type, reference_id, user=None):
+    """Single-product deduct_stock_many (reservation-aware, FEFO batches). Returns: list of StockMovement."""
+    return deduct_stock_many([(product_id, quantity)], reference_type, reference_id, user=user)
+
+
+def restore_stock(product_id, quantity, reference_type, reference_id, user=None):
+    """Single-product restore_stock_many (back to the batches taken from). Returns: list of StockMovement."""
+    return restore_stock_many([(product_id, quantity)], reference_type, reference_id, user=user)
+
+
+def _merge_stock_lines(lines):
+    """
+    Collapse (product_id, quantity) pairs into {product_id: total_quantity}.
+    Zero totals are dropped; negative quantities are rejected.
+    """
+    merged = {}
+    for product_id, quantity in lines:
+        if quantity < 0:
+            raise ValueError(f"Quantity must not be negative (product {product_id}: {quantity})")
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return {pid: qty for pid, qty in merged.items() if qty}
+
+
+def _lock_products(product_ids):
+    """
+    Lock Product rows in one SELECT ... FOR UPDATE ORDER BY id.
+    Locking in id order means concurrent callers always queue on the same
+    row first and can never deadlock each other. Soft-deleted products are
+    included: stock still has to come back from old orders and returns.
+    """
+    products = {
+        p.id: p for p in Product.all_objects.select_for_update().filter(id__in=product_ids).order_by('id')
+    }
+    missing = set(product_ids) - set(products)
+    if missing:
+        raise Product.DoesNotExist(f"Product(s) not found: {sorted(missing)}")
+    return products
+
+
+def _apply_stock_deltas(products, deltas, field='stock_quantity'):
+    """Write new stock_quantity (or reserved_quantity) for every locked product in a single UPDATE."""
+    for product_id, delta in deltas.items():
+        setattr(products[product_id], field, max(0, getattr(products[product_id], field) + delta))
+    Product.all_objects.filter(id__in=list(deltas)).update(**{
+        field: Case(
+            *[When(id=pid, then=Value(getattr(products[pid], field))) for pid in deltas],
+            default=F(field),
+            output_field=PositiveIntegerField(),
+        ),
+        'updated_at': timezone.now(),
+    })
+
+
+def _check_quantities(products, merged, respect_reservations):
+    """Raise ValueError for the first product (in id order) that cannot cover its quantity."""
+    for product_id in sorted(merged):
+        product = products[product_id]
+        available = product.available_quantity if respect_reservations else product.stock_quantity
+        if available < merged[product_id]:
+            raise ValueError(f"Insufficient stock for {product.name}. Available: {max(available, 0)}")
+
+
+def sync_batch_summary(product_ids):
+    """
+    Refresh Product.next_expiry_date and active_batch_count for the given
+    products: one grouped query over their batches in stock plus one UPDATE.
+    Called by the batch/stock services whenever batch quantities change, so
+    list and dashboard views read plain columns. Expired batches don't count
+    for next_expiry_date; refresh_expired_batch_summaries moves it on once a
+    batch passes its date. Products without unexpired batches in stock fall
+    back to their own expiry_date.
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return
+    today = timezone.localdate()
+    summary = {
+        row['product_id']: row
+        for row in Batch.objects.filter(
+            product_id__in=product_ids, quantity__gt=0
+        ).values('product_id').annotate(
+            count=Count('id'), first_expiry=Min('expiry_date', filter=Q(expiry_date__gte=today)),
+        )
+    }
+    Product.all_objects.filter(id__in=product_ids).update(
+        active_batch_count=Case(
+            *[When(id=pid, then=Value(row['count'])) for pid, row in summary.items()],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        ),
+        next_expiry_date=Case(
+            *[When(id=pid, then=Value(row['first_expiry'])) for pid, row in summary.items()
+              if row['first_expiry']],
+            default=F('expiry_date'),
+            output_field=DateField(),
+        ),
+    )
+
+
+def refresh_expired_batch_summaries(batch_size=500):
+    """
+    Re-sync products whose next_expiry_date has passed (a batch crossed its
+    expiry date since the last stock change). Run daily.
+    Returns: number of products refreshed.
+    """
+    product_ids = list(
+        Product.all_objects.filter(next_expiry_date__lt=timezone.localdate())
+        .order_by('id').values_list('id', flat=True)
+    )
+    for start in range(0, len(product_ids), batch_size):
+        sync_batch_summary(product_ids[start:start + batch_size])
+    return len(product_ids)
+
+
+class _BatchRace(Exception):
+    """A batch changed between FEFO planning and the conditional decrement."""
+
+
+FEFO_ALLOCATION_ATTEMPTS = 3
+
+
+def _fefo_batches(product_ids):
+    """
+    Open batches per product in first-expiry-first-out order, in one query on
+    the (product, expiry_date) index. Batches without expiry come last.
+    Returns: {product_id: [(batch_id, quantity), ...]}
+    """
+    by_product = {}
+    rows = Batch.objects.filter(
+        product_id__in=product_ids, quantity__gt=0
+    ).order_by(
+        'product_id', F('expiry_date').asc(nulls_last=True), 'id'
+    ).values_list('product_id', 'id', 'quantity')
+    for product_id, batch_id, quantity in rows:
+        by_product.setdefault(product_id, []).append((batch_id, quantity))
+    return by_product
+
+
+def _split_quantities(merged, batches):
+    """
+    Split each product quantity across its batches in the given order.
+    Whatever the batches cannot cover is stock not tracked by any batch.
+    Returns: list of (product_id, batch_id or None, quantity).
+    """
+    allocations = []
+    for product_id, quantity in sorted(merged.items()):
+        remaining = quantity
+        for batch_id, batch_qty in batches.get(product_id, []):
+            if not remaining:
+                break
+            take = min(batch_qty, remaining)
+            allocations.append((product_id, batch_id, take))
+            remaining -= take
+        if remaining:
+            allocations.append((product_id, None, remaining))
+    return allocations
+
+
+def allocate_fefo(merged):
+    """
+    Allocate outbound quantities ({product_id: quantity}) to batches
+    first-expiry-first-out and decrement Batch.quantity.
+    Callers hold the Product row locks, which serialises allocation per
+    product; batches themselves are not locked. Each decrement is conditional
+    (quantity >= take), and if a batch was edited meanwhile the plan is
+    rolled back and rebuilt.
+    Returns: list of (product_id, batch_id or None, quantity).
+    """
+    for _attempt in range(FEFO_ALLOCATION_ATTEMPTS):
+        batches = _fefo_batches(list(merged))
+        allocations = _split_quantities(merged, batches)
+        batch_quantities = {batch_id: qty for rows in batches.values() for batch_id, qty in rows}
+        try:
+            with transaction.atomic():
+                for _product_id, batch_id, quantity in allocations:
+                    if batch_id and not Batch.objects.filter(
+                        id=batch_id, quantity__gte=quantity
+                    ).update(quantity=F('quantity') - quantity):
+                        raise _BatchRace()
+        except _BatchRace:
+            continue
+        # Only batches that ran empty change the product's batch summary
+        sync_batch_summary(
+            product_id for product_id, batch_id, quantity in allocations
+            if batch_id and quantity == batch_quantities[batch_id]
+        )
+        return allocations
+    raise ValueError("Batch stock changed during allocation. Please try again.")
+
+
+def _release_batch_allocations(documents, reference_type):
+    """
+    Give restored quantities back to the batches each document took them from
+    (net OUT per batch recorded under the same reference), in one grouped
+    query. The rest is restored as untracked stock.
+    documents: {reference_id: {product_id: quantity}}.
+    Returns: {reference_id: list of (product_id, batch_id or None, quantity)}.
+    """
+    taken = {}
+    rows = StockMovement.objects.filter(
+        reference_type=reference_type,
+        reference_id__in=list(documents),
+        product_id__in={product_id for merged in documents.values() for product_id in merged},
+        batch__isnull=False,
+        batch__deleted_at__isnull=True,
+    ).values('reference_id', 'product_id', 'batch_id', 'batch__expiry_date').annotate(
+        net=Sum('quantity')
+    ).filter(net__lt=0).order_by(
+        'reference_id', 'product_id', F('batch__expiry_date').asc(nulls_last=True), 'batch_id'
+    )
+    for row in rows:
+        taken.setdefault(row['reference_id'], {}).setdefault(row['product_id'], []).append(
+            (row['batch_id'], -row['net'])
+        )
+    allocations = {
+        reference_id: _split_quantities(merged, taken.get(reference_id, {}))
+        for reference_id, merged in documents.items()
+    }
+    released = {}
+    for document_allocations in allocations.values():
+        for _product_id, batch_id, quantity in document_allocations:
+            if batch_id:
+                released[batch_id] = released.get(batch_id, 0) + quantity
+    for batch_id, quantity in released.items():
+        Batch.objects.filter(id=batch_id).update(quantity=F('quantity') + quantity)
+    sync_batch_summary(
+        product_id for document_allocations in allocations.values()
+        for product_id, batch_id, _qty in document_allocations if batch_id
+    )
+    return allocations
+
+
+def deduct_stock_many(lines, reference_type, reference_id, user=None, respect_reservations=True,
+                      movement_type='OUT', notes=''):
+    """
+    Deduct stock for several products at once (OUT movements).
+    lines: iterable of (product_id, quantity); duplicates are merged.
+    All quantities are validated before anything is written, so the call is
+    all-or-nothing. By default stock held by reservations is not available.
+    Each quantity is taken from batches first-expiry-first-out, one
+    StockMovement per batch touched.
+    Raises ValueError on insufficient stock.
+    Returns: list of created StockMovement.
+    """
+    return deduct_stock_for_documents(
+        {reference_id: lines}, reference_type, user=user, respect_reservations=respect_reservations,
+        movement_type=movement_type, notes=notes,
+    )
+
+
+def deduct_stock_for_documents(documents, reference_type, user=None, respect_reservations=True,
+                               movement_type='OUT', notes=''):
+    """
+    deduct_stock_many for several documents of one type (e.g. imported orders):
+    one product lock, one check, one FEFO allocation and one bulk insert for all.
+    documents: {reference_id: iterable of (product_id, quantity)}, in allocation
+    order (earlier documents get the earlier-expiring batches). All-or-nothing.
+    Raises ValueError on insufficient stock.
+    Returns: list of created StockMovement.
+    """
+    per_document = {reference_id: _merge_stock_lines(lines) for reference_id, lines in documents.items()}
+    merged = _merge_stock_lines(
+        (product_id, quantity) for lines in per_document.values() for product_id, quantity in lines.items()
+    )
+    if not merged:
+        return []
+    with transaction.atomic():
+        products = _lock_products(list(merged))
+        _check_quantities(products, merged, respect_reservations)
+        allocations = allocate_fefo(merged)
+        _apply_stock_deltas(products, {pid: -qty for pid, qty in merged.items()})
+        # Hand each document its share of the allocation, batches in FEFO order
+        pools = {}
+        for product_id, batch_id, quantity in allocations:
+            pools.setdefault(product_id, []).append([batch_id, quantity])
+        movements = []
+        for reference_id, lines in per_document.items():
+            for product_id, quantity in sorted(lines.items()):
+                pool = pools[product_id]
+                while quantity:
+                    batch_id, left = pool[0]
+                    take = min(left, quantity)
+                    movements.append(StockMovement(
+                        product_id=product_id,
+                        batch_id=batch_id,
+                        movement_type=movement_type,
+                        quantity=-take,
+                        reference_type=reference_type,
+                        reference_id=reference_id,
+                        notes=notes,
+                        created_by=user,
+                    ))
+                    quantity -= take
+                    if take == left:
+                        pool.pop(0)
+                    else:
+                        pool[0][1] -= take
+        movements = StockMovement.objects.bulk_create(movements, batch_size=1000)
+        post_checkpoints(movements)
+        log_stock_movements(movements, products, user=user)
+    return movements
+
+
+def restore_stock_many(lines, reference_type, reference_id, user=None):
+    """
+    Restore stock for several products at once (RETURN movements).
+    lines: iterable of (product_id, quantity); duplicates are merged.
+    Quantities go back to the batches this reference took them from.
+    Returns: list of created StockMovement.
+    """
+    return restore_stock_for_documents({reference_id: lines}, reference_type, user=user)
+
+
+def restore_stock_for_documents(documents, reference_type, user=None):
+    """
+    restore_stock_many for several documents of one type (e.g. approved returns):
+    one product lock, one batch lookup and one bulk insert for all.
+    documents: {reference_id: iterable of (product_id, quantity)}.
+    Returns: list of created StockMovement.
+    """
+    per_document = {reference_id: _merge_stock_lines(lines) for reference_id, lines in documents.items()}
+    per_document = {reference_id: merged for reference_id, merged in per_document.items() if merged}
+    merged = _merge_stock_lines(
+        (product_id, quantity) for lines in per_document.values() for product_id, quantity in lines.items()
+    )
+    if not merged:
+        return []
+    with transaction.atomic():
+        products = _lock_products(list(merged))
+        allocations = _release_batch_allocations(per_document, reference_type)
+        _apply_stock_deltas(products, merged)
+        movements = StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                batch_id=batch_id,
+                movement_type='RETURN',
+                quantity=quantity,
+                reference_type=reference_type,
+                reference_id=reference_id,
+                created_by=user,
+            )
+            for reference_id, document_allocations in allocations.items()
+            for product_id, batch_id, quantity in document_allocations
+        ], batch_size=1000)
+        post_checkpoints(movements)
+        log_stock_movements(movements, products, user=user)
+    return movements
+
+
+def move_document_stock(deltas, reference_type, reference_id, user=None):
+    """
+    Apply a document's net stock change (e.g. order items edited) under one
+    product lock: deltas {product_id: quantity}, positive = deduct more,
+    negative = give back. Give-backs run first so the stock they free is
+    available to the deductions. All-or-nothing.
+    Raises ValueError on insufficient stock.
+    Returns: list of created StockMovement.
+    """
+    deltas = {product_id: quantity for product_id, quantity in deltas.items() if quantity}
+    if not deltas:
+        return []
+    with transaction.atomic():
+        # Lock the union up front, in id order, so both steps below only re-read held rows
+        _lock_products(sorted(deltas))
+        movements = restore_stock_many(
+            [(product_id, -quantity) for product_id, quantity in deltas.items() if quantity < 0],
+            reference_type, reference_id, user=user,
+        )
+        movements += deduct_stock_many(
+            [(product_id, quantity) for product_id, quantity in deltas.items() if quantity > 0],
+            reference_type, reference_id, user=user,
+        )
+    return movements
+
+
+def reserve_stock_many(lines, reference_type, reference_id, expires_at=None,
+                       allow_shortfall=False, user=None):
+    """
+    Reserve stock for a document without moving it (ACTIVE StockReservation).
+    Increments Product.reserved_quantity so available-to-promise stays a column read.
+    allow_shortfall: reserve even when available stock is short (pre-orders).
+    Raises ValueError on insufficient available stock.
+    Returns: list of created StockReservation.
+    """
+    return reserve_stock_for_documents(
+        {reference_id: lines}, reference_type, expires_at=expires_at,
+        allow_shortfall=allow_shortfall, user=user,
+    )
+
+
+def reserve_stock_for_documents(documents, reference_type, expires_at=None,
+                                allow_shortfall=False, user=None):
+    """
+    reserve_stock_many for several documents of one type in one lock and insert.
+    documents: {reference_id: iterable of (product_id, quantity)}. All-or-nothing.
+    """
+    per_document = {reference_id: _merge_stock_lines(lines) for reference_id, lines in documents.items()}
+    merged = _merge_stock_lines(
+        (product_id, quantity) for lines in per_document.values() for product_id, quantity in lines.items()
+    )
+    if not merged:
+        return []
+    with transaction.atomic():
+        products = _lock_products(list(merged))
+        if not allow_shortfall:
+            _check_quantities(products, merged, respect_reservations=True)
+        _apply_stock_deltas(products, merged, field='reserved_quantity')
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=product_id,
+                quantity=quantity,
+                reference_type=reference_type,
+                reference_id=reference_id,
+                expires_at=expires_at,
+                created_by=user,
+            )
+            for reference_id, lines in per_document.items()
+            for product_id, quantity in sorted(lines.items())
+        ], batch_size=1000)
+    return reservations
+
+
+def _close_reservations(reservations, status):
+    """Give back reserved_quantity for the given ACTIVE reservations and mark them closed."""
+    if not reservations:
+        return 0
+    merged = _merge_stock_lines((r.product_id, r.quantity) for r in reservations)
+    products = _lock_products(list(merged))
+    _apply_stock_deltas(products, {pid: -qty for pid, qty in merged.items()}, field='reserved_quantity')
+    return StockReservation.objects.filter(id__in=[r.id for r in reservations]).update(
+        status=status, updated_at=timezone.now()
+    )
+
+
+def _active_reservations(reference_type, reference_id):
+    """ACTIVE reservations of one document, or of several when reference_id is a list (locked)."""
+    lookup = 'reference_id__in' if isinstance(reference_id, (list, tuple, set)) else 'reference_id'
+    return list(
+        StockReservation.objects.select_for_update().filter(
             reference_type=reference_type,
-            reference_id=reference_id,
-            created_by=user,
+            status=StockReservation.STATUS_ACTIVE,
+            **{lookup: reference_id},
         )
-    return product
+    )
 
 
-def adjust_stock(product_id, quantity, reason, approved_by):
-    """Manual adjustment with ADJUST movement type."""
+def release_reservations(reference_type, reference_id):
+    """Release all active reservations of a document (e.g. order cancelled). Returns: count released."""
     with transaction.atomic():
-        product = Product.objects.select_for_update().get(id=product_id)
-        product.stock_quantity += quantity
-        product.save()
-        StockMovement.objects.create(
-            product=product,
-            movement_type='ADJUST',
-            quantity=quantity,
-            reference_type='ADJUST',
-            notes=reason,
-            created_by=approved_by,
+        return _close_reservations(
+            _active_reservations(reference_type, reference_id), StockReservation.STATUS_RELEASED
+        )
+
+
+def release_reservations_for_documents(reference_type, reference_ids):
+    """release_reservations for several documents in one lock and update. Returns: count released."""
+    with transaction.atomic():
+        return _close_reservations(
+            _active_reservations(reference_type, reference_ids), StockReservation.STATUS_RELEASED
+        )
+
+
+def replace_reservations(reference_type, reference_id, lines, expires_at=None,
+                         allow_shortfall=False, user=None):
+    """
+    Swap a document's active reservations for a new set of lines (e.g. order edited).
+    Locks the union of old and new products up front to keep id-ordered locking.
+    Returns: list of created StockReservation.
+    """
+    lines = list(lines)
+    with transaction.atomic():
+        reservations = _active_reservations(reference_type, reference_id)
+        _lock_products(sorted({r.product_id for r in reservations} | {pid for pid, _ in lines}))
+        _close_reservations(reservations, StockReservation.STATUS_RELEASED)
+        return reserve_stock_many(
+            lines, reference_type, reference_id, expires_at=expires_at,
+            allow_shortfall=allow_shortfall, user=user,
+        )
+
+
+def convert_reservations(reference_type, reference_id, lines, user=None):
+    """
+    Turn a document's reservations into physical OUT movements for lines
+    (e.g. pre-order delivered). Reserved quantity and stock drop together;
+    documents without reservations are simply deducted.
+    Returns: list of created StockMovement.
+    """
+    lines = list(lines)
+    with transaction.atomic():
+        reservations = _active_reservations(reference_type, reference_id)
+        _lock_products(sorted({r.product_id for r in reservations} | {pid for pid, _ in lines}))
+        _close_reservations(reservations, StockReservation.STATUS_CONVERTED)
+        return deduct_stock_many(
+            lines, reference_type, reference_id, user=user, respect_reservations=False,
+        )
+
+
+def convert_reservations_for_documents(documents, reference_type, user=None):
+    """
+    convert_reservations for several documents of one type (e.g. a delivery run):
+    one reservation read, one product lock and one deduction for all.
+    documents: {reference_id: iterable of (product_id, quantity)}. All-or-nothing.
+    Returns: list of created StockMovement.
+    """
+    documents = {reference_id: list(lines) for reference_id, lines in documents.items()}
+    if not documents:
+        return []
+    with transaction.atomic():
+        reservations = _active_reservations(reference_type, list(documents))
+        _lock_products(sorted(
+            {r.product_id for r in reservations}
+            | {product_id for lines in documents.values() for product_id, _qty in lines}
+        ))
+        _close_reservations(reservations, StockReservation.STATUS_CONVERTED)
+        return deduct_stock_for_documents(documents, reference_type, user=user, respect_reservations=False)
+
+
+def expire_reservations(now=None):
+    """Expire ACTIVE reservations whose expires_at has passed. Returns: count expired."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update().filter(
+                status=StockReservation.STATUS_ACTIVE, expires_at__lt=now,
+            )
+        )
+        return _close_reservations(reservations, StockReservation.STATUS_EXPIRED)
+
+
+def add_stock_many(lines, reference_type, reference_id, movement_type='IN', notes='', user=None):
+    """
+    Add stock for several products at once, not tied to a batch (IN
+    movements by default). lines: iterable of (product_id, quantity);
+    duplicates are merged. Batch stock is posted by Batch.save instead.
+    Returns: list of created StockMovement.
+    """
+    merged = _merge_stock_lines(lines)
+    if not merged:
+        return []
+    with transaction.atomic():
+        products = _lock_products(list(merged))
+        _apply_stock_deltas(products, merged)
+        movements = StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                movement_type=movement_type,
+                quantity=quantity,
+                reference_type=reference_type,
+                reference_id=reference_id,
+                notes=notes,
+                created_by=user,
+            )
+            for product_id, quantity in sorted(merged.items())
+        ])
+        post_checkpoints(movements)
+        log_stock_movements(movements, products, user=user)
+    return movements
+
+
+def adjust_stock(product_id, quantity, reason, approved_by):
+    """
+    Manual adjustment with ADJUST movement type. Write-offs (negative
+    quantity) come out of batches FEFO like any deduction; reserved stock
+    can be written off. Returns: list of StockMovement.
+    """
+    if quantity < 0:
+        return deduct_stock_many(
+            [(product_id, -quantity)], 'ADJUST', None, user=approved_by,
+            respect_reservations=False, movement_type='ADJUST', notes=reason,
         )
-    return product
+    return add_stock_many(
+        [(product_id, quantity)], 'ADJUST', None, movement_type='ADJUST', notes=reason, user=approved_by,
+    )
 
 
 def add_stock(product_id, quantity, reference_type, reference_id, notes='', user=None):
     """
     Add stock (IN movement). Use for purchase receive, batch create, etc.
     Never update Product.stock_quantity directly - always use this service.
+    Returns: list of StockMovement.
     """
-    with transaction.atomic():
-        product = Product.objects.select_for_update().get(id=product_id)
-        product.stock_quantity += quantity
-        product.save()
-        StockMovement.objects.create(
-            product=product,
-            movement_type='IN',
-            quantity=quantity,
-            reference_type=reference_type,
-            reference_id=reference_id,
-            notes=notes or '',
-            created_by=user,
-        )
-    return product
+    return add_stock_many(
+        [(product_id, quantity)], reference_type, reference_id, notes=notes or '', user=user,
+    )
 
 
 def add_stock_from_batch(product_id, quantity, batch_id, reference_id, user=None):
@@ -108,15 +801,17 @@ def adjust_stock_from_batch(product_id, quantity_delta, batch_id, reference_id,
     """
     Adjust stock when batch quantity changes. Uses service layer.
     Creates StockMovement ADJUST and updates Product.stock_quantity.
+    Returns: StockMovement, or None when quantity_delta is 0.
     """
     if quantity_delta == 0:
-        return Product.objects.get(id=product_id)
+        return None
     with transaction.atomic():
-        product = Product.objects.select_for_update().get(id=product_id)
-        product.stock_quantity += quantity_delta
-        product.save()
-        StockMovement.objects.create(
-            product=product,
+        products = _lock_products([product_id])
+        if quantity_delta < 0:
+            _check_quantities(products, {product_id: -quantity_delta}, respect_reservations=False)
+        _apply_stock_deltas(products, {product_id: quantity_delta})
+        movement = StockMovement.objects.create(
+            product_id=product_id,
             batch_id=batch_id,
             movement_type='ADJUST',
             quantity=quantity_delta,
@@ -125,7 +820,9 @@ def adjust_stock_from_batch(product_id, quantity_delta, batch_id, reference_id,
             notes='Batch quantity update',
             created_by=user,
         )
-    return product
+        post_checkpoints([movement])
+        log_stock_movements([movement], products, user=user)
+    return movement
 
 
 def check_low_stock():
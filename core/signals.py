@@ -0,0 +1,32 @@
+"""
+Core signals - keep the cached price matrix and product catalog in sync with writes.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import CATALOG_FIELDS, invalidate_catalog
+from .models import Product, ProductPriceTier
+from .pricing import invalidate_prices
+
+
+@receiver(post_save, sender=Product)
+def product_post_save(sender, instance, created, update_fields=None, **kwargs):
+    """Invalidate prices when a product is added or its base_price changed; the catalog when its fields may have."""
+    if created or instance.base_price != getattr(instance, '_loaded_base_price', None):
+        invalidate_prices()
+    instance._loaded_base_price = instance.base_price
+    if created or update_fields is None or set(update_fields) & set(CATALOG_FIELDS):
+        invalidate_catalog()
+
+
+@receiver(post_delete, sender=Product)
+def product_post_delete(sender, instance, **kwargs):
+    """Invalidate the catalog on hard delete."""
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=ProductPriceTier)
+@receiver(post_delete, sender=ProductPriceTier)
+def price_tier_changed(sender, instance, **kwargs):
+    """Invalidate prices on any tier write."""
+    invalidate_prices()
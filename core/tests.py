@@ -5,7 +5,7 @@ from django.test import TestCase
 from django.core.management import call_command
 
 from core.models import Product, StockMovement
-from core.services import deduct_stock, restore_stock
+from core.services import deduct_stock, deduct_stock_many, restore_stock, restore_stock_many
 from master_data.models import ProductCategory, UnitOfMeasure
 
 
@@ -33,3 +33,319 @@ class StockServiceTests(TestCase):
         restore_stock(self.product.id, 5, 'Test', 1)
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock_quantity, 55)
+
+    def test_deduct_stock_many_merges_lines(self):
+        other = Product.objects.create(name='Other', sku='T2', stock_quantity=20)
+        deduct_stock_many(
+            [(self.product.id, 5), (other.id, 3), (self.product.id, 5)], 'Test', 1
+        )
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 40)
+        self.assertEqual(other.stock_quantity, 17)
+        self.assertEqual(StockMovement.objects.filter(movement_type='OUT').count(), 2)
+
+    def test_deduct_stock_many_is_all_or_nothing(self):
+        other = Product.objects.create(name='Other', sku='T2', stock_quantity=2)
+        with self.assertRaises(ValueError):
+            deduct_stock_many([(self.product.id, 5), (other.id, 3)], 'Test', 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 50)
+        self.assertEqual(StockMovement.objects.count(), 0)
+
+    def test_restore_stock_many(self):
+        restore_stock_many([(self.product.id, 5)], 'Test', 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 55)
+        self.assertEqual(StockMovement.objects.get().movement_type, 'RETURN')
+
+    def test_deduct_stock_insufficient(self):
+        with self.assertRaises(ValueError):
+            deduct_stock(self.product.id, 51, 'Test', 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 50)
+        self.assertEqual(StockMovement.objects.count(), 0)
+
+    def test_stock_change_is_audited_per_movement(self):
+        from common.models import AuditLog
+        deduct_stock(self.product.id, 10, 'SalesOrder', 7)
+        log = AuditLog.objects.filter(model_name='core.product', object_id=self.product.id).latest('id')
+        self.assertEqual(log.changes['movement']['quantity'], -10)
+        self.assertEqual(log.changes['movement']['reference'], 'SalesOrder #7')
+
+    def test_expire_reservations(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from core.services import expire_reservations, reserve_stock_many
+        reserve_stock_many(
+            [(self.product.id, 20)], 'Test', 1,
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.available_quantity, 30)
+        self.assertEqual(expire_reservations(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 0)
+
+    def test_deduct_stock_many_allocates_fefo(self):
+        from datetime import date
+        from core.models import Batch
+        late = Batch.objects.create(product=self.product, batch_number='L', quantity=10, expiry_date=date(2031, 1, 1))
+        early = Batch.objects.create(product=self.product, batch_number='E', quantity=10, expiry_date=date(2030, 1, 1))
+        StockMovement.objects.all().delete()
+
+        movements = deduct_stock_many([(self.product.id, 15)], 'SalesOrder', 1)
+        early.refresh_from_db()
+        late.refresh_from_db()
+        self.assertEqual(early.quantity, 0)
+        self.assertEqual(late.quantity, 5)
+        self.assertEqual(sorted((m.batch_id, m.quantity) for m in movements), sorted([(early.id, -10), (late.id, -5)]))
+
+        restore_stock_many([(self.product.id, 15)], 'SalesOrder', 1)
+        early.refresh_from_db()
+        late.refresh_from_db()
+        self.assertEqual((early.quantity, late.quantity), (10, 10))
+
+    def test_batch_summary_maintained(self):
+        from datetime import date
+        from core.models import Batch
+        Batch.objects.create(product=self.product, batch_number='E', quantity=5, expiry_date=date(2030, 1, 1))
+        Batch.objects.create(product=self.product, batch_number='L', quantity=5, expiry_date=date(2031, 1, 1))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.active_batch_count, 2)
+        self.assertEqual(self.product.next_expiry_date, date(2030, 1, 1))
+
+        deduct_stock_many([(self.product.id, 5)], 'SalesOrder', 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.active_batch_count, 1)
+        self.assertEqual(self.product.next_expiry_date, date(2031, 1, 1))
+
+    def test_batch_summary_skips_expired_batches(self):
+        import datetime
+        from io import StringIO
+        from django.utils import timezone
+        from core.models import Batch
+        today = timezone.localdate()
+        Batch.objects.create(product=self.product, batch_number='X', quantity=5,
+                             expiry_date=today - datetime.timedelta(days=1))
+        soon = Batch.objects.create(product=self.product, batch_number='S', quantity=5,
+                                    expiry_date=today + datetime.timedelta(days=3))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.active_batch_count, self.product.next_expiry_date), (2, soon.expiry_date))
+
+        # The soon batch crosses its expiry date without any stock change
+        Batch.objects.filter(pk=soon.pk).update(expiry_date=today - datetime.timedelta(days=2))
+        Product.objects.filter(pk=self.product.pk).update(next_expiry_date=today - datetime.timedelta(days=2))
+        call_command('backfill_batch_summary', '--expired', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.next_expiry_date)
+
+    def test_reconcile_stock_fixes_in_chunks(self):
+        import json
+        from io import StringIO
+        other = Product.objects.create(name='Other', sku='T2', stock_quantity=0)
+        restore_stock(other.id, 7, 'Test', 1)
+        Product.objects.filter(id=other.id).update(stock_quantity=3)
+        # self.product has 50 on hand and no movements
+
+        out = StringIO()
+        call_command('reconcile_stock', '--fix', '--batch-size=1', '--report=-', stdout=out)
+        report = json.loads(out.getvalue()[out.getvalue().index('{'):])
+        self.assertEqual(report['mismatch_count'], 2)
+        self.assertEqual(report['fixed_count'], 2)
+        self.assertEqual(len(report['chunks']), Product.all_objects.count())
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, other.stock_quantity), (0, 7))
+
+    def test_stock_as_of_uses_checkpoints(self):
+        import datetime
+        from django.utils import timezone
+        from core.models import StockCheckpoint
+        from core.services import rebuild_checkpoints, stock_as_of
+        restore_stock(self.product.id, 10, 'Test', 1)
+        # Pretend the first movement happened two days ago
+        two_days_ago = timezone.now() - datetime.timedelta(days=2)
+        StockMovement.objects.update(created_at=two_days_ago)
+        rebuild_checkpoints([self.product.id])
+        deduct_stock_many([(self.product.id, 4)], 'Test', 2)
+
+        # The 50 units set up without a movement are carried back as they are
+        today = timezone.localdate()
+        self.assertEqual(stock_as_of([self.product.id], today - datetime.timedelta(days=3)), {self.product.id: 50})
+        self.assertEqual(stock_as_of([self.product.id], today - datetime.timedelta(days=1)), {self.product.id: 60})
+        self.assertEqual(stock_as_of([self.product.id], today), {self.product.id: 56})
+        self.assertEqual(stock_as_of([self.product.id], timezone.now()), {self.product.id: 56})
+        self.assertEqual(StockCheckpoint.objects.get(product=self.product, date=today).balance, 6)
+
+    def test_product_form_does_not_edit_stock(self):
+        from core.forms import ProductForm
+        self.assertNotIn('stock_quantity', ProductForm(instance=self.product).fields)
+        self.assertNotIn('opening_stock', ProductForm(instance=self.product).fields)
+        self.assertIn('opening_stock', ProductForm().fields)
+        # Reservation counter is kept by the services only, never by forms
+        from django.forms import modelform_factory
+        self.assertNotIn('reserved_quantity', modelform_factory(Product, fields='__all__').base_fields)
+
+    def test_product_edit_keeps_stock_changed_meanwhile(self):
+        from core.forms import ProductForm
+        stale = Product.objects.get(pk=self.product.pk)
+        initial = ProductForm(instance=stale).initial
+        data = {name: value for name, value in initial.items() if value is not None}
+        data.update(name='Renamed', version=stale.version)
+        # Stock moves after the edit form was loaded
+        deduct_stock_many([(self.product.id, 7)], 'Test', 1)
+
+        form = ProductForm(data, instance=stale)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock_quantity, self.product.version), ('Renamed', 43, 2))
+
+    def test_admin_and_api_edits_keep_stock_changed_meanwhile(self):
+        from django.contrib import admin
+        from django.test import RequestFactory
+        from core.admin import ProductAdmin
+        from core.serializers import ProductSerializer
+        from django.contrib.auth import get_user_model
+        request = RequestFactory().post('/')
+        request.user = get_user_model().objects.create_superuser(username='admin', password='pw')
+        model_admin = ProductAdmin(Product, admin.site)
+        stale = Product.objects.get(pk=self.product.pk)
+        form_class = model_admin.get_form(request, stale, change=True)
+        self.assertNotIn('stock_quantity', form_class.base_fields)
+        self.assertNotIn('reserved_quantity', form_class.base_fields)
+
+        initial = form_class(instance=stale).initial
+        data = {name: value for name, value in initial.items() if value is not None}
+        data.update(name='Renamed', version=stale.version)
+        deduct_stock_many([(self.product.id, 7)], 'Test', 1)
+        form = form_class(data, instance=stale)
+        self.assertTrue(form.is_valid(), form.errors)
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock_quantity, self.product.version), ('Renamed', 43, 2))
+
+        # API edits save only the columns they were sent; stock is not one of them
+        stale = Product.objects.get(pk=self.product.pk)
+        deduct_stock_many([(self.product.id, 3)], 'Test', 1)
+        serializer = ProductSerializer(
+            stale, data={'name': 'Renamed again', 'stock_quantity': 999, 'version': 2}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.name, self.product.stock_quantity, self.product.version), ('Renamed again', 40, 3)
+        )
+
+    def test_compact_movements_keeps_totals(self):
+        import datetime
+        from django.utils import timezone
+        from core.models import StockMovementArchive
+        from core.services import compact_movements, rebuild_checkpoints, stock_as_of
+        restore_stock(self.product.id, 10, 'Test', 1)
+        deduct_stock(self.product.id, 4, 'Test', 2)
+        old = timezone.now() - datetime.timedelta(days=10)
+        StockMovement.objects.update(created_at=old)
+        rebuild_checkpoints([self.product.id])
+        restore_stock(self.product.id, 1, 'Test', 3)
+
+        cutoff = timezone.now() - datetime.timedelta(days=5)
+        self.assertEqual(compact_movements(cutoff, limit=1), 1)
+        self.assertEqual(compact_movements(cutoff, limit=1), 1)
+        self.assertEqual(compact_movements(cutoff), 0)
+
+        self.assertEqual(StockMovementArchive.objects.count(), 2)
+        opening = StockMovement.objects.get(reference_type=StockMovement.OPENING_BALANCE)
+        self.assertEqual((opening.movement_type, opening.quantity), ('ADJUST', 6))
+        self.assertEqual(sum(StockMovement.objects.values_list('quantity', flat=True)), 7)
+
+        rebuild_checkpoints([self.product.id])
+        day = timezone.localdate(old)
+        self.assertEqual(stock_as_of([self.product.id], day), {self.product.id: 56})
+        self.assertEqual(stock_as_of([self.product.id], timezone.localdate()), {self.product.id: 57})
+
+    def test_resolve_prices_cached_and_invalidated(self):
+        from core.models import ProductPriceTier
+        from core.pricing import resolve_prices
+        from master_data.models import CustomerType
+        customer_type = CustomerType.objects.first()
+        self.product.base_price = 100
+        self.product.save()
+        resolve_prices([self.product.id], customer_type)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_prices([self.product.id], customer_type), {self.product.id: 100})
+
+        ProductPriceTier.objects.create(product=self.product, customer_type=customer_type, price=80)
+        self.assertEqual(resolve_prices([self.product.id], customer_type), {self.product.id: 80})
+        self.product.base_price = 120
+        self.product.save()
+        self.assertEqual(resolve_prices([self.product.id], None), {self.product.id: 120})
+
+    def test_price_version_expires_without_shared_invalidation(self):
+        import time
+        from unittest import mock
+        from django.conf import settings
+        from core.pricing import resolve_prices
+        self.assertEqual(resolve_prices([self.product.id], None), {self.product.id: 0})
+        # A change whose invalidation never reaches this process (e.g. another worker's memory cache)
+        Product.objects.filter(pk=self.product.pk).update(base_price=70)
+        self.assertEqual(resolve_prices([self.product.id], None), {self.product.id: 0})
+        later = time.time() + settings.CACHE_VERSION_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(resolve_prices([self.product.id], None), {self.product.id: 70})
+
+    def test_product_catalog_versioned_and_cached(self):
+        import json
+        from django.contrib.auth import get_user_model
+        from core.catalog import catalog_version, get_catalog
+        self.client.force_login(get_user_model().objects.create_user('catalog', 'c@test.com', 'pass12345'))
+        version, payload = get_catalog()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog(), (version, payload))
+        self.assertIn([self.product.id, 'Test', 'T1'], [row[:3] for row in json.loads(payload)['products']])
+
+        response = self.client.get('/products/catalog/', HTTP_IF_NONE_MATCH=f'"{version}"')
+        self.assertEqual(response.status_code, 304)
+
+        # Stock-only saves keep the catalog; renames replace it
+        self.product.stock_quantity = 49
+        self.product.save(update_fields=['stock_quantity'])
+        self.assertEqual(catalog_version(), version)
+        self.product.name = 'Renamed'
+        self.product.save()
+        self.assertNotEqual(catalog_version(), version)
+        self.assertIn('Renamed', get_catalog()[1])
+
+        # A rename whose invalidation never reaches this process is picked up once the version expires
+        import time
+        from unittest import mock
+        from django.conf import settings
+        Product.objects.filter(pk=self.product.pk).update(name='Relabelled')
+        self.assertNotIn('Relabelled', get_catalog()[1])
+        with mock.patch('time.time', return_value=time.time() + settings.CACHE_VERSION_TIMEOUT + 1):
+            self.assertIn('Relabelled', get_catalog()[1])
+
+    def test_restore_stock_for_soft_deleted_product(self):
+        deduct_stock_many([(self.product.id, 10)], 'SalesOrder', 1)
+        self.product.delete()
+        restore_stock_many([(self.product.id, 10)], 'SalesOrder', 1)
+        self.assertEqual(Product.all_objects.get(pk=self.product.pk).stock_quantity, 50)
+
+    def test_single_line_helpers_keep_batches_in_step(self):
+        from datetime import date
+        from core.models import Batch
+        from core.services import adjust_stock
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+        early = Batch.objects.create(product=self.product, batch_number='E', quantity=10, expiry_date=date(2030, 1, 1))
+        late = Batch.objects.create(product=self.product, batch_number='L', quantity=10, expiry_date=date(2031, 1, 1))
+
+        deduct_stock(self.product.id, 4, 'SalesOrder', 1)
+        adjust_stock(self.product.id, -8, 'Damaged', None)
+        early.refresh_from_db()
+        late.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((early.quantity, late.quantity), (0, 8))
+        self.assertEqual(self.product.stock_quantity, early.quantity + late.quantity)
+        self.assertEqual(StockMovement.objects.filter(movement_type='ADJUST', reference_type='ADJUST').count(), 2)
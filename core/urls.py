@@ -5,6 +5,8 @@ app_name = 'core'
 urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('add/', views.product_create, name='product_create'),
+    path('catalog/', views.product_catalog, name='product_catalog'),
+    path('search/', views.product_search, name='product_search'),
     path('movements/', views.stock_movement_list, name='stock_movement_list'),
     path('low-stock/', views.low_stock_list, name='low_stock_list'),
     path(
@@ -1,19 +1,23 @@
 """
 Product & Inventory views.
 """
-from django.db.models import Count, Q, Prefetch
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
 from django.utils.translation import gettext_lazy as _
 
+from .catalog import get_catalog
 from .models import Batch, Product, ProductPriceTier, StockMovement
 from .forms import ProductForm, StockAdjustmentForm
-from .services import check_low_stock, adjust_stock
+from .services import check_low_stock, add_stock, adjust_stock
 from master_data.models import CustomerType, ProductCategory, UnitOfMeasure
-from common.constants import PAGE_SIZE_PRODUCTS, LIMIT_STOCK_MOVEMENTS
+from common.constants import PAGE_SIZE_PRODUCTS, PAGE_SIZE_TYPEAHEAD, LIMIT_STOCK_MOVEMENTS
+from common.concurrency import ConcurrentEditError
+from common.utils import typeahead_page
 
 
 @login_required
@@ -23,7 +27,11 @@ def product_create(request):
     if request.method == 'POST':
         form = ProductForm(request.POST)
         if form.is_valid():
-            product = form.save()
+            with transaction.atomic():
+                product = form.save()
+                opening = form.cleaned_data.get('opening_stock')
+                if opening:
+                    add_stock(product.id, opening, 'Product', product.id, notes='Opening stock', user=request.user)
             return redirect('core:product_detail', pk=product.pk)
     else:
         form = ProductForm()
@@ -38,8 +46,12 @@ def product_edit(request, pk):
     if request.method == 'POST':
         form = ProductForm(request.POST, instance=product)
         if form.is_valid():
-            form.save()
-            return redirect('core:product_detail', pk=product.pk)
+            try:
+                with transaction.atomic():
+                    form.save()
+                return redirect('core:product_detail', pk=product.pk)
+            except ConcurrentEditError as e:
+                form.add_error(None, str(e))
     else:
         form = ProductForm(instance=product)
     return render(request, 'core/product_form.html', {'form': form, 'title': _('Edit Product'), 'product': product})
@@ -49,13 +61,10 @@ def product_edit(request, pk):
 @permission_required('core.view_product', raise_exception=True)
 def product_list(request):
     """List products."""
+    # Expiry and batch count are denormalized on Product (core.services.sync_batch_summary)
     products = Product.objects.filter(
         is_active=True
-    ).select_related('category', 'unit').annotate(
-        expiry_count=Count('batches__expiry_date', filter=Q(batches__quantity__gt=0), distinct=True)
-    ).prefetch_related(
-        Prefetch('batches', queryset=Batch.objects.filter(quantity__gt=0).order_by('expiry_date'), to_attr='active_batches')
-    ).order_by('name')
+    ).select_related('category', 'unit').order_by('name')
     paginator = Paginator(products, PAGE_SIZE_PRODUCTS)
     page = request.GET.get('page', 1)
     products = paginator.get_page(page)
@@ -185,3 +194,51 @@ def batches_for_product(request, product_id):
             'expiry_date': b.expiry_date.isoformat() if b.expiry_date else '',
         })
     return JsonResponse({'success': True, 'batches': data})
+
+
+@login_required
+def product_catalog(request):
+    """
+    Compact JSON catalog of active products, served from the shared cache.
+    ETag is the catalog version; ?v=<version> URLs may be cached by the browser.
+    """
+    version, payload = get_catalog()
+    etag = f'"{version}"'
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = (
+        'private, max-age=86400' if request.GET.get('v') == version else 'private, no-cache'
+    )
+    return response
+
+
+@login_required
+def product_search(request):
+    """
+    AJAX typeahead search over active products (name or SKU), paginated.
+    ?ids=1,2,3 returns those products instead, e.g. to refresh live stock.
+    """
+    products = Product.objects.filter(is_active=True).select_related('unit').order_by('name', 'id')
+    ids = [i for i in request.GET.get('ids', '').split(',') if i.strip().isdigit()]
+    if ids:
+        rows, page, has_more = list(products.filter(id__in=ids[:PAGE_SIZE_TYPEAHEAD * 5])), 1, False
+    else:
+        query = request.GET.get('q', '').strip()
+        if query:
+            products = products.filter(Q(name__icontains=query) | Q(sku__icontains=query))
+        rows, page, has_more = typeahead_page(products, request.GET.get('page'))
+    results = [
+        {
+            'id': p.id,
+            'name': p.name,
+            'sku': p.sku,
+            'unit': p.unit.name_en if p.unit else '',
+            'available': p.available_quantity,
+            'display_name': f"{p.name} ({p.sku})" if p.sku else p.name,
+        }
+        for p in rows
+    ]
+    return JsonResponse({'results': results, 'page': page, 'has_more': has_more})
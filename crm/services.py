@@ -7,7 +7,7 @@ from django.utils.translation import gettext_lazy as _
 
 from .models import SampleDelivery
 from customers.models import Customer
-from core.services import deduct_stock
+from core.services import deduct_stock_many
 from master_data.constants import SAMPLE_STATUS_GIVEN, LEAD_STATUS_CONTACTED, LEAD_STATUS_SAMPLE_GIVEN, LEAD_STATUS_CONVERTED
 
 
@@ -78,9 +78,9 @@ def give_sample_to_lead(lead, product, quantity, user=None):
     """
     if quantity <= 0:
         quantity = 1
-    if quantity > product.stock_quantity:
+    if quantity > product.available_quantity:
         raise ValueError(
-            _('Insufficient stock. Available: %(qty)s') % {'qty': product.stock_quantity}
+            _('Insufficient stock. Available: %(qty)s') % {'qty': max(product.available_quantity, 0)}
         )
 
     with transaction.atomic():
@@ -91,9 +91,9 @@ def give_sample_to_lead(lead, product, quantity, user=None):
             status=SAMPLE_STATUS_GIVEN,
             created_by=user,
         )
-        deduct_stock(
-            product_id=product.id,
-            quantity=quantity,
+        # Reservation-aware: stock promised to pre-orders is not given away
+        deduct_stock_many(
+            [(product.id, quantity)],
             reference_type='SampleDelivery',
             reference_id=sample.id,
             user=user,
@@ -111,9 +111,9 @@ def give_sample_to_customer(customer, product, quantity, user=None):
     """
     if quantity <= 0:
         quantity = 1
-    if quantity > product.stock_quantity:
+    if quantity > product.available_quantity:
         raise ValueError(
-            _('Insufficient stock. Available: %(qty)s') % {'qty': product.stock_quantity}
+            _('Insufficient stock. Available: %(qty)s') % {'qty': max(product.available_quantity, 0)}
         )
 
     with transaction.atomic():
@@ -124,9 +124,9 @@ def give_sample_to_customer(customer, product, quantity, user=None):
             status=SAMPLE_STATUS_GIVEN,
             created_by=user,
         )
-        deduct_stock(
-            product_id=product.id,
-            quantity=quantity,
+        # Reservation-aware: stock promised to pre-orders is not given away
+        deduct_stock_many(
+            [(product.id, quantity)],
             reference_type='SampleDelivery',
             reference_id=sample.id,
             user=user,
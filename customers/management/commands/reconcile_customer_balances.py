@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customers.models import Customer
+from customers.services import calculate_outstanding
+
+
+class Command(BaseCommand):
+    help = 'Verify Customer.outstanding_balance against their orders (--fix rebuilds drifted balances)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Update drifted balances to the value calculated from orders',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Customers per chunk (one aggregate query per chunk, default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Starting customer balance reconciliation...")
+        batch_size = max(options['batch_size'], 1)
+        ids = list(Customer.all_objects.order_by('id').values_list('id', flat=True))
+        mismatches = 0
+        fixed = 0
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+            with transaction.atomic():
+                customers = Customer.all_objects.filter(id__in=chunk).order_by('id')
+                if options['fix']:
+                    # Lock first, then calculate, so orders and payments landing meanwhile are not lost
+                    customers = customers.select_for_update()
+                current = dict(customers.values_list('id', 'outstanding_balance'))
+                calculated = calculate_outstanding(chunk)
+                to_update = []
+                for customer_id, balance in current.items():
+                    expected = calculated.get(customer_id) or Decimal('0')
+                    if balance == expected:
+                        continue
+                    mismatches += 1
+                    self.stdout.write(self.style.WARNING(
+                        f"MISMATCH: customer ID {customer_id} | Current: {balance} | Calculated: {expected}"
+                    ))
+                    to_update.append(Customer(id=customer_id, outstanding_balance=expected))
+                if options['fix'] and to_update:
+                    Customer.all_objects.bulk_update(to_update, ['outstanding_balance'])
+                    fixed += len(to_update)
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS(f"All {len(ids)} customer balances are in sync!"))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} customer balances."))
+        else:
+            self.stdout.write(self.style.WARNING(f"Found {mismatches} customers with balance mismatches."))
+            self.stdout.write("Run with --fix to rebuild them.")
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:18
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def fill_outstanding_balance(apps, schema_editor):
+    """Seed outstanding_balance from active, non-cancelled orders."""
+    Customer = apps.get_model('customers', 'Customer')
+    SalesOrder = apps.get_model('orders', 'SalesOrder')
+    balances = (
+        SalesOrder.objects.filter(deleted_at__isnull=True)
+        .exclude(status__code='CANCELLED')
+        .values('customer_id')
+        .annotate(balance=Sum(F('total_amount') - F('paid_amount')))
+    )
+    to_update = []
+    for row in balances:
+        to_update.append(Customer(id=row['customer_id'], outstanding_balance=row['balance'] or Decimal('0')))
+    Customer.objects.bulk_update(to_update, ['outstanding_balance'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0009_salespersonphonenumber_customerphonenumber'),
+        ('orders', '0012_alter_salesorder_order_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='outstanding_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Unpaid total of active orders, maintained by order and payment changes', max_digits=14, verbose_name='Outstanding balance'),
+        ),
+        migrations.RunPython(fill_outstanding_balance, migrations.RunPython.noop),
+    ]
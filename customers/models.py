@@ -41,6 +41,11 @@ class Customer(SoftDeleteMixin):
         verbose_name=_("Credit Limit"),
         help_text=_('Maximum credit allowed')
     )
+    outstanding_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False,
+        verbose_name=_("Outstanding balance"),
+        help_text=_('Unpaid total of active orders, maintained by order and payment changes')
+    )
     payment_terms_days = models.PositiveIntegerField(
         default=0,
         verbose_name=_("Payment Terms (Days)"),
@@ -3,9 +3,10 @@ Customer services - phone validation, outstanding balance.
 """
 from decimal import Decimal
 
-from django.db.models import Sum
+from django.db.models import Case, DecimalField, F, Sum, Value, When
 
 from orders.models import SalesOrder
+from master_data.constants import ORDER_CANCELLED
 from master_data.models import OrderStatus
 
 
@@ -39,3 +40,40 @@ def get_outstanding_balance(customer_id):
     )['total'] or Decimal('0')
 
     return total - paid
+
+
+def calculate_outstanding(customer_ids=None):
+    """
+    Outstanding balance from the orders themselves: Sum(total - paid) over
+    non-deleted, non-cancelled orders, one grouped query.
+    Returns: {customer_id: Decimal}; customers without such orders are left out.
+    """
+    orders = SalesOrder.objects.exclude(status__code=ORDER_CANCELLED)
+    if customer_ids is not None:
+        orders = orders.filter(customer_id__in=list(customer_ids))
+    return dict(
+        orders.order_by().values('customer_id')
+        .annotate(balance=Sum(F('total_amount') - F('paid_amount')))
+        .values_list('customer_id', 'balance')
+    )
+
+
+def apply_balance_deltas(deltas):
+    """
+    Move Customer.outstanding_balance by deltas ({customer_id: Decimal}) in one
+    UPDATE with F() arithmetic. Order and payment changes call this in their
+    transaction; reconcile_customer_balances repairs drift.
+    """
+    from customers.models import Customer
+    deltas = {customer_id: delta for customer_id, delta in deltas.items() if customer_id and delta}
+    if not deltas:
+        return
+    money = DecimalField(max_digits=14, decimal_places=2)
+    Customer.all_objects.filter(id__in=list(deltas)).update(
+        outstanding_balance=Case(
+            *[When(id=customer_id, then=F('outstanding_balance') + Value(delta, output_field=money))
+              for customer_id, delta in deltas.items()],
+            default=F('outstanding_balance'),
+            output_field=money,
+        ),
+    )
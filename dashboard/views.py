@@ -72,9 +72,9 @@ def _get_expiry_alert(today):
     # This avoids database-specific interval arithmetic logic
     products = Product.objects.filter(
         is_active=True,
-        expiry_date__isnull=False,
-        expiry_date__gte=today
-    ).values('expiry_date', 'expiry_alert_days')
+        next_expiry_date__isnull=False,
+        next_expiry_date__gte=today
+    ).values('next_expiry_date', 'expiry_alert_days')
 
     count = 0
     for p in products:
@@ -83,7 +83,7 @@ def _get_expiry_alert(today):
         # So: today >= expiry_date - alert_days
         # Which means: expiry_date <= today + alert_days
         limit_date = today + timedelta(days=p['expiry_alert_days'])
-        if p['expiry_date'] <= limit_date:
+        if p['next_expiry_date'] <= limit_date:
             count += 1
             
     return count
@@ -131,9 +131,8 @@ def _get_expiring_by_shop(today):
     delivered_status = OrderStatus.objects.filter(code=ORDER_DELIVERED).first()
     exp_products = Product.objects.filter(
         is_active=True,
-        expiry_date__isnull=False,
-        expiry_date__gte=today,
-        expiry_date__lte=two_days
+        next_expiry_date__gte=today,
+        next_expiry_date__lte=two_days
     )
 
     if not delivered_status or not exp_products.exists():
@@ -147,7 +146,7 @@ def _get_expiring_by_shop(today):
         )
         .values(
             'product__name',
-            'product__expiry_date',
+            'product__next_expiry_date',
             'order__customer__name',
             'order__customer__phone'
         )
@@ -163,11 +162,11 @@ def _get_expiring_by_shop(today):
         if remaining > 0:
             expiring_by_shop.append({
                 'product_name': item['product__name'],
-                'expiry_date': item['product__expiry_date'],
+                'expiry_date': item['product__next_expiry_date'],
                 'customer_name': item['order__customer__name'],
                 'phone': item['order__customer__phone'],
                 'remaining': remaining,
-                'days_left': (item['product__expiry_date'] - today).days,
+                'days_left': (item['product__next_expiry_date'] - today).days,
             })
 
     return sorted(
@@ -0,0 +1,23 @@
+"""
+Master data signals - keep cached promotions and status ids in sync with writes.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import OrderStatus, Promotion
+from .utils import ORDER_STATUS_IDS_KEY, invalidate_promotions
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def promotion_changed(sender, instance, **kwargs):
+    """Invalidate cached active promotions on any promotion write."""
+    invalidate_promotions()
+
+
+@receiver(post_save, sender=OrderStatus)
+@receiver(post_delete, sender=OrderStatus)
+def order_status_changed(sender, instance, **kwargs):
+    """Drop the cached code -> id map on any status write."""
+    cache.delete(ORDER_STATUS_IDS_KEY)
@@ -1,3 +1,25 @@
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from master_data.models import OrderStatus
+from master_data.utils import get_order_status_id
+
+
+class OrderStatusCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_status_ids_expire_without_shared_invalidation(self):
+        status = OrderStatus.objects.create(code='HELD', name_en='Held', name_my='Held')
+        self.assertEqual(get_order_status_id('HELD'), status.id)
+        # A change whose invalidation never reaches this process (e.g. another worker's memory cache)
+        OrderStatus.objects.filter(pk=status.pk).update(code='ON_HOLD')
+        self.assertEqual(get_order_status_id('HELD'), status.id)
+        with mock.patch('time.time', return_value=time.time() + settings.CACHE_VERSION_TIMEOUT + 1):
+            self.assertIsNone(get_order_status_id('HELD'))
+            self.assertEqual(get_order_status_id('ON_HOLD'), status.id)
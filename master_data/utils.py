@@ -1,7 +1,16 @@
 """
 Master Data utilities.
 """
+import uuid
+
 from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+PROMOTION_VERSION_KEY = 'master_data:promotion_version'
+ORDER_STATUS_IDS_KEY = 'master_data:order_status_ids'
 
 
 def has_transactional_data():
@@ -26,3 +35,55 @@ def has_transactional_data():
         except LookupError:
             continue
     return False
+
+
+def invalidate_promotions():
+    """Drop cached active promotions (now and again on commit, see core.pricing)."""
+    cache.set(PROMOTION_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+    transaction.on_commit(
+        lambda: cache.set(PROMOTION_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+    )
+
+
+def get_active_promotions(day=None):
+    """
+    Active promotions for day (default today), best discount first.
+    Cached per day under a version token; Promotion writes bump it and the
+    token expires after CACHE_VERSION_TIMEOUT (see core.pricing).
+    """
+    from master_data.models import Promotion
+    day = day or timezone.now().date()
+    version = cache.get(PROMOTION_VERSION_KEY)
+    if version is None:
+        cache.add(PROMOTION_VERSION_KEY, uuid.uuid4().hex, settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(PROMOTION_VERSION_KEY)
+    key = f'master_data:promotions:{version}:{day.isoformat()}'
+    promotions = cache.get(key)
+    if promotions is None:
+        promotions = list(Promotion.objects.filter(
+            is_active=True,
+            start_date__lte=day,
+            end_date__gte=day
+        ).order_by('-discount_percent'))
+        cache.set(key, promotions, settings.CACHE_VERSION_TIMEOUT)
+    return promotions
+
+
+def get_best_promotion(day=None):
+    """Highest-discount active promotion for day, or None."""
+    promotions = get_active_promotions(day)
+    return promotions[0] if promotions else None
+
+
+def get_order_status_id(code):
+    """
+    OrderStatus id for code from a cached {code: id} map. OrderStatus writes
+    clear it; the entry also expires after CACHE_VERSION_TIMEOUT, so processes
+    the clear doesn't reach (per-process cache) reload it. None if unknown.
+    """
+    from master_data.models import OrderStatus
+    status_ids = cache.get(ORDER_STATUS_IDS_KEY)
+    if status_ids is None:
+        status_ids = dict(OrderStatus.objects.values_list('code', 'id'))
+        cache.set(ORDER_STATUS_IDS_KEY, status_ids, settings.CACHE_VERSION_TIMEOUT)
+    return status_ids.get(code)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from common.concurrency import VersionedAdminMixin
 from .models import SalesOrder, OrderItem, Payment
 
 
@@ -13,7 +14,7 @@ class PaymentInline(admin.TabularInline):
 
 
 @admin.register(SalesOrder)
-class SalesOrderAdmin(admin.ModelAdmin):
+class SalesOrderAdmin(VersionedAdminMixin, admin.ModelAdmin):
     list_display = ['order_number', 'customer', 'status', 'total_amount', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['order_number', 'customer__name', 'customer__phone']
@@ -2,8 +2,12 @@ from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from common.idempotency import idempotent_response
 from orders.models import SalesOrder, Payment
-from orders.serializers import SalesOrderSerializer, CreateOrderSerializer, PaymentSerializer
+from orders.serializers import (
+    BulkPaymentSerializer, CreateOrderSerializer, OrderTransitionSerializer, PaymentAllocationSerializer,
+    PaymentSerializer, SalesOrderSerializer,
+)
 
 class SalesOrderViewSet(viewsets.ModelViewSet):
     """
@@ -25,6 +29,20 @@ class SalesOrderViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        """
+        Create an order through the order service. Send an Idempotency-Key header
+        so a retried request returns the first response instead of a second order.
+        """
+        return idempotent_response(request, 'orders.create', lambda: self._create_order(request))
+
+    def _create_order(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        data = SalesOrderSerializer(serializer.instance, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
         """Confirm the order."""
@@ -63,6 +81,40 @@ class SalesOrderViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """Move many orders to one status: {"orders": [id, ...], "status": "DELIVERED"}. Reports per-order failures."""
+        from orders.services import transition_orders
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = transition_orders(
+                serializer.validated_data['orders'], serializer.validated_data['status'], user=request.user,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_rows(self, request):
+        """
+        Bulk import: {"rows": [...]} or {"orders": [{..., "lines": [...]}]}, or a
+        CSV/JSON upload in "file". "dry_run": true validates only. Returns the per-row report.
+        """
+        from orders.imports import flatten_import_rows, import_orders, read_import_file
+        upload = request.FILES.get('file')
+        try:
+            if upload:
+                rows = read_import_file(upload, request.data.get('format'), name=upload.name)
+            else:
+                rows = flatten_import_rows(request.data.get('rows') or request.data.get('orders') or [])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        result = import_orders(rows, user=request.user, dry_run=dry_run)
+        code = status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK
+        return Response(result, status=code)
+
 class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.filter(deleted_at__isnull=True).order_by('-payment_date')
     serializer_class = PaymentSerializer
@@ -73,3 +125,35 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Record many payments in one transaction: {"payments": [{order, amount, ...}, ...]}."""
+        from orders.services import record_payments
+        serializer = BulkPaymentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            payments = record_payments(serializer.validated_data['payments'], user=request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(PaymentSerializer(payments, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def allocate(self, request):
+        """Spread one customer payment over outstanding orders (oldest first, or the given order list)."""
+        from orders.services import allocate_customer_payment
+        serializer = PaymentAllocationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            payments = allocate_customer_payment(
+                data['customer'], data['amount'],
+                payment_method=data.get('payment_method'),
+                order_ids=data.get('orders'),
+                reference_number=data.get('reference_number', ''),
+                notes=data.get('notes', ''),
+                user=request.user,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(PaymentSerializer(payments, many=True).data, status=status.HTTP_201_CREATED)
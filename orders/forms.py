@@ -5,6 +5,8 @@ from decimal import Decimal
 from django import forms
 from django.utils.translation import gettext_lazy as _
 from .models import SalesOrder, Payment
+from common.concurrency import VersionFormMixin
+from common.widgets import TypeaheadSelect
 from customers.models import Customer
 
 
@@ -16,7 +18,7 @@ class OrderCreateForm(forms.Form):
             deleted_at__isnull=True, is_active=True
         ).select_related('customer_type').order_by('name'),
         label='Customer',
-        widget=forms.Select(attrs={'class': 'form-select', 'id': 'customer_id'}),
+        widget=TypeaheadSelect('orders:customer_search', attrs={'class': 'form-select', 'id': 'customer_id'}),
     )
     is_pre_order = forms.BooleanField(
         required=False,
@@ -58,8 +60,8 @@ class OrderForm(forms.ModelForm):
         ).select_related('customer_type').order_by('name')
 
 
-class OrderUpdateForm(forms.ModelForm):
-    """Form for updating order status, delivery_date, notes."""
+class OrderUpdateForm(VersionFormMixin, forms.ModelForm):
+    """Form for updating order status, delivery_date, notes (versioned edits)."""
 
     class Meta:
         model = SalesOrder
@@ -0,0 +1,370 @@
+"""
+Bulk order import - route sales sheets (CSV or JSON) to orders.
+
+Every row is validated up front with batched customer/product/price lookups;
+valid orders are then written in chunked transactions with bulk_create (one
+number reservation, one stock call, one audit insert per chunk) instead of
+the per-order save/signal path. Rows sharing a ref form one order.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from common.audit import log_bulk_create
+from common.sequences import max_issued, reserve_numbers
+from core.models import Product
+from core.pricing import resolve_prices
+from core.services import deduct_stock_for_documents, reserve_stock_for_documents
+from customers.models import Customer
+from customers.services import apply_balance_deltas
+from master_data.constants import ORDER_PENDING
+from master_data.models import OrderStatus
+from master_data.utils import get_best_promotion
+from orders.models import OrderItem, SalesOrder
+from orders.services import reservation_expiry
+
+IMPORT_COLUMNS = ('ref', 'customer', 'product', 'quantity', 'order_type', 'discount_amount', 'notes')
+IMPORT_ORDER_TYPES = ('NORMAL', 'PRE_ORDER')
+IMPORT_CHUNK_SIZE = 200
+
+
+def read_import_file(fh, fmt=None, name=''):
+    """
+    Parse an import file into flat row dicts (IMPORT_COLUMNS).
+    CSV needs a header row. JSON is a list of rows, or of orders with a
+    "lines" list of {product, quantity} (order fields apply to every line).
+    fmt: 'csv' or 'json'; guessed from name when omitted.
+    Raises ValueError when the file cannot be parsed.
+    """
+    fmt = fmt or ('json' if name.lower().endswith('.json') else 'csv')
+    data = fh.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if fmt == 'json':
+        try:
+            parsed = json.loads(data)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        return flatten_import_rows(parsed)
+    reader = csv.DictReader(io.StringIO(data))
+    if not reader.fieldnames or 'product' not in reader.fieldnames:
+        raise ValueError("CSV needs a header row with at least customer, product and quantity columns.")
+    return [{key.strip(): (value or '').strip() for key, value in row.items() if key} for row in reader]
+
+
+def flatten_import_rows(data):
+    """Accept a list of rows or of orders with nested lines; return flat rows."""
+    if isinstance(data, dict):
+        data = data.get('rows') or data.get('orders') or []
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of rows or orders.")
+    rows = []
+    for index, entry in enumerate(data, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Entry {index} is not an object.")
+        if 'lines' in entry:
+            header = {key: value for key, value in entry.items() if key != 'lines'}
+            header.setdefault('ref', f"order-{index}")
+            for line in entry.get('lines') or []:
+                rows.append({**header, **(line if isinstance(line, dict) else {})})
+        else:
+            rows.append(entry)
+    return rows
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _lookup(model_qs, keys, field):
+    """
+    Resolve keys that are either the natural key (field) or an id, in one query.
+    Returns {key: instance or None}; a key matching several rows maps to None.
+    """
+    digit_keys = {key for key in keys if key.isdigit()}
+    found = {}
+    if not keys:
+        return found
+    matches = model_qs.filter(Q(**{f'{field}__in': list(keys)}) | Q(id__in=[int(k) for k in digit_keys]))
+    by_field, by_id = {}, {}
+    for obj in matches:
+        by_field.setdefault(getattr(obj, field), []).append(obj)
+        by_id[str(obj.id)] = obj
+    for key in keys:
+        natural = by_field.get(key, [])
+        if len(natural) == 1:
+            found[key] = natural[0]
+        elif not natural:
+            found[key] = by_id.get(key)
+        else:
+            found[key] = None
+    return found
+
+
+def _validate(rows):
+    """Group rows into orders, resolve references in bulk and collect errors per row."""
+    report = []
+    orders = {}
+    for number, row in enumerate(rows, start=1):
+        ref = _text(row.get('ref')) or f"row-{number}"
+        report.append({'row': number, 'ref': ref, 'status': 'pending', 'order_number': None, 'errors': []})
+        order = orders.setdefault(ref, {
+            'ref': ref,
+            'rows': [],
+            'customer': _text(row.get('customer')),
+            'order_type': (_text(row.get('order_type')) or 'NORMAL').upper(),
+            'discount_amount': _text(row.get('discount_amount')) or '0',
+            'notes': _text(row.get('notes')),
+            'lines': [],
+            'errors': [],
+        })
+        order['rows'].append(number)
+        customer_key = _text(row.get('customer'))
+        if customer_key and customer_key != order['customer']:
+            order['errors'].append(_("Rows of one order must have the same customer."))
+        quantity = _text(row.get('quantity'))
+        try:
+            quantity = int(quantity)
+            if quantity <= 0:
+                raise ValueError
+        except ValueError:
+            report[number - 1]['errors'].append(_("Invalid quantity."))
+            continue
+        order['lines'].append((number, _text(row.get('product')), quantity))
+
+    customers = _lookup(
+        Customer.objects.filter(is_active=True).select_related('township', 'customer_type'),
+        {order['customer'] for order in orders.values() if order['customer']}, 'phone',
+    )
+    products = _lookup(
+        Product.objects.filter(is_active=True),
+        {product_key for order in orders.values() for _row, product_key, _qty in order['lines'] if product_key},
+        'sku',
+    )
+    for order in orders.values():
+        order['customer_obj'] = customers.get(order['customer'])
+        if order['customer_obj'] is None:
+            order['errors'].append(_("Customer not found: %(key)s") % {'key': order['customer'] or '-'})
+        if order['order_type'] not in IMPORT_ORDER_TYPES:
+            order['errors'].append(_("Invalid order type: %(type)s") % {'type': order['order_type']})
+        try:
+            order['discount_amount'] = Decimal(order['discount_amount'])
+            if order['discount_amount'] < 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            order['errors'].append(_("Invalid discount amount."))
+        resolved = []
+        for number, product_key, quantity in order['lines']:
+            product = products.get(product_key)
+            if product is None:
+                report[number - 1]['errors'].append(_("Product not found: %(key)s") % {'key': product_key or '-'})
+            else:
+                resolved.append((number, product, quantity))
+        order['lines'] = resolved
+    return orders, report
+
+
+def _price(orders):
+    """Price valid orders: tier prices per customer type, delivery fee, promotion (as SalesOrder.save)."""
+    by_type = {}
+    for order in orders:
+        product_ids = by_type.setdefault(order['customer_obj'].customer_type_id, set())
+        product_ids.update(product.id for _row, product, _qty in order['lines'])
+    prices = {
+        customer_type_id: resolve_prices(list(product_ids), customer_type_id)
+        for customer_type_id, product_ids in by_type.items()
+    }
+    promotion = get_best_promotion()
+    for order in orders:
+        customer = order['customer_obj']
+        type_prices = prices[customer.customer_type_id]
+        merged = {}
+        for _row, product, quantity in order['lines']:
+            merged[product.id] = (product, merged.get(product.id, (product, 0))[1] + quantity)
+        order['items'] = [
+            (product, quantity, type_prices.get(product.id, product.base_price))
+            for product, quantity in merged.values()
+        ]
+        subtotal = sum((quantity * price for _p, quantity, price in order['items']), Decimal('0'))
+        discount = order['discount_amount']
+        if promotion and subtotal > 0:
+            discount = (subtotal * promotion.discount_percent / Decimal('100')).quantize(Decimal('0.01'))
+        delivery_fee = customer.township.delivery_fee if customer.township_id else Decimal('0')
+        order.update(
+            subtotal=subtotal, discount=discount, delivery_fee=delivery_fee, promotion=promotion,
+            total=subtotal - discount + delivery_fee,
+        )
+
+
+def _check_limits(orders, balances, available):
+    """
+    Walk orders in sheet order against running credit balances and stock.
+    balances: {customer_id: (outstanding, credit_limit)}; available: {product_id: qty}.
+    Returns the orders that fit; the others get an error.
+    """
+    accepted = []
+    for order in orders:
+        customer = order['customer_obj']
+        outstanding, limit = balances[customer.id]
+        if limit and limit > 0 and outstanding + order['total'] > limit:
+            order['errors'].append(
+                _("Credit limit exceeded. Outstanding: %(outstanding)s, New order: %(total)s, Limit: %(limit)s")
+                % {'outstanding': outstanding, 'total': order['total'], 'limit': limit}
+            )
+            continue
+        if order['order_type'] == 'NORMAL':
+            short = [
+                product for product, quantity, _unit in order['items'] if quantity > available.get(product.id, 0)
+            ]
+            if short:
+                order['errors'].append(
+                    _("Insufficient stock for %(products)s") % {'products': ', '.join(p.name for p in short)}
+                )
+                continue
+            for product, quantity, _unit in order['items']:
+                available[product.id] -= quantity
+        balances[customer.id] = (outstanding + order['total'], limit)
+        accepted.append(order)
+    return accepted
+
+
+def _write_chunk(orders, user, status):
+    """Create one chunk of orders in a transaction. Returns the orders created (credit rechecked under lock)."""
+    with transaction.atomic():
+        customer_ids = sorted({order['customer_obj'].id for order in orders})
+        balances = {
+            customer_id: (outstanding, limit)
+            for customer_id, outstanding, limit in Customer.all_objects.select_for_update()
+            .filter(id__in=customer_ids).order_by('id').values_list('id', 'outstanding_balance', 'credit_limit')
+        }
+        orders = _check_limits(orders, balances, available={
+            product.id: float('inf') for order in orders for product, _q, _p in order['items']
+        })
+        if not orders:
+            return []
+
+        prefix = getattr(settings, 'ORDER_NUMBER_PREFIX', 'ORD')
+        today = timezone.now().date()
+        day = today.strftime('%Y%m%d')
+        first, _last = reserve_numbers(
+            'ORDER', day, count=len(orders),
+            seed=lambda: max_issued(SalesOrder.all_objects, 'order_number', f"{prefix}-{day}-"),
+        )
+        sales_orders = []
+        for offset, order in enumerate(orders):
+            sales_orders.append(SalesOrder(
+                customer=order['customer_obj'],
+                order_number=f"{prefix}-{day}-{first + offset:04d}",
+                order_date=today,
+                status=status,
+                order_type=order['order_type'],
+                subtotal=order['subtotal'],
+                discount_amount=order['discount'],
+                delivery_fee=order['delivery_fee'],
+                applied_promotion=order['promotion'],
+                total_amount=order['total'],
+                notes=order['notes'],
+                created_by=user,
+            ))
+        SalesOrder.objects.bulk_create(sales_orders, batch_size=500)
+        items = []
+        for order, sales_order in zip(orders, sales_orders):
+            order['sales_order'] = sales_order
+            for product, quantity, price in order['items']:
+                items.append(OrderItem(
+                    order=sales_order, product=product, quantity=quantity,
+                    unit_price=price, total_price=quantity * price,
+                ))
+        OrderItem.objects.bulk_create(items, batch_size=1000)
+
+        def lines_by_order(order_type):
+            return {
+                order['sales_order'].id: [(product.id, quantity) for product, quantity, _p in order['items']]
+                for order in orders if order['order_type'] == order_type
+            }
+        deduct_stock_for_documents(lines_by_order('NORMAL'), 'SalesOrder', user=user)
+        reserve_stock_for_documents(
+            lines_by_order('PRE_ORDER'), 'SalesOrder',
+            expires_at=reservation_expiry(), allow_shortfall=True, user=user,
+        )
+        deltas = {}
+        for order in orders:
+            customer_id = order['customer_obj'].id
+            deltas[customer_id] = deltas.get(customer_id, Decimal('0')) + order['total']
+        apply_balance_deltas(deltas)
+        log_bulk_create(sales_orders + items, user=user)
+    return orders
+
+
+def import_orders(rows, user=None, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """
+    Import orders from flat rows (see IMPORT_COLUMNS; customer is a phone or
+    id, product a SKU or id). An order with any bad row is skipped as a whole.
+    Valid orders are created in chunks of chunk_size, each chunk in its own
+    transaction; a chunk that fails (e.g. stock taken meanwhile) is retried
+    one order at a time so only the failing orders are reported. dry_run validates without writing.
+    Returns: {'created', 'failed', 'valid', 'rows': [{row, ref, status, order_number, errors}]}.
+    """
+    orders, report = _validate(list(rows))
+    for order in orders.values():
+        if any(report[number - 1]['errors'] for number in order['rows']) and not order['errors']:
+            order['errors'].append(_("Order has invalid rows."))
+        if not order['lines'] and not order['errors']:
+            order['errors'].append(_("Order has no valid lines."))
+    candidates = [order for order in orders.values() if not order['errors']]
+    _price(candidates)
+
+    customers = {order['customer_obj'].id: order['customer_obj'] for order in candidates}
+    available = {
+        product.id: max(product.available_quantity, 0)
+        for order in candidates for product, _q, _p in order['items']
+    }
+    valid = _check_limits(
+        candidates,
+        {cid: (customer.outstanding_balance, customer.credit_limit) for cid, customer in customers.items()},
+        available,
+    )
+
+    created = []
+    if not dry_run and valid:
+        status = OrderStatus.get_by_code(ORDER_PENDING)
+        for start in range(0, len(valid), max(chunk_size, 1)):
+            chunk = valid[start:start + chunk_size]
+            errors = {order['ref']: list(order['errors']) for order in chunk}
+            try:
+                created.extend(_write_chunk(chunk, user, status))
+            except (ValueError, Product.DoesNotExist):
+                # Some order's stock failed the chunk: retry one by one to find it,
+                # dropping what the rolled back attempt recorded (e.g. credit errors)
+                for order in chunk:
+                    order['errors'] = errors[order['ref']]
+                    try:
+                        created.extend(_write_chunk([order], user, status))
+                    except (ValueError, Product.DoesNotExist) as e:
+                        order['errors'].append(str(e))
+
+    created_refs = {order['ref'] for order in created}
+    valid_refs = {order['ref'] for order in valid}
+    for order in orders.values():
+        for number in order['rows']:
+            entry = report[number - 1]
+            if order['ref'] in created_refs:
+                entry.update(status='created', order_number=order['sales_order'].order_number)
+            elif dry_run and order['ref'] in valid_refs:
+                entry['status'] = 'valid'
+            else:
+                entry['status'] = 'error'
+                entry['errors'] = entry['errors'] + [str(message) for message in order['errors']]
+    return {
+        'created': len(created),
+        'failed': len(orders) - (len(valid) if dry_run else len(created)),
+        'valid': len(valid),
+        'rows': report,
+    }
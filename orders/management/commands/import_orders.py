@@ -0,0 +1,66 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.imports import IMPORT_CHUNK_SIZE, import_orders, read_import_file
+
+
+class Command(BaseCommand):
+    help = 'Import orders from a route sales sheet (CSV or JSON); rows sharing a ref form one order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate every row without creating orders',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help=f'Orders per transaction (default: {IMPORT_CHUNK_SIZE})',
+        )
+        parser.add_argument('--user', help='Username recorded as the creator')
+        parser.add_argument('--report', help='Write the per-row report as JSON to this path')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User not found: {options['user']}")
+        try:
+            with open(options['path'], 'rb') as fh:
+                rows = read_import_file(fh, options['format'], name=options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Importing {len(rows)} rows...")
+        result = import_orders(
+            rows, user=user, chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+        )
+        for entry in result['rows']:
+            if entry['status'] == 'error':
+                self.stdout.write(self.style.WARNING(
+                    f"Row {entry['row']} ({entry['ref']}): {'; '.join(entry['errors'])}"
+                ))
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as fh:
+                json.dump(result, fh, ensure_ascii=False, indent=2)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Dry run: {result['valid']} orders valid, {result['failed']} with errors."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {result['created']} orders, {result['failed']} failed."
+            ))
@@ -0,0 +1,157 @@
+"""
+Delivery manifests - what goes on each van.
+
+Confirmed orders are grouped by delivery route (customer township's route)
+and dispatch date (delivery_date, else order_date). Each manifest carries a
+pick list (quantity per product for the whole route) and a drop list per
+stop (one stop per customer). Built from three grouped queries whatever the
+number of orders.
+"""
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from master_data.constants import ORDER_CONFIRMED
+from master_data.utils import get_order_status_id
+from orders.models import OrderItem, SalesOrder
+
+UNROUTED = None  # route key for customers without a township route
+
+
+def _manifest_orders(start, end, route_id=None, status_code=ORDER_CONFIRMED):
+    """Orders to dispatch between start and end (dates, inclusive), optionally on one route (0 = unrouted)."""
+    orders = SalesOrder.objects.filter(
+        Q(delivery_date__range=(start, end)) | Q(delivery_date__isnull=True, order_date__range=(start, end)),
+        status_id=get_order_status_id(status_code),
+    ).annotate(
+        run_date=Coalesce('delivery_date', 'order_date'),
+        route_id=F('customer__township__delivery_route_id'),
+    )
+    if route_id == 0:
+        orders = orders.filter(customer__township__delivery_route__isnull=True)
+    elif route_id:
+        orders = orders.filter(customer__township__delivery_route_id=route_id)
+    return orders
+
+
+def build_manifests(start, end=None, route_id=None, status_code=ORDER_CONFIRMED):
+    """
+    Manifests for orders dispatched from start to end (default: start only).
+    route_id: limit to one DeliveryRoute (0 = customers without a route).
+    Returns: list of dicts ordered by date and route name, each with date,
+    route_id, route_name, order_count, total_amount, amount_due, pick_list
+    [{product_id, name, sku, unit, quantity}] and stops [{customer_id, name,
+    phone, address, township, order_numbers, amount_due, lines [{product_id,
+    name, unit, quantity}]}] in township/customer order.
+    """
+    end = end or start
+    orders = _manifest_orders(start, end, route_id, status_code)
+    manifests = {}
+    stops = {}
+    for row in orders.values(
+        'id', 'order_number', 'run_date', 'route_id', 'customer_id', 'total_amount', 'paid_amount',
+        route_name=F('customer__township__delivery_route__name_en'),
+        customer_name=F('customer__name'),
+        customer_phone=F('customer__phone'),
+        customer_address=F('customer__street_address'),
+        township=F('customer__township__name_en'),
+    ).order_by('run_date', 'township', 'customer_name', 'id'):
+        key = (row['run_date'], row['route_id'])
+        manifest = manifests.get(key)
+        if manifest is None:
+            manifest = manifests[key] = {
+                'date': row['run_date'],
+                'route_id': row['route_id'],
+                'route_name': row['route_name'] or '',
+                'order_count': 0,
+                'total_amount': Decimal('0'),
+                'amount_due': Decimal('0'),
+                'pick_list': [],
+                'stops': [],
+            }
+        due = row['total_amount'] - row['paid_amount']
+        manifest['order_count'] += 1
+        manifest['total_amount'] += row['total_amount']
+        manifest['amount_due'] += due
+        stop = stops.get(key + (row['customer_id'],))
+        if stop is None:
+            stop = stops[key + (row['customer_id'],)] = {
+                'customer_id': row['customer_id'],
+                'name': row['customer_name'],
+                'phone': row['customer_phone'],
+                'address': row['customer_address'],
+                'township': row['township'] or '',
+                'order_numbers': [],
+                'amount_due': Decimal('0'),
+                'lines': [],
+            }
+            manifest['stops'].append(stop)
+        stop['order_numbers'].append(row['order_number'])
+        stop['amount_due'] += due
+    if not manifests:
+        return []
+
+    items = OrderItem.objects.filter(order__in=orders.values('id')).annotate(
+        run_date=Coalesce('order__delivery_date', 'order__order_date'),
+        route_id=F('order__customer__township__delivery_route_id'),
+    )
+    product_fields = {
+        'name': F('product__name'),
+        'sku': F('product__sku'),
+        'unit': F('product__unit__name_en'),
+    }
+    for row in items.values('run_date', 'route_id', 'product_id', **product_fields).annotate(
+        quantity=Sum('quantity'),
+    ).order_by('run_date', 'route_id', 'name'):
+        manifest = manifests.get((row['run_date'], row['route_id']))
+        if manifest is not None:
+            manifest['pick_list'].append({
+                'product_id': row['product_id'], 'name': row['name'], 'sku': row['sku'],
+                'unit': row['unit'] or '', 'quantity': row['quantity'],
+            })
+    for row in items.values(
+        'run_date', 'route_id', 'product_id', customer_id=F('order__customer_id'), **product_fields
+    ).annotate(quantity=Sum('quantity')).order_by('name'):
+        stop = stops.get((row['run_date'], row['route_id'], row['customer_id']))
+        if stop is not None:
+            stop['lines'].append({
+                'product_id': row['product_id'], 'name': row['name'],
+                'unit': row['unit'] or '', 'quantity': row['quantity'],
+            })
+
+    # Routed manifests by route name, unrouted last on each day
+    return sorted(
+        manifests.values(),
+        key=lambda m: (m['date'], m['route_id'] is UNROUTED, m['route_name']),
+    )
+
+
+def manifest_rows(manifests, kind='pick'):
+    """
+    Flatten manifests for the export layer.
+    kind: 'pick' (one row per route and product) or 'drop' (one row per stop and product).
+    Returns: (headers, rows).
+    """
+    if kind == 'drop':
+        headers = ['Date', 'Route', 'Stop #', 'Customer', 'Phone', 'Township', 'Orders', 'Item', 'Qty', 'Amount Due']
+        rows = []
+        for manifest in manifests:
+            for number, stop in enumerate(manifest['stops'], start=1):
+                for index, line in enumerate(stop['lines']):
+                    first = index == 0
+                    rows.append([
+                        manifest['date'].isoformat(), manifest['route_name'] or '-', number,
+                        stop['name'] if first else '', stop['phone'] if first else '',
+                        stop['township'] if first else '',
+                        ', '.join(stop['order_numbers']) if first else '',
+                        line['name'], line['quantity'], str(stop['amount_due']) if first else '',
+                    ])
+        return headers, rows
+    headers = ['Date', 'Route', 'Product', 'SKU', 'Unit', 'Qty']
+    rows = [
+        [manifest['date'].isoformat(), manifest['route_name'] or '-', line['name'], line['sku'], line['unit'],
+         line['quantity']]
+        for manifest in manifests for line in manifest['pick_list']
+    ]
+    return headers, rows
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_alter_salesorder_order_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesorder',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:46
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def fill_has_active_return(apps, schema_editor):
+    """Flag orders that already have a non-deleted return request."""
+    SalesOrder = apps.get_model('orders', 'SalesOrder')
+    ReturnRequest = apps.get_model('returns', 'ReturnRequest')
+    SalesOrder.objects.update(has_active_return=Exists(
+        ReturnRequest.objects.filter(order=OuterRef('pk'), deleted_at__isnull=True)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_salesorder_version'),
+        ('returns', '0005_returnrequest_replacement_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesorder',
+            name='has_active_return',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Has active return'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['status', 'has_active_return', 'created_at'], name='orders_sale_status__cfd2dc_idx'),
+        ),
+        migrations.RunPython(fill_has_active_return, migrations.RunPython.noop),
+    ]
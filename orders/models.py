@@ -1,12 +1,13 @@
 from decimal import Decimal
 
-from django.db import models, transaction
+from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Sum, F
 from customers.models import Customer
 from core.models import Product
-from master_data.models import OrderStatus, Promotion
+from master_data.models import OrderStatus
+from master_data.utils import get_best_promotion
 from common.models import SoftDeleteMixin
 
 
@@ -46,6 +47,10 @@ class SalesOrder(SoftDeleteMixin):
     created_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, verbose_name=_("Recorded by"))
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every edit; edits compare-and-swap it (common.concurrency)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Set while the order has a non-deleted return request (returns.signals keeps it in sync)
+    has_active_return = models.BooleanField(_("Has active return"), default=False, editable=False)
 
     class Meta:
         verbose_name = _("Order")
@@ -58,6 +63,7 @@ class SalesOrder(SoftDeleteMixin):
             models.Index(fields=['order_type']),
             models.Index(fields=['deleted_at']),
             models.Index(fields=['delivery_date']),
+            models.Index(fields=['status', 'has_active_return', 'created_at']),
         ]
 
     def __str__(self):
@@ -97,28 +103,51 @@ class SalesOrder(SoftDeleteMixin):
             )
         super().soft_delete()
 
+    # Kept by payment/return signal UPDATEs that don't bump version; edits never write them
+    SERVICE_FIELDS = ('paid_amount', 'has_active_return')
+
+    # Inputs of the total; saves that change none of them skip the pricing logic
+    PRICING_FIELDS = ('customer', 'order_type', 'subtotal', 'discount_amount', 'delivery_fee', 'applied_promotion')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded pricing inputs so save() can tell whether totals need recalculating."""
+        instance = super().from_db(db, field_names, values)
+        instance._remember_pricing()
+        return instance
+
+    def _remember_pricing(self):
+        self._loaded_pricing = {
+            name: self.__dict__.get(self._meta.get_field(name).attname) for name in self.PRICING_FIELDS
+        }
+
+    def _pricing_changed(self, update_fields):
+        if update_fields is not None:
+            names = {self._meta.get_field(name).name for name in update_fields}
+            return bool(names.intersection(self.PRICING_FIELDS))
+        loaded = getattr(self, '_loaded_pricing', None)
+        if self._state.adding or loaded is None:
+            return True
+        return any(
+            getattr(self, self._meta.get_field(name).attname) != loaded[name] for name in self.PRICING_FIELDS
+        )
+
     def save(self, *args, **kwargs):
-        """Auto-calculate delivery fee and apply promotions"""
-        # Skip auto-calculations for replacement orders
-        if self.order_type == 'REPLACEMENT':
+        """Auto-calculate delivery fee and apply promotions (only when pricing inputs changed)"""
+        update_fields = kwargs.get('update_fields')
+        # Skip auto-calculations for replacement orders and status/payment-only saves
+        if self.order_type == 'REPLACEMENT' or not self._pricing_changed(update_fields):
             super().save(*args, **kwargs)
+            self._remember_pricing()
             return
 
         # Calculate delivery fee from customer's township
         if self.customer and self.customer.township and not self.delivery_fee:
             self.delivery_fee = self.customer.township.delivery_fee
         
-        # Apply best active promotion if not already applied
-        if not self.applied_promotion:
-            today = timezone.now().date()
-            active_promotions = Promotion.objects.filter(
-                is_active=True,
-                start_date__lte=today,
-                end_date__gte=today
-            ).order_by('-discount_percent')
-
-            # Optimize: Use slice to get first item in one query instead of exists() + first()
-            best_promotion = active_promotions.first()
+        # Apply best active promotion if not already applied (cached per day)
+        if not self.applied_promotion_id:
+            best_promotion = get_best_promotion()
             if best_promotion:
                 self.applied_promotion = best_promotion
                 # Apply discount to subtotal (use Decimal for precision)
@@ -130,8 +159,13 @@ class SalesOrder(SoftDeleteMixin):
         
         # Recalculate total with delivery fee
         self.total_amount = self.subtotal - self.discount_amount + self.delivery_fee
-        
+
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                'delivery_fee', 'applied_promotion', 'discount_amount', 'total_amount'
+            }
         super().save(*args, **kwargs)
+        self._remember_pricing()
 
 
 class OrderItem(models.Model):
@@ -190,20 +224,44 @@ class Payment(SoftDeleteMixin):
     def __str__(self):
         return f"{self.voucher_number} - {self.amount}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember what this payment contributed to paid_amount, so signals can apply only the delta."""
+        instance = super().from_db(db, field_names, values)
+        instance._remember_paid_effect()
+        return instance
+
+    def paid_effect(self):
+        """Amount this payment adds to its order's paid_amount: {order_id: amount}."""
+        if self.deleted_at or not self.order_id:
+            return {}
+        return {self.order_id: Decimal(str(self.amount))}
+
+    def _remember_paid_effect(self):
+        self._loaded_paid_effect = self.paid_effect()
+
+    @staticmethod
+    def _voucher_seed(day):
+        from common.sequences import max_issued
+        return lambda: max_issued(Payment.all_objects, 'voucher_number', f"PV-{day}-")
+
+    @classmethod
+    def assign_voucher_numbers(cls, payments):
+        """Number unnumbered payments from one DocumentSequence reservation (for bulk_create)."""
+        from common.sequences import reserve_numbers
+        pending = [payment for payment in payments if not payment.voucher_number]
+        if not pending:
+            return
+        day = timezone.now().date().strftime('%Y%m%d')
+        first, _last = reserve_numbers('PAYMENT', day, len(pending), seed=cls._voucher_seed(day))
+        for offset, payment in enumerate(pending):
+            payment.voucher_number = f"PV-{day}-{first + offset:04d}"
+
     def save(self, *args, **kwargs):
-        # Auto-generate voucher number if not set (atomic to prevent collision)
+        # Auto-generate voucher number if not set (from the day's DocumentSequence)
         if not self.voucher_number:
-            today = timezone.now().date()
-            with transaction.atomic():
-                last = Payment.objects.filter(
-                    payment_date=today
-                ).select_for_update().order_by('-id').first()
-                if last and last.voucher_number:
-                    try:
-                        seq = int(last.voucher_number.split('-')[-1]) + 1
-                    except (ValueError, IndexError):
-                        seq = 1
-                else:
-                    seq = 1
-                self.voucher_number = f"PV-{today.strftime('%Y%m%d')}-{seq:04d}"
+            from common.sequences import next_number
+            day = timezone.now().date().strftime('%Y%m%d')
+            seq = next_number('PAYMENT', day, seed=self._voucher_seed(day))
+            self.voucher_number = f"PV-{day}-{seq:04d}"
         super().save(*args, **kwargs)
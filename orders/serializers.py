@@ -1,7 +1,12 @@
+from decimal import Decimal
+
 from rest_framework import serializers
+from common.concurrency import VersionedSerializerMixin
 from orders.models import SalesOrder, OrderItem, Payment
 from core.serializers import ProductSerializer
+from customers.models import Customer
 from customers.serializers import CustomerSerializer
+from master_data.constants import ORDER_CANCELLED, ORDER_CONFIRMED, ORDER_DELIVERED
 from master_data.models import OrderStatus, PaymentMethod
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -36,7 +41,38 @@ class PaymentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['voucher_number', 'created_at', 'created_by']
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class PaymentEntrySerializer(serializers.Serializer):
+    """One collection in a bulk payment request."""
+    order = serializers.PrimaryKeyRelatedField(queryset=SalesOrder.objects.all())
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    payment_method = serializers.PrimaryKeyRelatedField(
+        queryset=PaymentMethod.objects.filter(is_active=True), required=False, allow_null=True
+    )
+    payment_date = serializers.DateField(required=False)
+    reference_number = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+
+class BulkPaymentSerializer(serializers.Serializer):
+    payments = PaymentEntrySerializer(many=True, allow_empty=False)
+
+class PaymentAllocationSerializer(serializers.Serializer):
+    """One amount from a customer, spread over their outstanding orders."""
+    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all())
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    payment_method = serializers.PrimaryKeyRelatedField(
+        queryset=PaymentMethod.objects.filter(is_active=True), required=False, allow_null=True
+    )
+    orders = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    reference_number = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """Many orders moved to one status (see orders.services.ORDER_TRANSITIONS)."""
+    orders = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=[ORDER_CONFIRMED, ORDER_DELIVERED, ORDER_CANCELLED])
+
+class SalesOrderSerializer(VersionedSerializerMixin, serializers.ModelSerializer):
     customer_detail = CustomerSerializer(source='customer', read_only=True)
     items = OrderItemSerializer(source='orderitem_set', many=True, read_only=True)
     status_detail = OrderStatusSimpleSerializer(source='status', read_only=True)
@@ -67,46 +103,38 @@ class CreateOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = SalesOrder
         fields = [
-            'customer', 'order_date', 'delivery_date', 
-            'order_type', 'notes', 'items'
+            'customer', 'order_date', 'delivery_date',
+            'order_type', 'discount_amount', 'notes', 'items'
+        ]
+
+    def validate(self, attrs):
+        """Validate and price items with the shared order-line parser (tier prices, stock check)."""
+        from orders.services import parse_order_lines
+        rows = [
+            (item.get('product') or item.get('product_id'), item.get('quantity', 1))
+            for item in attrs['items']
         ]
+        order_items, errors = parse_order_lines(rows, attrs['customer'], attrs.get('order_type', 'NORMAL'))
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+        if not order_items:
+            raise serializers.ValidationError({'items': ['Add at least one product.']})
+        attrs['items'] = order_items
+        return attrs
 
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        
-        # Auto-generate order number (simplified logic for API)
-        import uuid
-        from django.utils import timezone
-        
-        # In real app, reuse the generation logic from services or views
-        prefix = timezone.now().strftime('%Y%m%d')
-        unique_id = str(uuid.uuid4())[:6].upper()
-        validated_data['order_number'] = f"SO-{prefix}-{unique_id}"
-        
-        order = SalesOrder.objects.create(**validated_data)
-        
-        # Create items
-        total = 0
-        for item_data in items_data:
-            # item_data should contain 'product_id' and 'quantity'
-            from core.models import Product
-            product_id = item_data.get('product') or item_data.get('product_id')
-            qty = item_data.get('quantity', 1)
-            
-            product = Product.objects.get(pk=product_id)
-            unit_price = product.base_price # Use base_price from product
-            total_price = unit_price * qty
-            
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=qty,
-                unit_price=unit_price,
-                total_price=total_price
+        """Create through the order service (numbering, credit check, stock deduction or reservation)."""
+        from orders.services import create_order_from_request
+        try:
+            return create_order_from_request(
+                validated_data['customer'],
+                validated_data['items'],
+                validated_data.get('order_type') or 'NORMAL',
+                validated_data.get('discount_amount') or Decimal('0'),
+                validated_data.get('notes', ''),
+                user=validated_data.get('created_by'),
+                order_date=validated_data.get('order_date'),
+                delivery_date=validated_data.get('delivery_date'),
             )
-            total += total_price
-            
-        # Update order totals (save() method handles logic but we need to trigger it properly)
-        order.subtotal = total
-        order.save() # This triggers calculate delivery fee and promotion
-        return order
+        except ValueError as e:
+            raise serializers.ValidationError({'non_field_errors': [str(e)]})
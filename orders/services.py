@@ -2,17 +2,40 @@
 Order services - create, confirm, deliver, payment, cancel.
 Business logic lives here; views stay thin.
 """
+from datetime import timedelta
 from decimal import Decimal
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Sum, F
+from django.db.models import (
+    Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.core.exceptions import ObjectDoesNotExist
 
+from common.audit import log_bulk_create, log_bulk_update
+from common.sequences import max_issued, next_number
+from customers.models import Customer
+from customers.services import apply_balance_deltas
 from orders.models import SalesOrder, OrderItem, Payment
 from core.models import Product
-from core.services import deduct_stock, restore_stock
+from core.pricing import resolve_prices
+from core.services import (
+    convert_reservations,
+    convert_reservations_for_documents,
+    deduct_stock_many,
+    move_document_stock,
+    release_reservations,
+    release_reservations_for_documents,
+    replace_reservations,
+    reserve_stock_many,
+    restore_stock_for_documents,
+    restore_stock_many,
+)
 from master_data.models import OrderStatus
+from returns.models import ReturnItem
+from reports.rollups import record_deliveries
+from master_data.utils import get_best_promotion, get_order_status_id
 from master_data.constants import (
     ORDER_PENDING,
     ORDER_CONFIRMED,
@@ -24,132 +47,261 @@ from master_data.constants import (
 
 def restore_stock_for_deleted_order(order, user=None):
     """Restore stock for order items when order is deleted. Use core.services."""
-    for item in order.orderitem_set.all():
-        restore_stock(
-            product_id=item.product.id,
-            quantity=item.quantity,
-            reference_type='SalesOrder',
-            reference_id=order.id,
-            user=user,
-        )
+    restore_stock_many(
+        [(item.product_id, item.quantity) for item in order.orderitem_set.all()],
+        reference_type='SalesOrder',
+        reference_id=order.id,
+        user=user,
+    )
+
+
+def release_order_reservations(order):
+    """Release stock reserved for an undelivered PRE_ORDER (order cancelled or deleted)."""
+    return release_reservations('SalesOrder', order.id)
 
 
-def parse_order_items_from_post(post_data, customer, order_type):
+def reservation_expiry():
+    """Expiry for new pre-order reservations (None = never expire)."""
+    days = getattr(settings, 'PRE_ORDER_RESERVATION_DAYS', 0)
+    return timezone.now() + timedelta(days=days) if days else None
+
+
+def parse_order_lines(rows, customer, order_type, held=None):
     """
-    Parse product_id and quantity from POST data, validate, and build order_items list.
-    Returns (order_items, parse_errors, stock_errors).
+    Validate and price raw order lines in a constant number of queries.
+    rows: iterable of (product_id, quantity) as submitted (strings or ints).
+    held: {product_id: quantity} the order already holds (updates), counted as available.
+    Lines for the same product are merged. Stock is checked for NORMAL orders only.
+    Returns (order_items, errors); each error is a dict with row (1-based, 0 for a
+    merged product line), product_id, code and message.
     """
-    product_ids = post_data.getlist('product_id')
-    quantities = post_data.getlist('quantity')
-    order_items = []
-    parse_errors = []
-    stock_errors = []
-
-    for i, product_id in enumerate(product_ids):
-        if i >= len(quantities) or not quantities[i]:
-            parse_errors.append(_('Row %(row)s: quantity is required.') % {'row': i + 1})
+    held = held or {}
+    errors = []
+    merged = {}
+    first_row = {}
+
+    def error(row, product_id, code, message):
+        errors.append({'row': row, 'product_id': product_id, 'code': code, 'message': str(message)})
+
+    parsed = []
+    for row, (product_id, quantity) in enumerate(rows, start=1):
+        if quantity in (None, ''):
+            error(row, product_id, 'quantity_required', _('Row %(row)s: quantity is required.') % {'row': row})
             continue
         try:
-            quantity = int(quantities[i])
+            quantity = int(quantity)
         except (ValueError, TypeError):
-            parse_errors.append(_('Row %(row)s: invalid quantity.') % {'row': i + 1})
+            error(row, product_id, 'invalid_quantity', _('Row %(row)s: invalid quantity.') % {'row': row})
             continue
         if quantity <= 0:
-            parse_errors.append(_('Row %(row)s: quantity must be positive.') % {'row': i + 1})
+            error(
+                row, product_id, 'invalid_quantity',
+                _('Row %(row)s: quantity must be positive.') % {'row': row},
+            )
             continue
-
         try:
-            product = Product.objects.get(pk=product_id, is_active=True)
-        except (ObjectDoesNotExist, ValueError):
-            parse_errors.append(
-                _('Row %(row)s: product not found or inactive.') % {'row': i + 1}
+            parsed.append((row, int(product_id), quantity))
+        except (ValueError, TypeError):
+            error(
+                row, product_id, 'product_not_found',
+                _('Row %(row)s: product not found or inactive.') % {'row': row},
             )
-            continue
 
-        unit_price = product.get_price_for_customer_type(customer.customer_type)
-        total_price = quantity * unit_price
+    products = Product.objects.in_bulk({product_id for _row, product_id, _qty in parsed})
+    for row, product_id, quantity in parsed:
+        product = products.get(product_id)
+        if product is None or not product.is_active:
+            error(
+                row, product_id, 'product_not_found',
+                _('Row %(row)s: product not found or inactive.') % {'row': row},
+            )
+            continue
+        merged[product_id] = merged.get(product_id, 0) + quantity
+        first_row.setdefault(product_id, row)
 
-        if order_type == 'NORMAL' and quantity > product.stock_quantity:
-            stock_errors.append(
+    # Prices come from the cached price matrix (no per-line tier query)
+    prices = resolve_prices(list(merged), customer.customer_type_id)
+    order_items = []
+    for product_id, quantity in merged.items():
+        product = products[product_id]
+        unit_price = prices.get(product_id, product.base_price)
+        # Available-to-promise: stock held for pre-orders is not available
+        available = max(product.available_quantity, 0) + held.get(product_id, 0)
+        if order_type == 'NORMAL' and quantity > available:
+            error(
+                first_row[product_id], product_id, 'insufficient_stock',
                 _('Quantity %(qty)s for %(product)s exceeds available stock %(stock)s')
-                % {'qty': quantity, 'product': product.name, 'stock': product.stock_quantity}
+                % {'qty': quantity, 'product': product.name, 'stock': available},
             )
-
         order_items.append({
             'product': product,
             'quantity': quantity,
             'unit_price': unit_price,
-            'total_price': total_price,
+            'total_price': quantity * unit_price,
         })
+    return order_items, errors
 
+
+def parse_order_items_from_post(post_data, customer, order_type, held=None):
+    """
+    Parse product_id and quantity from POST data, validate, and build order_items list.
+    Returns (order_items, parse_errors, stock_errors) as message lists.
+    """
+    product_ids = post_data.getlist('product_id')
+    quantities = post_data.getlist('quantity')
+    rows = [
+        (product_id, quantities[i] if i < len(quantities) else None)
+        for i, product_id in enumerate(product_ids)
+    ]
+    order_items, errors = parse_order_lines(rows, customer, order_type, held=held)
+    parse_errors = [e['message'] for e in errors if e['code'] != 'insufficient_stock']
+    stock_errors = [e['message'] for e in errors if e['code'] == 'insufficient_stock']
     return order_items, parse_errors, stock_errors
 
 
+def order_totals(customer, subtotal, order_type, discount_amount=0):
+    """
+    Discount, delivery fee, promotion and total an order will be saved with,
+    the same way SalesOrder.save prices it. Both the quote and the credit
+    check in create_order_from_request use this total.
+    Returns: (discount, delivery_fee, promotion or None, total).
+    """
+    delivery_fee = customer.township.delivery_fee if customer.township_id else Decimal('0')
+    discount = Decimal(str(discount_amount or 0))
+    promotion = get_best_promotion() if order_type != 'REPLACEMENT' else None
+    if promotion and subtotal > 0:
+        # Same rule as SalesOrder.save: the promotion replaces the manual discount
+        discount = (subtotal * promotion.discount_percent / Decimal('100')).quantize(Decimal('0.01'))
+    return discount, delivery_fee, promotion, subtotal - discount + delivery_fee
+
+
+def quote_order(customer, rows, order_type='NORMAL', discount_amount=0, held=None):
+    """
+    Price and check a cart without saving anything: lines, availability,
+    delivery fee, promotion, totals and credit headroom, the same way
+    create_order_from_request and SalesOrder.save would. Uses the batched
+    line parser and the cached price/promotion lookups.
+    rows: iterable of (product_id, quantity). Returns a dict; 'ok' is False
+    when any error (line or credit limit) would make the order fail.
+    """
+    order_items, errors = parse_order_lines(rows, customer, order_type, held=held)
+    held = held or {}
+    short = {e['product_id'] for e in errors if e['code'] == 'insufficient_stock'}
+    lines = []
+    for item in order_items:
+        product = item['product']
+        lines.append({
+            'product_id': product.id,
+            'name': product.name,
+            'quantity': item['quantity'],
+            'unit_price': item['unit_price'],
+            'total_price': item['total_price'],
+            'available': max(product.available_quantity, 0) + held.get(product.id, 0),
+            'in_stock': product.id not in short,
+        })
+
+    subtotal = sum((item['total_price'] for item in order_items), Decimal('0'))
+    discount, delivery_fee, promotion, total = order_totals(customer, subtotal, order_type, discount_amount)
+
+    credit_limit = customer.credit_limit or Decimal('0')
+    outstanding = customer.outstanding_balance
+    headroom = None
+    if credit_limit > 0:
+        headroom = credit_limit - outstanding - total
+        if headroom < 0:
+            errors.append({
+                'row': 0, 'product_id': None, 'code': 'credit_limit_exceeded',
+                'message': str(_('Credit limit exceeded. Outstanding: %(outstanding)s, New order: %(total)s, '
+                                 'Limit: %(limit)s') % {
+                    'outstanding': outstanding, 'total': total, 'limit': credit_limit,
+                }),
+            })
+
+    return {
+        'ok': not errors and bool(lines),
+        'lines': lines,
+        'errors': errors,
+        'subtotal': subtotal,
+        'discount_amount': discount,
+        'delivery_fee': delivery_fee,
+        'promotion': {
+            'id': promotion.id, 'name': str(promotion), 'discount_percent': promotion.discount_percent,
+        } if promotion else None,
+        'total_amount': total,
+        'credit': {
+            'limit': credit_limit if credit_limit > 0 else None,
+            'outstanding': outstanding,
+            'headroom': headroom,
+        },
+    }
+
+
 def get_next_order_number():
     """
     Generate order number: PREFIX-YYYYMMDD-NNNN.
-    Atomic to prevent collision when multiple requests create orders.
+    Taken from the day's DocumentSequence row, so concurrent orders don't serialize on a range scan.
     """
-    from django.conf import settings
     prefix = getattr(settings, 'ORDER_NUMBER_PREFIX', 'ORD')
-    today = timezone.now().date()
-    last_order = SalesOrder.all_objects.filter(
-        order_date=today
-    ).select_for_update().order_by('-id').first()
-    if last_order and last_order.order_number:
-        try:
-            seq = int(last_order.order_number.split('-')[-1]) + 1
-        except (ValueError, IndexError):
-            seq = 1
-    else:
-        seq = 1
-    return f"{prefix}-{today.strftime('%Y%m%d')}-{seq:04d}"
+    day = timezone.now().date().strftime('%Y%m%d')
+    seq = next_number(
+        'ORDER', day,
+        seed=lambda: max_issued(SalesOrder.all_objects, 'order_number', f"{prefix}-{day}-"),
+    )
+    return f"{prefix}-{day}-{seq:04d}"
 
 
 def get_outstanding_for_credit_check(customer):
-    """Sum of (total_amount - paid_amount) for non-cancelled, non-deleted orders."""
-    result = (
-        SalesOrder.objects.filter(customer=customer, deleted_at__isnull=True)
-        .exclude(status__code=ORDER_CANCELLED)
-        .aggregate(total=Sum(F('total_amount') - F('paid_amount')))
+    """
+    Customer's maintained outstanding balance (unpaid total of non-cancelled,
+    non-deleted orders), read with a row lock. Call inside a transaction.
+    """
+    return (
+        Customer.all_objects.select_for_update()
+        .values_list('outstanding_balance', flat=True)
+        .get(pk=customer.pk)
     )
-    return result['total'] or Decimal('0')
 
 
 def create_order_from_request(
-    customer, order_items, order_type, discount_amount, notes, user=None
+    customer, order_items, order_type, discount_amount, notes, user=None,
+    order_date=None, delivery_date=None,
 ):
     """
-    Create order with items. Validates stock, credit limit, deducts inventory.
+    Create order with items. Validates stock, credit limit, deducts inventory
+    (NORMAL) or reserves it until delivery (PRE_ORDER).
     order_items: list of dict with keys: product, quantity, unit_price, total_price
     order_type: 'NORMAL' or 'PRE_ORDER'
+    order_date defaults to today.
     Returns: SalesOrder. Raises: ValueError on validation failure
     """
     if not order_items:
         raise ValueError("Add at least one product.")
 
-    subtotal = sum(item['total_price'] for item in order_items)
-    delivery_fee = customer.township.delivery_fee if customer.township else Decimal('0')
-    total_amount = subtotal - Decimal(str(discount_amount)) + delivery_fee
-
-    # Credit limit check (skip if credit_limit is 0 = unlimited)
-    if customer.credit_limit and customer.credit_limit > 0:
-        outstanding = get_outstanding_for_credit_check(customer)
-        if outstanding + total_amount > customer.credit_limit:
-            msg = (
-                f"Credit limit exceeded. Outstanding: {outstanding}, "
-                f"New order: {total_amount}, Limit: {customer.credit_limit}"
-            )
-            raise ValueError(msg)
+    subtotal = sum((item['total_price'] for item in order_items), Decimal('0'))
+    discount_amount, _delivery_fee, _promotion, total_amount = order_totals(
+        customer, subtotal, order_type, discount_amount
+    )
 
     with transaction.atomic():
+        # Credit limit check (skip if credit_limit is 0 = unlimited). The customer
+        # row stays locked until the order is in, so concurrent orders can't both pass.
+        if customer.credit_limit and customer.credit_limit > 0:
+            outstanding = get_outstanding_for_credit_check(customer)
+            if outstanding + total_amount > customer.credit_limit:
+                msg = (
+                    f"Credit limit exceeded. Outstanding: {outstanding}, "
+                    f"New order: {total_amount}, Limit: {customer.credit_limit}"
+                )
+                raise ValueError(msg)
+
         pending_status = OrderStatus.get_by_code(ORDER_PENDING)
         order_number = get_next_order_number()
 
         order = SalesOrder.objects.create(
             customer=customer,
             order_number=order_number,
-            order_date=timezone.now().date(),
+            order_date=order_date or timezone.now().date(),
+            delivery_date=delivery_date,
             subtotal=subtotal,
             discount_amount=discount_amount,
             total_amount=total_amount,
@@ -159,135 +311,144 @@ def create_order_from_request(
             created_by=user,
         )
 
-        for item in order_items:
-            product = item['product']
-            quantity = item['quantity']
-            unit_price = item['unit_price']
-            total_price = item['total_price']
-
-            OrderItem.objects.create(
+        items = OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=product,
-                quantity=quantity,
-                unit_price=unit_price,
-                total_price=total_price,
+                product=item['product'],
+                quantity=item['quantity'],
+                unit_price=item['unit_price'],
+                total_price=item['total_price'],
+            )
+            for item in order_items
+        ])
+        log_bulk_create(items, user=user)
+
+        lines = [(item['product'].id, item['quantity']) for item in order_items]
+        if order_type == 'NORMAL':
+            deduct_stock_many(
+                lines,
+                reference_type='SalesOrder',
+                reference_id=order.id,
+                user=user,
+            )
+        elif order_type == 'PRE_ORDER':
+            # Pre-orders may exceed stock; the reservation still keeps
+            # NORMAL orders from selling what is promised to them.
+            reserve_stock_many(
+                lines,
+                reference_type='SalesOrder',
+                reference_id=order.id,
+                expires_at=reservation_expiry(),
+                allow_shortfall=True,
+                user=user,
             )
-
-            if order_type == 'NORMAL':
-                deduct_stock(
-                    product_id=product.id,
-                    quantity=quantity,
-                    reference_type='SalesOrder',
-                    reference_id=order.id,
-                    user=user,
-                )
 
     return order
 
 
 def update_order_items(order, new_items_data, user=None):
     """
-    Update order items (Add/Remove/Update Qty).
-    Handles stock deduction/restoration based on changes.
-    Re-calculates order totals.
-    
+    Update order items (Add/Remove/Update Qty) from the full diff against the
+    stored lines: one bulk_create, one bulk_update, one delete, one batched
+    stock move (NORMAL) or reservation swap (PRE_ORDER), and one UPDATE that
+    recomputes subtotal, promotion discount and total in SQL.
+
     new_items_data: list of dicts from parse_order_items_from_post
     """
     if order.status.code in (ORDER_CONFIRMED, ORDER_DELIVERED, ORDER_PAID, ORDER_CANCELLED):
         raise ValueError(f"Cannot edit items for order in status {order.status.name_en}")
 
+    new_items_map = {item['product'].id: item for item in new_items_data}
     with transaction.atomic():
-        # 1. Map existing items by product_id
+        # Lock the order and read the stored totals (the balance delta is taken from them)
+        before = SalesOrder.all_objects.select_for_update().filter(pk=order.pk).values(
+            'subtotal', 'discount_amount', 'total_amount'
+        ).get()
         existing_items = {item.product_id: item for item in order.orderitem_set.all()}
-        new_items_map = {item['product'].id: item for item in new_items_data}
-        
-        # 2. Identify removed items -> Restore stock (if NORMAL)
-        for product_id, item in existing_items.items():
-            if product_id not in new_items_map:
-                if order.order_type == 'NORMAL':
-                    restore_stock(
-                        product_id=product_id,
-                        quantity=item.quantity,
-                        reference_type='SalesOrder',
-                        reference_id=order.id,
-                        user=user
-                    )
-                item.delete()
-
-        # 3. Identify added/updated items
+        removed = [item for product_id, item in existing_items.items() if product_id not in new_items_map]
+        added = []
+        changed = []
+        old_values = {}
+        stock_deltas = {item.product_id: -item.quantity for item in removed}
+        now = timezone.now()
         for product_id, new_data in new_items_map.items():
-            product = new_data['product']
-            new_qty = new_data['quantity']
-            unit_price = new_data['unit_price']
-            total_price = new_data['total_price']
-
-            if product_id in existing_items:
-                # Update existing
-                current_item = existing_items[product_id]
-                old_qty = current_item.quantity
-                
-                if new_qty != old_qty:
-                    if order.order_type == 'NORMAL':
-                        if new_qty > old_qty:
-                            # Increase qty -> Deduct diff
-                            deduct_stock(
-                                product_id=product_id,
-                                quantity=new_qty - old_qty,
-                                reference_type='SalesOrder',
-                                reference_id=order.id,
-                                user=user
-                            )
-                        else:
-                            # Decrease qty -> Restore diff
-                            restore_stock(
-                                product_id=product_id,
-                                quantity=old_qty - new_qty,
-                                reference_type='SalesOrder',
-                                reference_id=order.id,
-                                user=user
-                            )
-                    
-                    current_item.quantity = new_qty
-                    current_item.unit_price = unit_price # Update price in case it changed
-                    current_item.total_price = total_price
-                    current_item.save()
-            else:
-                # Add new
-                OrderItem.objects.create(
+            current = existing_items.get(product_id)
+            if current is None:
+                added.append(OrderItem(
                     order=order,
-                    product=product,
-                    quantity=new_qty,
-                    unit_price=unit_price,
-                    total_price=total_price
-                )
-                if order.order_type == 'NORMAL':
-                    deduct_stock(
-                        product_id=product.id,
-                        quantity=new_qty,
-                        reference_type='SalesOrder',
-                        reference_id=order.id,
-                        user=user
-                    )
-
-        # 4. Recalculate Totals
-        # Refresh from DB to get latest items
-        items = order.orderitem_set.all()
-        subtotal = sum(i.total_price for i in items)
-        
-        # Recalculate discount (percentage based? currently fixed amount in model)
-        # Note: In create_order, discount_amount is passed. 
-        # If we have percentage promotion, we should re-apply it.
-        # But here we stick to simple logic: preserve discount amount unless it exceeds subtotal?
-        # Or better: if applied_promotion exists, re-calculate.
-        
-        if order.applied_promotion:
-            discount_amount = (subtotal * order.applied_promotion.discount_percent / Decimal('100'))
-            order.discount_amount = discount_amount
-        
-        # Delivery fee (might change if customer changed? But here we only edit items)
-        # Just use existing logic in save()
-        order.subtotal = subtotal
-        order.save() # save() triggers total calculation (subtotal - discount + delivery)
+                    product=new_data['product'],
+                    quantity=new_data['quantity'],
+                    unit_price=new_data['unit_price'],
+                    total_price=new_data['total_price'],
+                ))
+                stock_deltas[product_id] = new_data['quantity']
+            elif (current.quantity, current.unit_price, current.total_price) != (
+                new_data['quantity'], new_data['unit_price'], new_data['total_price']
+            ):
+                # Quantity or price changed (a price can move without the quantity)
+                old_values[current.pk] = {
+                    'quantity': current.quantity,
+                    'unit_price': current.unit_price,
+                    'total_price': current.total_price,
+                }
+                if current.quantity != new_data['quantity']:
+                    stock_deltas[product_id] = new_data['quantity'] - current.quantity
+                current.quantity = new_data['quantity']
+                current.unit_price = new_data['unit_price']
+                current.total_price = new_data['total_price']
+                current.updated_at = now
+                changed.append(current)
+
+        if removed:
+            if ReturnItem.objects.filter(order_item__in=removed).exists():
+                raise ValueError("Cannot remove items that have return requests.")
+            # Audited per line by the delete signals
+            OrderItem.objects.filter(id__in=[item.id for item in removed]).delete()
+        OrderItem.objects.bulk_create(added)
+        OrderItem.objects.bulk_update(changed, ['quantity', 'unit_price', 'total_price', 'updated_at'])
+
+        if order.order_type == 'NORMAL':
+            move_document_stock(stock_deltas, 'SalesOrder', order.id, user=user)
+        elif order.order_type == 'PRE_ORDER' and stock_deltas:
+            replace_reservations(
+                'SalesOrder', order.id,
+                [(pid, data['quantity']) for pid, data in new_items_map.items()],
+                expires_at=reservation_expiry(),
+                allow_shortfall=True,
+                user=user,
+            )
+
+        # Totals from the stored lines, as SalesOrder.save computes them
+        money = DecimalField(max_digits=10, decimal_places=2)
+        subtotal = Coalesce(
+            Subquery(
+                OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+                .annotate(total=Sum('total_price')).values('total'),
+                output_field=money,
+            ),
+            Value(Decimal('0'), output_field=money),
+        )
+        discount = F('discount_amount')
+        if order.order_type != 'REPLACEMENT' and order.applied_promotion_id:
+            percent = order.applied_promotion.discount_percent
+            discount = ExpressionWrapper(
+                subtotal * Value(percent, output_field=money) / Value(Decimal('100'), output_field=money),
+                output_field=money,
+            )
+        SalesOrder.all_objects.filter(pk=order.pk).update(
+            subtotal=subtotal,
+            discount_amount=discount,
+            total_amount=ExpressionWrapper(subtotal - discount + F('delivery_fee'), output_field=money),
+            updated_at=now,
+        )
+        order.refresh_from_db(fields=['subtotal', 'discount_amount', 'total_amount', 'updated_at'])
+        order._remember_pricing()
+        # The UPDATE skips the balance signals
+        apply_balance_deltas({order.customer_id: order.total_amount - before['total_amount']})
+
+        log_bulk_create(added, user=user)
+        log_bulk_update(changed, old_values, user=user)
+        log_bulk_update([order], {order.pk: before}, user=user)
 
     return order
 
@@ -302,24 +463,65 @@ def confirm_order(order_id):
 
 def deliver_order(order_id, user=None):
     """Update status to Delivered, set delivery_date.
-    For PRE_ORDER, deduct stock on delivery."""
+    For PRE_ORDER, convert the reservation into a stock deduction on delivery."""
     order = SalesOrder.objects.prefetch_related('orderitem_set').get(id=order_id)
     with transaction.atomic():
         order.status = OrderStatus.get_by_code(ORDER_DELIVERED)
         order.delivery_date = timezone.now().date()
         if order.order_type == 'PRE_ORDER':
-            for item in order.orderitem_set.all():
-                deduct_stock(
-                    product_id=item.product_id,
-                    quantity=item.quantity,
-                    reference_type='SalesOrder',
-                    reference_id=order.id,
-                    user=user,
-                )
+            convert_reservations(
+                'SalesOrder', order.id,
+                [(item.product_id, item.quantity) for item in order.orderitem_set.all()],
+                user=user,
+            )
+        # The save signal books the sale in the return-rate rollup
         order.save(update_fields=['status', 'delivery_date'])
     return order
 
 
+def apply_paid_amount_deltas(deltas):
+    """
+    Add payment deltas to SalesOrder.paid_amount atomically (F() arithmetic,
+    no re-aggregation), move the customers' outstanding balances, then move
+    fully paid orders to PAID. A fixed number of statements whatever the
+    number of orders. deltas: {order_id: Decimal}.
+    """
+    deltas = {order_id: delta for order_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    money = DecimalField(max_digits=10, decimal_places=2)
+    now = timezone.now()
+    SalesOrder.all_objects.filter(id__in=list(deltas)).update(
+        paid_amount=Case(
+            *[When(id=order_id, then=F('paid_amount') + Value(delta, output_field=money))
+              for order_id, delta in deltas.items()],
+            default=F('paid_amount'),
+            output_field=money,
+        ),
+        updated_at=now,
+    )
+    balance_deltas = {}
+    for order_id, customer_id in (
+        SalesOrder.objects.filter(id__in=list(deltas))
+        .exclude(status_id=get_order_status_id(ORDER_CANCELLED))
+        .values_list('id', 'customer_id')
+    ):
+        balance_deltas[customer_id] = balance_deltas.get(customer_id, Decimal('0')) - deltas[order_id]
+    apply_balance_deltas(balance_deltas)
+    paid_status_id = get_order_status_id(ORDER_PAID)
+    if paid_status_id:
+        now_paid = SalesOrder.all_objects.filter(
+            id__in=list(deltas), paid_amount__gte=F('total_amount')
+        ).exclude(status_id=paid_status_id)
+        # Delivered orders are booked already; the rest become sales here (the UPDATE skips signals)
+        unbooked = list(
+            now_paid.exclude(status_id=get_order_status_id(ORDER_DELIVERED)).values_list('id', flat=True)
+        )
+        now_paid.update(status_id=paid_status_id, updated_at=now)
+        if unbooked:
+            record_deliveries(unbooked)
+
+
 def process_payment(
     order_id, amount, payment_method=None, reference_number='', notes='', user=None
 ):
@@ -333,9 +535,105 @@ def process_payment(
         notes=notes,
         created_by=user,
     )
+    order.refresh_from_db(fields=['paid_amount', 'status'])
     return order
 
 
+def record_payments(entries, user=None):
+    """
+    Record many payments in one transaction (e.g. a collector's day).
+    entries: iterable of dicts with order (SalesOrder or id), amount and
+    optional payment_method, payment_date, reference_number, notes.
+    Vouchers are numbered from one sequence reservation, payments are
+    bulk inserted and paid_amount/status move by delta in two UPDATEs.
+    Returns: list of created Payment. Raises: ValueError (nothing is saved).
+    """
+    entries = list(entries)
+    order_ids = {getattr(entry.get('order'), 'pk', entry.get('order')) for entry in entries}
+    with transaction.atomic():
+        orders = SalesOrder.objects.in_bulk([order_id for order_id in order_ids if order_id])
+        payments = []
+        for row, entry in enumerate(entries, start=1):
+            order = orders.get(getattr(entry.get('order'), 'pk', entry.get('order')))
+            if order is None:
+                raise ValueError(f"Row {row}: order not found.")
+            try:
+                amount = Decimal(str(entry.get('amount')))
+            except (ArithmeticError, ValueError):
+                raise ValueError(f"Row {row}: invalid amount.")
+            if amount <= 0:
+                raise ValueError(f"Row {row}: amount must be positive.")
+            payments.append(Payment(
+                order=order,
+                amount=amount,
+                payment_method=entry.get('payment_method'),
+                payment_date=entry.get('payment_date') or timezone.now().date(),
+                reference_number=entry.get('reference_number') or '',
+                notes=entry.get('notes') or '',
+                created_by=user,
+            ))
+        if not payments:
+            return []
+        Payment.assign_voucher_numbers(payments)
+        Payment.objects.bulk_create(payments, batch_size=500)
+        log_bulk_create(payments, user=user)
+        deltas = {}
+        for payment in payments:
+            deltas[payment.order_id] = deltas.get(payment.order_id, Decimal('0')) + payment.amount
+        apply_paid_amount_deltas(deltas)
+    return payments
+
+
+def allocate_customer_payment(
+    customer, amount, payment_method=None, order_ids=None, reference_number='', notes='', user=None
+):
+    """
+    Spread one collected amount over a customer's outstanding orders:
+    oldest first, or in the order of order_ids when given. Orders are locked
+    while allocating; payments are recorded through record_payments.
+    Returns: list of created Payment. Raises: ValueError (amount not positive,
+    more than outstanding, or an order_ids entry not outstanding for the customer).
+    """
+    amount = Decimal(str(amount))
+    if amount <= 0:
+        raise ValueError("Amount must be positive.")
+    with transaction.atomic():
+        orders = (
+            SalesOrder.objects.select_for_update()
+            .filter(customer=customer, paid_amount__lt=F('total_amount'))
+            .exclude(status_id=get_order_status_id(ORDER_CANCELLED))
+        )
+        if order_ids is not None:
+            order_ids = list(dict.fromkeys(order_ids))
+            by_id = {order.id: order for order in orders.filter(id__in=order_ids)}
+            missing = [order_id for order_id in order_ids if order_id not in by_id]
+            if missing:
+                raise ValueError(f"Orders not outstanding for this customer: {missing}")
+            orders = [by_id[order_id] for order_id in order_ids]
+        else:
+            orders = list(orders.order_by('order_date', 'id'))
+
+        outstanding = sum((order.total_amount - order.paid_amount for order in orders), Decimal('0'))
+        if amount > outstanding:
+            raise ValueError(f"Amount {amount} exceeds outstanding balance {outstanding}.")
+
+        entries = []
+        remaining = amount
+        for order in orders:
+            if remaining <= 0:
+                break
+            share = min(remaining, order.total_amount - order.paid_amount)
+            entries.append({
+                'order': order,
+                'amount': share,
+                'payment_method': payment_method,
+                'reference_number': reference_number,
+                'notes': notes,
+            })
+            remaining -= share
+        return record_payments(entries, user=user)
+
+
 def cancel_order(order_id, user=None):
     """Restore stock and set status to Cancelled.
     Fails if already delivered or paid."""
@@ -353,14 +651,124 @@ def cancel_order(order_id, user=None):
         # Only restore stock for NORMAL orders, as PRE_ORDER deducts on delivery
         # and we block cancellation of delivered orders above.
         if order.order_type == 'NORMAL':
-            for item in order.orderitem_set.all():
-                restore_stock(
-                    product_id=item.product_id,
-                    quantity=item.quantity,
-                    reference_type='SalesOrder',
-                    reference_id=order.id,
-                    user=user,
-                )
+            restore_stock_many(
+                [(item.product_id, item.quantity) for item in order.orderitem_set.all()],
+                reference_type='SalesOrder',
+                reference_id=order.id,
+                user=user,
+            )
+        elif order.order_type == 'PRE_ORDER':
+            release_order_reservations(order)
         order.status = cancelled
         order.save(update_fields=['status'])
     return order
+
+
+# Status changes allowed by transition_orders (PAID is set by payments, not by hand)
+ORDER_TRANSITIONS = {
+    ORDER_PENDING: (ORDER_CONFIRMED, ORDER_CANCELLED),
+    ORDER_CONFIRMED: (ORDER_DELIVERED, ORDER_CANCELLED),
+    ORDER_DELIVERED: (),
+    ORDER_PAID: (),
+    ORDER_CANCELLED: (),
+}
+
+
+def _transition_stock(orders, target, lines, user=None):
+    """Stock side of moving orders to target. Raises ValueError on insufficient stock."""
+    if target == ORDER_DELIVERED:
+        convert_reservations_for_documents(
+            {order.id: lines.get(order.id, []) for order in orders if order.order_type == 'PRE_ORDER'},
+            'SalesOrder', user=user,
+        )
+    elif target == ORDER_CANCELLED:
+        release_reservations_for_documents(
+            'SalesOrder', [order.id for order in orders if order.order_type == 'PRE_ORDER'],
+        )
+        # One batched restore; each order's stock still goes back to the batches it took
+        restore_stock_for_documents(
+            {order.id: lines.get(order.id, []) for order in orders if order.order_type == 'NORMAL'},
+            'SalesOrder', user=user,
+        )
+
+
+def transition_orders(order_ids, target, user=None):
+    """
+    Move many orders to status code target in one transaction (e.g. a delivery run).
+    Transitions are checked against ORDER_TRANSITIONS. DELIVERED converts PRE_ORDER
+    reservations in one batch; CANCELLED restores NORMAL stock, releases PRE_ORDER
+    reservations and takes the orders off their customers' balances. Statuses
+    are written with one UPDATE. Orders that may not move, or whose stock step
+    fails, are reported and left unchanged.
+    Returns: {'updated': [order_id, ...], 'failed': {order_id: message}}.
+    """
+    if target not in ORDER_TRANSITIONS:
+        raise ValueError(f"Unknown order status: {target}")
+    statuses = {status.id: status for status in OrderStatus.objects.all()}
+    target_status = next((s for s in statuses.values() if s.code == target), None)
+    if target_status is None:
+        raise ValueError(f"Status {target} not found")
+    order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+    failed = {}
+    with transaction.atomic():
+        orders = SalesOrder.objects.select_for_update().in_bulk(order_ids)
+        movable = []
+        for order_id in order_ids:
+            order = orders.get(order_id)
+            if order is None:
+                failed[order_id] = "Order not found."
+                continue
+            current = statuses[order.status_id].code if order.status_id in statuses else ORDER_PENDING
+            if target not in ORDER_TRANSITIONS.get(current, ()):
+                failed[order_id] = f"Cannot change status from {current} to {target}."
+                continue
+            movable.append(order)
+        if not movable:
+            return {'updated': [], 'failed': failed}
+
+        lines = {}
+        for order_id, product_id, quantity in OrderItem.objects.filter(
+            order_id__in=[order.id for order in movable]
+        ).values_list('order_id', 'product_id', 'quantity'):
+            lines.setdefault(order_id, []).append((product_id, quantity))
+        try:
+            with transaction.atomic():
+                _transition_stock(movable, target, lines, user=user)
+        except (ValueError, Product.DoesNotExist):
+            # Some order's stock failed the batch: retry one by one to find it
+            passed = []
+            for order in movable:
+                try:
+                    with transaction.atomic():
+                        _transition_stock([order], target, lines, user=user)
+                    passed.append(order)
+                except (ValueError, Product.DoesNotExist) as e:
+                    failed[order.id] = str(e)
+            movable = passed
+        if not movable:
+            return {'updated': [], 'failed': failed}
+
+        now = timezone.now()
+        changes = {'status_id': target_status.id, 'version': F('version') + 1, 'updated_at': now}
+        if target == ORDER_DELIVERED:
+            changes['delivery_date'] = now.date()
+        SalesOrder.all_objects.filter(id__in=[order.id for order in movable]).update(**changes)
+
+        old_values = {}
+        balance_deltas = {}
+        for order in movable:
+            old_values[order.id] = {'status': statuses.get(order.status_id)}
+            if target == ORDER_DELIVERED:
+                old_values[order.id]['delivery_date'] = order.delivery_date
+                order.delivery_date = changes['delivery_date']
+            order.status = target_status
+            if target == ORDER_CANCELLED:
+                # The UPDATE skips the balance signals
+                balance_deltas[order.customer_id] = (
+                    balance_deltas.get(order.customer_id, Decimal('0')) - (order.total_amount - order.paid_amount)
+                )
+        apply_balance_deltas(balance_deltas)
+        log_bulk_update(movable, old_values, user=user)
+        if target == ORDER_DELIVERED:
+            record_deliveries([order.id for order in movable])
+    return {'updated': [order.id for order in movable], 'failed': failed}
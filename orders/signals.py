@@ -1,39 +1,103 @@
 """
-Order signals - keep paid_amount in sync with Payment records.
+Order signals - keep paid_amount in sync with Payment records and
+customer outstanding balances in sync with orders.
 """
 from decimal import Decimal
 
-from django.db.models import Sum
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
+from customers.services import apply_balance_deltas
+from master_data.constants import ORDER_CANCELLED, ORDER_DELIVERED, ORDER_PAID
+from master_data.utils import get_order_status_id
 from .models import Payment, SalesOrder
-from master_data.models import OrderStatus
-from master_data.constants import ORDER_PAID
+from reports.rollups import record_deliveries
+from .services import apply_paid_amount_deltas
 
+# SalesOrder attnames that decide what an order adds to its customer's outstanding balance
+BALANCE_FIELDS = ('customer_id', 'total_amount', 'paid_amount', 'status_id', 'deleted_at')
 
-def _sync_order_paid_amount(order):
-    """Recalculate paid_amount from payments and update order status."""
-    total_paid = order.payments.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    order.paid_amount = total_paid
 
-    update_fields = ['paid_amount']
-    if order.paid_amount >= order.total_amount:
-        paid_status = OrderStatus.objects.filter(code=ORDER_PAID).first()
-        if paid_status and order.status_id != paid_status.id:
-            order.status = paid_status
-            update_fields.append('status')
-
-    order.save(update_fields=update_fields)
+def _effect_deltas(before, after):
+    """Difference between two {order_id: amount} payment effects."""
+    deltas = {}
+    for order_id, amount in before.items():
+        deltas[order_id] = deltas.get(order_id, Decimal('0')) - amount
+    for order_id, amount in after.items():
+        deltas[order_id] = deltas.get(order_id, Decimal('0')) + amount
+    return deltas
 
 
 @receiver(post_save, sender=Payment)
 def payment_post_save(sender, instance, created, **kwargs):
-    """Sync order paid_amount when payment is created or updated."""
-    _sync_order_paid_amount(instance.order)
+    """Move order paid_amount by what this save changed (create, amount edit, soft delete)."""
+    before = {} if created else getattr(instance, '_loaded_paid_effect', {})
+    apply_paid_amount_deltas(_effect_deltas(before, instance.paid_effect()))
+    instance._remember_paid_effect()
 
 
 @receiver(post_delete, sender=Payment)
 def payment_post_delete(sender, instance, **kwargs):
-    """Sync order paid_amount when payment is deleted."""
-    _sync_order_paid_amount(instance.order)
+    """Take a hard-deleted payment off its order's paid_amount."""
+    before = getattr(instance, '_loaded_paid_effect', instance.paid_effect())
+    apply_paid_amount_deltas(_effect_deltas(before, {}))
+
+
+def _balance_effect(row):
+    """Amount an order row adds to its customer's balance: {customer_id: total - paid}."""
+    if not row or row['deleted_at'] or not row['customer_id']:
+        return {}
+    if row['status_id'] == get_order_status_id(ORDER_CANCELLED):
+        return {}
+    return {row['customer_id']: Decimal(str(row['total_amount'])) - Decimal(str(row['paid_amount']))}
+
+
+def _written_balance_fields(instance, update_fields):
+    if update_fields is None:
+        return BALANCE_FIELDS
+    written = {instance._meta.get_field(name).attname for name in update_fields}
+    return tuple(name for name in BALANCE_FIELDS if name in written)
+
+
+@receiver(pre_save, sender=SalesOrder)
+def order_pre_save(sender, instance, update_fields=None, **kwargs):
+    """Read the stored balance inputs (one row) unless the save can't touch them."""
+    instance._balance_row = None
+    if not _written_balance_fields(instance, update_fields):
+        return
+    if instance._state.adding:
+        instance._balance_row = {}
+        return
+    instance._balance_row = (
+        SalesOrder.all_objects.filter(pk=instance.pk).values(*BALANCE_FIELDS).first() or {}
+    )
+
+
+@receiver(post_save, sender=SalesOrder)
+def order_post_save(sender, instance, update_fields=None, **kwargs):
+    """Move the customer balance by what this save changed (new order, total, cancel, soft delete, customer)."""
+    before = getattr(instance, '_balance_row', None)
+    if before is None:
+        return
+    instance._balance_row = None
+    after = dict(before)
+    for name in _written_balance_fields(instance, update_fields):
+        after[name] = getattr(instance, name)
+    apply_balance_deltas(_effect_deltas(_balance_effect(before), _balance_effect(after)))
+    _book_sale(instance, before, after)
+
+
+def _book_sale(instance, before, after):
+    """Book (or take back) the order's sale in the return-rate rollup when it enters (leaves) DELIVERED/PAID."""
+    sold = {get_order_status_id(ORDER_DELIVERED), get_order_status_id(ORDER_PAID)}
+    was_sold = before.get('status_id') in sold
+    is_sold = after.get('status_id') in sold
+    if was_sold != is_sold:
+        record_deliveries([instance.pk], undo=was_sold)
+
+
+@receiver(post_delete, sender=SalesOrder)
+def order_post_delete(sender, instance, **kwargs):
+    """Take a hard-deleted order off its customer's balance."""
+    row = {name: getattr(instance, name) for name in BALANCE_FIELDS}
+    apply_balance_deltas(_effect_deltas(_balance_effect(row), {}))
@@ -2,12 +2,15 @@
 Order service tests.
 """
 from decimal import Decimal
-from django.test import TestCase
+from io import StringIO
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
 
 from customers.models import Customer
-from core.models import Product, ProductPriceTier
+from core.models import Product, ProductPriceTier, StockMovement
 from master_data.models import CustomerType, ProductCategory, UnitOfMeasure
 from orders.services import create_order_from_request, confirm_order, update_order_items
 
@@ -123,3 +126,527 @@ class OrderServiceTests(TestCase):
             update_order_items(order, new_items, self.user)
         
         self.assertIn("Cannot edit items", str(cm.exception))
+
+    def test_update_order_items_applies_net_stock_delta(self):
+        """Editing items deducts/restores only the difference per product."""
+        other = Product.objects.create(name='Other Product', sku='TEST002', base_price=500, stock_quantity=10)
+        items = [{
+            'product': self.product,
+            'quantity': 5,
+            'unit_price': Decimal('1000'),
+            'total_price': Decimal('5000')
+        }]
+        order = create_order_from_request(
+            self.customer, items, 'NORMAL', Decimal('0'), '', self.user
+        )
+        new_items = [
+            {'product': self.product, 'quantity': 2, 'unit_price': Decimal('1000'), 'total_price': Decimal('2000')},
+            {'product': other, 'quantity': 4, 'unit_price': Decimal('500'), 'total_price': Decimal('2000')},
+        ]
+        update_order_items(order, new_items, self.user)
+
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 98)
+        self.assertEqual(other.stock_quantity, 6)
+        self.assertEqual(order.orderitem_set.count(), 2)
+
+    def test_pre_order_reserves_until_delivery(self):
+        from orders.services import deliver_order
+        items = [{
+            'product': self.product,
+            'quantity': 30,
+            'unit_price': Decimal('1000'),
+            'total_price': Decimal('30000')
+        }]
+        order = create_order_from_request(
+            self.customer, items, 'PRE_ORDER', Decimal('0'), '', self.user
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 100)
+        self.assertEqual(self.product.reserved_quantity, 30)
+        self.assertEqual(self.product.available_quantity, 70)
+
+        deliver_order(order.id, self.user)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 70)
+        self.assertEqual(self.product.reserved_quantity, 0)
+
+    def test_cancel_pre_order_releases_reservation(self):
+        from orders.services import cancel_order
+        items = [{
+            'product': self.product,
+            'quantity': 30,
+            'unit_price': Decimal('1000'),
+            'total_price': Decimal('30000')
+        }]
+        order = create_order_from_request(
+            self.customer, items, 'PRE_ORDER', Decimal('0'), '', self.user
+        )
+        cancel_order(order.id, self.user)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 0)
+        self.assertEqual(self.product.stock_quantity, 100)
+
+    def test_normal_order_cannot_take_reserved_stock(self):
+        pre_items = [{
+            'product': self.product,
+            'quantity': 95,
+            'unit_price': Decimal('1000'),
+            'total_price': Decimal('95000')
+        }]
+        self.customer.credit_limit = 0
+        self.customer.save()
+        create_order_from_request(
+            self.customer, pre_items, 'PRE_ORDER', Decimal('0'), '', self.user
+        )
+        items = [{
+            'product': self.product,
+            'quantity': 10,
+            'unit_price': Decimal('1000'),
+            'total_price': Decimal('10000')
+        }]
+        with self.assertRaises(ValueError):
+            create_order_from_request(
+                self.customer, items, 'NORMAL', Decimal('0'), '', self.user
+            )
+
+    def test_sample_cannot_take_reserved_stock(self):
+        from crm.services import give_sample_to_customer
+        items = [{
+            'product': self.product,
+            'quantity': 95,
+            'unit_price': Decimal('1000'),
+            'total_price': Decimal('95000')
+        }]
+        create_order_from_request(
+            self.customer, items, 'PRE_ORDER', Decimal('0'), '', self.user
+        )
+        self.product.refresh_from_db()
+        with self.assertRaises(ValueError):
+            give_sample_to_customer(self.customer, self.product, 10, self.user)
+        give_sample_to_customer(self.customer, self.product, 5, self.user)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.available_quantity), (95, 0))
+
+    def test_parse_order_lines_merges_and_reports_rows(self):
+        from orders.services import parse_order_lines
+        other = Product.objects.create(name='Other', sku='OTH1', base_price=500, stock_quantity=3)
+        rows = [
+            (str(self.product.id), '2'), (str(other.id), '5'), ('999999', '1'),
+            (str(self.product.id), '3'), (str(self.product.id), 'x'),
+        ]
+        parse_order_lines([], self.customer, 'NORMAL')  # load the price matrix
+        with self.assertNumQueries(1):
+            items, errors = parse_order_lines(rows, self.customer, 'NORMAL')
+        self.assertEqual([(i['product'].id, i['quantity']) for i in items], [(self.product.id, 5), (other.id, 5)])
+        self.assertEqual(items[0]['total_price'], Decimal('5000'))
+        self.assertEqual(
+            sorted((e['row'], e['code']) for e in errors),
+            [(2, 'insufficient_stock'), (3, 'product_not_found'), (5, 'invalid_quantity')],
+        )
+        # Stock the order already holds counts as available on update
+        _items, errors = parse_order_lines(rows[1:2], self.customer, 'NORMAL', held={other.id: 2})
+        self.assertEqual(errors, [])
+
+    def test_status_only_save_skips_pricing(self):
+        import datetime
+        from master_data.models import Promotion
+        items = [{'product': self.product, 'quantity': 1, 'unit_price': Decimal('1000'), 'total_price': Decimal('1000')}]
+        order = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        order = SalesOrder.objects.get(pk=order.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            order.save(update_fields=['status'])
+            order.notes = 'changed'
+            order.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'master_data_promotion' in q['sql']])
+
+        # A new promotion is picked up by the next order despite the per-day cache
+        from django.core.cache import cache
+        self.addCleanup(cache.clear)  # cached list outlives the test's rolled back transaction
+        today = datetime.date.today()
+        Promotion.objects.create(
+            code='P10', name_en='Ten', name_my='Ten', start_date=today, end_date=today, discount_percent=10
+        )
+        order = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        self.assertEqual(order.applied_promotion.code, 'P10')
+        self.assertEqual(order.discount_amount, Decimal('100'))
+
+    def test_payments_move_paid_amount_by_delta(self):
+        from orders.models import Payment
+        from orders.services import record_payments
+        items = [{'product': self.product, 'quantity': 1, 'unit_price': Decimal('1000'), 'total_price': Decimal('1000')}]
+        first = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        second = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+
+        payment = Payment.objects.create(order=first, amount=Decimal('400'))
+        first.refresh_from_db()
+        self.assertEqual(first.paid_amount, Decimal('400'))
+        payment = Payment.objects.get(pk=payment.pk)
+        payment.soft_delete()
+        first.refresh_from_db()
+        self.assertEqual(first.paid_amount, Decimal('0'))
+
+        payments = record_payments([
+            {'order': first, 'amount': '600'},
+            {'order': first.id, 'amount': '400'},
+            {'order': second, 'amount': '100'},
+        ], user=self.user)
+        self.assertEqual(len({p.voucher_number for p in payments}), 3)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.paid_amount, first.status.code), (Decimal('1000'), 'PAID'))
+        self.assertEqual(second.paid_amount, Decimal('100'))
+        with self.assertRaises(ValueError):
+            record_payments([{'order': second, 'amount': '-1'}])
+
+    def test_allocate_customer_payment_oldest_first(self):
+        from orders.services import allocate_customer_payment
+        items = [{'product': self.product, 'quantity': 1, 'unit_price': Decimal('1000'), 'total_price': Decimal('1000')}]
+        first = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        second = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+
+        # The locking SELECT must not join: PostgreSQL rejects FOR UPDATE on an outer join
+        with CaptureQueriesContext(connection) as queries:
+            payments = allocate_customer_payment(self.customer, Decimal('1500'), user=self.user)
+        locking = [q['sql'] for q in queries.captured_queries if 'FROM "orders_salesorder"' in q['sql']]
+        self.assertTrue(locking)
+        self.assertFalse([sql for sql in locking if 'JOIN' in sql])
+        self.assertEqual([(p.order_id, p.amount) for p in payments], [(first.id, Decimal('1000')), (second.id, Decimal('500'))])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status.code, 'PAID')
+        self.assertEqual(second.paid_amount, Decimal('500'))
+
+        # A repeated id is allocated once, not paid twice
+        with self.assertRaises(ValueError):
+            allocate_customer_payment(self.customer, Decimal('600'), order_ids=[second.id, second.id])
+        payments = allocate_customer_payment(self.customer, Decimal('300'), order_ids=[second.id, second.id])
+        self.assertEqual([(p.order_id, p.amount) for p in payments], [(second.id, Decimal('300'))])
+        second.refresh_from_db()
+        self.assertEqual(second.paid_amount, Decimal('800'))
+
+        with self.assertRaises(ValueError):
+            allocate_customer_payment(self.customer, Decimal('300'))
+        with self.assertRaises(ValueError):
+            allocate_customer_payment(self.customer, Decimal('100'), order_ids=[first.id])
+
+    def test_outstanding_balance_follows_orders_and_payments(self):
+        from orders.services import cancel_order, record_payments
+        items = [{'product': self.product, 'quantity': 1, 'unit_price': Decimal('1000'), 'total_price': Decimal('1000')}]
+        first = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        second = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        record_payments([{'order': first, 'amount': '300'}])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.outstanding_balance, Decimal('1700'))
+
+        cancel_order(second.id, user=self.user)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.outstanding_balance, Decimal('700'))
+
+        self.customer.credit_limit = Decimal('1500')
+        self.customer.save()
+        with self.assertRaises(ValueError):
+            create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+
+        Customer.objects.filter(pk=self.customer.pk).update(outstanding_balance=0)
+        call_command('reconcile_customer_balances', '--fix', stdout=StringIO())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.outstanding_balance, Decimal('700'))
+
+    def test_credit_check_counts_promotion_like_quote(self):
+        import datetime
+        from django.core.cache import cache
+        from master_data.models import Promotion
+        from orders.services import quote_order
+        self.addCleanup(cache.clear)
+        today = datetime.date.today()
+        Promotion.objects.create(
+            code='P10', name_en='Ten', name_my='Ten', start_date=today, end_date=today, discount_percent=10
+        )
+        quote = quote_order(self.customer, [(self.product.id, 1)])
+        self.assertEqual(quote['discount_amount'], Decimal('100'))
+        # Limit covers the promoted total but not the undiscounted one
+        self.customer.credit_limit = quote['total_amount']
+        self.customer.save()
+        self.assertTrue(quote_order(self.customer, [(self.product.id, 1)])['ok'])
+        items = [{'product': self.product, 'quantity': 1, 'unit_price': Decimal('1000'), 'total_price': Decimal('1000')}]
+        order = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        self.assertEqual(order.total_amount, quote['total_amount'])
+
+        self.customer.refresh_from_db()
+        self.assertFalse(quote_order(self.customer, [(self.product.id, 1)])['ok'])
+        with self.assertRaises(ValueError):
+            create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+
+    def test_quote_prices_cart_without_saving(self):
+        from orders.services import quote_order
+        self.customer.credit_limit = Decimal('1500')
+        self.customer.save()
+        quote = quote_order(self.customer, [(self.product.id, '1'), (self.product.id, '1'), ('x', '1')], 'NORMAL')
+        self.assertEqual(quote['subtotal'], Decimal('2000'))
+        self.assertEqual([line['quantity'] for line in quote['lines']], [2])
+        self.assertEqual({e['code'] for e in quote['errors']}, {'product_not_found', 'credit_limit_exceeded'})
+        self.assertFalse(quote['ok'])
+        self.assertFalse(SalesOrder.objects.exists())
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/orders/api/quote/',
+            data={'customer_id': self.customer.id, 'lines': [{'product_id': self.product.id, 'quantity': 1}]},
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertTrue(data['ok'])
+        self.assertEqual(Decimal(data['total_amount']), Decimal('1000'))
+        self.assertEqual(Decimal(data['credit']['headroom']), Decimal('500'))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_customer_typeahead_is_paginated(self):
+        ct = CustomerType.objects.get(code='INDIVIDUAL')
+        Customer.objects.bulk_create([
+            Customer(name=f'Typeahead {i:02d}', phone=f'0977{i:05d}', customer_type=ct) for i in range(25)
+        ])
+        self.client.force_login(self.user)
+        first = self.client.get('/orders/api/customers/', {'q': 'typeahead'}).json()
+        second = self.client.get('/orders/api/customers/', {'q': 'typeahead', 'page': 2}).json()
+        self.assertEqual((len(first['results']), first['has_more']), (20, True))
+        self.assertEqual((len(second['results']), second['has_more']), (5, False))
+        self.assertEqual(second['results'][0]['name'], 'Typeahead 20')
+
+        # The create form renders only the chosen customer, not the whole table
+        from django.contrib.auth.models import Permission
+        self.user.user_permissions.add(Permission.objects.get(codename='add_salesorder'))
+        response = self.client.get('/orders/add/', {'customer_id': self.customer.id})
+        self.assertContains(response, 'data-typeahead-url')
+        self.assertNotContains(response, 'Typeahead 00')
+
+    def test_import_orders_reports_per_row(self):
+        from orders.imports import import_orders, read_import_file
+        other = Product.objects.create(name='Other', sku='OTH1', base_price=500, stock_quantity=3)
+        sheet = StringIO(
+            "ref,customer,product,quantity\n"
+            "A,09123456789,TEST001,2\n"
+            f"A,09123456789,{other.id},1\n"
+            "B,09123456789,TEST001,1\n"
+            "B,09123456789,NOPE,1\n"
+            "C,09123456789,OTH1,5\n"
+        )
+        rows = read_import_file(sheet, 'csv')
+
+        preview = import_orders(rows, dry_run=True)
+        self.assertEqual((preview['valid'], preview['failed']), (1, 2))
+        self.assertFalse(SalesOrder.objects.exists())
+
+        result = import_orders(rows, user=self.user, chunk_size=1)
+        self.assertEqual([row['status'] for row in result['rows']], ['created', 'created', 'error', 'error', 'error'])
+        order = SalesOrder.objects.get(order_number=result['rows'][0]['order_number'])
+        self.assertEqual(order.total_amount, Decimal('2500'))
+        self.assertEqual(order.orderitem_set.count(), 2)
+        self.product.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 98)
+        self.assertEqual(self.customer.outstanding_balance, Decimal('2500'))
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/orders/import/',
+            data={'orders': [{'customer': self.customer.id, 'lines': [{'product': 'TEST001', 'quantity': 1}]}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+
+    def test_import_retries_failed_chunk_order_by_order(self):
+        from unittest import mock
+        from orders import imports
+        other = Product.objects.create(name='Other', sku='OTH1', base_price=500, stock_quantity=3)
+        rows = [
+            {'ref': 'A', 'customer': '09123456789', 'product': 'TEST001', 'quantity': '1'},
+            {'ref': 'C', 'customer': '09123456789', 'product': 'TEST001', 'quantity': '2'},
+            {'ref': 'B', 'customer': '09123456789', 'product': 'OTH1', 'quantity': '2'},
+        ]
+        price = imports._price
+
+        def price_then_sell_out(orders):
+            price(orders)
+            # Stock and credit taken by someone else after validation
+            Product.objects.filter(pk=other.pk).update(stock_quantity=0)
+            Customer.objects.filter(pk=self.customer.pk).update(outstanding_balance=Decimal('98000'))
+
+        with mock.patch.object(imports, '_price', price_then_sell_out):
+            result = imports.import_orders(rows, user=self.user)
+        self.assertEqual([row['status'] for row in result['rows']], ['created', 'error', 'error'])
+        self.assertEqual(result['created'], 1)
+        # The credit error of the rolled back chunk attempt is reported once
+        self.assertEqual(len(result['rows'][1]['errors']), 1)
+        self.assertIn('Credit limit', result['rows'][1]['errors'][0])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 99)
+
+    def test_api_create_uses_service_and_replays_idempotent_retries(self):
+        self.client.force_login(self.user)
+        payload = {'customer': self.customer.id, 'items': [{'product': self.product.id, 'quantity': 3}]}
+        first = self.client.post('/api/orders/', data=payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertTrue(first.json()['order_number'].startswith('ORD-'))
+
+        retry = self.client.post('/api/orders/', data=payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json()['id'], first.json()['id'])
+        self.assertEqual(SalesOrder.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 97)
+
+        changed = dict(payload, items=[{'product': self.product.id, 'quantity': 1}])
+        reused = self.client.post('/api/orders/', data=changed, content_type='application/json',
+                                  HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(reused.status_code, 422)
+
+    def test_bulk_transition_orders(self):
+        from orders.services import transition_orders
+        items = [{'product': self.product, 'quantity': 5, 'unit_price': Decimal('1000'), 'total_price': Decimal('5000')}]
+        normal = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        pre = create_order_from_request(self.customer, items, 'PRE_ORDER', Decimal('0'), '', self.user)
+        pending = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+
+        result = transition_orders([normal.id, pre.id], 'CONFIRMED', user=self.user)
+        self.assertEqual(result, {'updated': [normal.id, pre.id], 'failed': {}})
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/orders/bulk-status/',
+            data={'orders': [normal.id, pre.id, pending.id, 999999], 'status': 'DELIVERED'},
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertEqual(data['updated'], [normal.id, pre.id])
+        self.assertEqual(set(data['failed']), {str(pending.id), '999999'})
+        pre.refresh_from_db()
+        self.assertEqual(pre.status.code, 'DELIVERED')
+        self.assertIsNotNone(pre.delivery_date)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.reserved_quantity), (85, 0))
+
+        extra = create_order_from_request(self.customer, items, 'NORMAL', Decimal('0'), '', self.user)
+        result = transition_orders([pending.id, extra.id, normal.id], 'CANCELLED', user=self.user)
+        self.assertEqual(result['updated'], [pending.id, extra.id])
+        self.product.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 90)
+        self.assertEqual(self.customer.outstanding_balance, Decimal('10000'))
+        restored = StockMovement.objects.filter(movement_type='RETURN', reference_type='SalesOrder')
+        self.assertEqual(
+            sorted(restored.values_list('reference_id', 'quantity')), [(pending.id, 5), (extra.id, 5)]
+        )
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_delivery_manifest_groups_by_route(self):
+        from django.contrib.auth.models import Permission
+        from master_data.models import DeliveryRoute, Township
+        from orders.manifests import build_manifests
+        from orders.services import transition_orders
+        route = DeliveryRoute.objects.create(code='R1', name_en='North Loop')
+        township = Township.objects.first()
+        township.delivery_route = route
+        township.save()
+        self.customer.township = township
+        self.customer.save()
+        walk_in = Customer.objects.create(
+            name='Walk In', phone='0911', customer_type=self.customer.customer_type,
+        )
+        other = Product.objects.create(name='Other', sku='OTH1', base_price=500, stock_quantity=10)
+
+        def line(product, qty):
+            return {
+                'product': product, 'quantity': qty,
+                'unit_price': product.base_price, 'total_price': product.base_price * qty,
+            }
+
+        orders = [
+            create_order_from_request(self.customer, [line(self.product, 2)], 'NORMAL', 0, '', self.user),
+            create_order_from_request(self.customer, [line(self.product, 1), line(other, 3)], 'NORMAL', 0, '', self.user),
+            create_order_from_request(walk_in, [line(other, 1)], 'NORMAL', 0, '', self.user),
+            create_order_from_request(walk_in, [line(other, 4)], 'NORMAL', 0, '', self.user),
+        ]
+        transition_orders([order.id for order in orders[:3]], 'CONFIRMED')
+
+        today = orders[0].order_date
+        with self.assertNumQueries(3):
+            manifests = build_manifests(today)
+        self.assertEqual([m['route_name'] for m in manifests], ['North Loop', ''])
+        north = manifests[0]
+        self.assertEqual(north['order_count'], 2)
+        self.assertEqual({row['name']: row['quantity'] for row in north['pick_list']}, {'Test Product': 3, 'Other': 3})
+        self.assertEqual(len(north['stops']), 1)
+        self.assertEqual(len(north['stops'][0]['order_numbers']), 2)
+        self.assertEqual(manifests[1]['pick_list'][0]['quantity'], 1)
+
+        self.user.user_permissions.add(Permission.objects.get(codename='view_salesorder'))
+        self.client.force_login(self.user)
+        response = self.client.get('/reports/export/manifest/', {'date': today.isoformat(), 'kind': 'drop'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('North Loop', response.content.decode())
+        self.assertContains(self.client.get('/reports/manifest/', {'date': today.isoformat()}), 'North Loop')
+
+    def test_update_order_items_batches_diff_and_totals(self):
+        from common.models import AuditLog
+        other = Product.objects.create(name='Other Product', sku='TEST002', base_price=500, stock_quantity=10)
+        third = Product.objects.create(name='Third Product', sku='TEST003', base_price=200, stock_quantity=10)
+
+        def line(product, qty, price=None):
+            price = product.base_price if price is None else price
+            return {'product': product, 'quantity': qty, 'unit_price': price, 'total_price': price * qty}
+
+        order = create_order_from_request(
+            self.customer, [line(self.product, 5), line(other, 2)], 'NORMAL', Decimal('0'), '', self.user
+        )
+        update_order_items(order, [line(self.product, 3), line(third, 4)], self.user)
+
+        order.refresh_from_db()
+        self.assertEqual((order.subtotal, order.total_amount), (Decimal('3800'), Decimal('3800')))
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('product__sku', 'quantity')),
+            [('TEST001', 3), ('TEST003', 4)],
+        )
+        stock = dict(Product.objects.values_list('sku', 'stock_quantity'))
+        self.assertEqual((stock['TEST001'], stock['TEST002'], stock['TEST003']), (97, 10, 6))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.outstanding_balance, Decimal('3800'))
+        self.assertEqual(AuditLog.objects.filter(model_name='orders.orderitem', action='delete').count(), 1)
+
+        # A price change alone still rewrites the line, without moving stock
+        update_order_items(order, [line(self.product, 3, Decimal('900')), line(third, 4)], self.user)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('3500'))
+        self.assertEqual(order.orderitem_set.get(product=self.product).total_price, Decimal('2700'))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 97)
+
+    def test_stale_version_edits_are_refused(self):
+        from common.concurrency import ConcurrentEditError, claim_version
+        from rest_framework.test import APIClient
+        order = create_order_from_request(
+            self.customer, [{'product': self.product, 'quantity': 1, 'unit_price': Decimal('1000'),
+                             'total_price': Decimal('1000')}], 'NORMAL', Decimal('0'), '', self.user
+        )
+        stale = SalesOrder.objects.get(pk=order.pk)
+        claim_version(order)
+        self.assertEqual(SalesOrder.objects.get(pk=order.pk).version, 2)
+        with self.assertRaises(ConcurrentEditError):
+            claim_version(stale)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/products/{self.product.pk}/'
+        response = client.patch(url, {'name': 'Renamed', 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 2)
+        response = client.patch(url, {'name': 'Lost update', 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.version), ('Renamed', 2))
@@ -5,6 +5,8 @@ app_name = 'orders'
 urlpatterns = [
     path('', views.order_list, name='order_list'),
     path('api/product-prices/', views.product_prices_by_customer, name='product_prices_by_customer'),
+    path('api/customers/', views.quick_customer_search, name='customer_search'),
+    path('api/quote/', views.order_quote, name='order_quote'),
     path('add/', views.order_create, name='order_create'),
     path('<int:pk>/', views.order_detail, name='order_detail'),
     path('<int:pk>/edit/', views.order_update, name='order_edit'),
@@ -1,3 +1,4 @@
+import json
 from decimal import Decimal
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator
@@ -15,15 +16,21 @@ from .forms import OrderUpdateForm, PaymentForm, OrderCreateForm
 from .services import (
     create_order_from_request,
     parse_order_items_from_post,
+    quote_order,
+    release_order_reservations,
     restore_stock_for_deleted_order,
     update_order_items,
 )
 from customers.models import Customer
-from core.models import Product, ProductPriceTier
+from core.catalog import catalog_version
+from core.models import Product
+from core.pricing import resolve_prices
 from master_data.models import OrderStatus, CustomerType, Township, Region
 from master_data.constants import ORDER_CONFIRMED, ORDER_DELIVERED, ORDER_PAID
 
-from common.constants import PAGE_SIZE_ORDERS, LIMIT_CUSTOMER_SEARCH
+from common.concurrency import ConcurrentEditError, claim_version
+from common.constants import PAGE_SIZE_ORDERS
+from common.utils import typeahead_page
 
 from .voucher_views import (
     payment_voucher,
@@ -33,6 +40,17 @@ from .voucher_views import (
 )  # noqa: F401
 
 
+def _order_create_context(form, preselected=''):
+    """Create-form context. Products come from the cached catalog and customers from typeahead search."""
+    return {
+        'title': _('Create Order'),
+        'form': form,
+        'catalog_version': catalog_version(),
+        'customer_types': CustomerType.objects.all(),
+        'preselected_customer': preselected,
+    }
+
+
 def _render_order_create_form(request):
     """Render create order form (GET)."""
     preselected = request.GET.get('customer_id', '')
@@ -44,19 +62,7 @@ def _render_order_create_form(request):
         'customer': initial_customer,
         'discount_amount': Decimal('0'),
     })
-    context = {
-        'title': _('Create Order'),
-        'form': form,
-        'products': Product.objects.filter(
-            is_active=True
-        ).select_related('unit'),
-        'customers': Customer.objects.filter(
-            deleted_at__isnull=True, is_active=True
-        ).select_related('customer_type').order_by('name'),
-        'customer_types': CustomerType.objects.all(),
-        'preselected_customer': preselected,
-    }
-    return render(request, 'orders/create.html', context)
+    return render(request, 'orders/create.html', _order_create_context(form, preselected))
 
 
 def _process_order_create_post(request):
@@ -66,15 +72,7 @@ def _process_order_create_post(request):
     """
     form = OrderCreateForm(data=request.POST)
     if not form.is_valid():
-        context = {
-            'title': _('Create Order'),
-            'form': form,
-            'products': Product.objects.filter(is_active=True).select_related('unit'),
-            'customers': Customer.objects.filter(deleted_at__isnull=True, is_active=True).select_related('customer_type').order_by('name'),
-            'customer_types': CustomerType.objects.all(),
-            'preselected_customer': '',
-        }
-        return None, render(request, 'orders/create.html', context)
+        return None, render(request, 'orders/create.html', _order_create_context(form))
 
     customer = form.cleaned_data['customer']
     order_type = 'PRE_ORDER' if form.cleaned_data['is_pre_order'] else 'NORMAL'
@@ -98,15 +96,7 @@ def _process_order_create_post(request):
             messages.error(request, _('Add at least one valid product.'))
         for err in (stock_errors or []):
             messages.error(request, err)
-        context = {
-            'title': _('Create Order'),
-            'form': form,
-            'products': Product.objects.filter(is_active=True).select_related('unit'),
-            'customers': Customer.objects.filter(deleted_at__isnull=True, is_active=True).select_related('customer_type').order_by('name'),
-            'customer_types': CustomerType.objects.all(),
-            'preselected_customer': '',
-        }
-        return None, render(request, 'orders/create.html', context)
+        return None, render(request, 'orders/create.html', _order_create_context(form))
 
     try:
         order = create_order_from_request(
@@ -122,15 +112,7 @@ def _process_order_create_post(request):
             request,
             _('Error creating order: %(error)s') % {'error': str(e)}
         )
-        context = {
-            'title': _('Create Order'),
-            'form': form,
-            'products': Product.objects.filter(is_active=True).select_related('unit'),
-            'customers': Customer.objects.filter(deleted_at__isnull=True, is_active=True).select_related('customer_type').order_by('name'),
-            'customer_types': CustomerType.objects.all(),
-            'preselected_customer': '',
-        }
-        return None, render(request, 'orders/create.html', context)
+        return None, render(request, 'orders/create.html', _order_create_context(form))
 
     return order, None
 
@@ -213,7 +195,9 @@ def order_list(request):
         'date_from': date_from,
         'date_to': date_to,
         'customer_filter': customer_filter,
-        'customers': Customer.objects.filter(deleted_at__isnull=True, is_active=True).order_by('name'),
+        'selected_customer': (
+            Customer.objects.filter(pk=customer_filter).first() if customer_filter.isdigit() else None
+        ),
         'region_filter': int(region_filter) if region_filter else '',
         'township_filter': int(township_filter) if township_filter else '',
         'regions': regions,
@@ -289,38 +273,16 @@ def order_update(request, pk):
                     messages.error(request, _('Order must have at least one product.'))
                     items_valid = False
                 else:
-                    # Note: parse_order_items_from_post checks current stock.
-                    # For updates, we might be increasing quantity of an existing item.
-                    # The parse function checks `quantity > product.stock_quantity`.
-                    # But if we already hold 5 and want 6, we only need 1 more.
-                    # The parse function is slightly too strict for updates if it checks absolute quantity against stock.
-                    # Let's check `orders/services.py` again.
-                    # Yes: `if order_type == 'NORMAL' and quantity > product.stock_quantity:`
-                    # This check is WRONG for updates if we already have some stock reserved.
-                    # However, fixing `parse_order_items_from_post` might break create?
-                    # No, for create it's fine.
-                    # For update, we should skip stock check in parser and let `update_order_items` (via `deduct_stock`) handle it?
-                    # Or we calculate the delta and check that?
-                    # Let's try to proceed, but be aware of this limitation.
-                    # Actually `deduct_stock` handles validation correctly.
-                    # We can ignore `stock_errors` from parser for updates and rely on `update_order_items`?
-                    # But `parse_order_items_from_post` returns errors.
-                    
-                    # Workaround: We use a modified parser or just manual parsing here?
-                    # Or we accept that we can't update to 10 if we have 5 and stock is 5 (total 10 needed, 5 in stock).
-                    # If we hold 5, stock shows 5 (because we deducted).
-                    # So if we want 10, we need 5 more. Stock has 5.
-                    # If parser checks 10 > 5 -> Error.
-                    # But actually it is allowed.
-                    
-                    # So `parse_order_items_from_post` is NOT suitable for updates as is.
-                    # I'll just parse manually here or use the parser but ignore stock errors, 
-                    # relying on `update_order_items` to catch them.
-                    
+                    # Quantities this order already holds count as available,
+                    # so the stock check only applies to the increase.
+                    held = {}
+                    if order.order_type == 'NORMAL':
+                        for item in order.orderitem_set.all():
+                            held[item.product_id] = held.get(item.product_id, 0) + item.quantity
                     order_items, parse_errors, stock_errors = parse_order_items_from_post(
-                        request.POST, order.customer, order.order_type
+                        request.POST, order.customer, order.order_type, held=held
                     )
-                    # We ignore stock_errors from parser because it doesn't know about currently held stock.
+                    parse_errors = parse_errors + stock_errors
                     
                     if parse_errors:
                         for err in parse_errors: messages.error(request, err)
@@ -331,15 +293,18 @@ def order_update(request, pk):
                     with transaction.atomic():
                         if is_locked:
                             # Preserve status, only update notes and delivery_date
+                            claim_version(order, form.cleaned_data.get('version'))
                             order.delivery_date = form.cleaned_data['delivery_date']
                             order.notes = form.cleaned_data['notes']
-                            order.save(update_fields=['delivery_date', 'notes'])
+                            order.save(update_fields=['delivery_date', 'notes', 'version'])
                         else:
                             form.save()
                             update_order_items(order, order_items, user=request.user)
                             
                         messages.success(request, _('Order updated successfully.'))
                         return redirect('orders:order_detail', pk=order.pk)
+                except ConcurrentEditError as e:
+                    form.add_error(None, str(e))
                 except ValueError as e:
                     messages.error(request, str(e))
     else:
@@ -352,8 +317,8 @@ def order_update(request, pk):
         'order': order,
         'form': form,
         'is_locked': is_locked,
-        'products': Product.objects.filter(is_active=True).select_related('unit'),
-        'existing_items': order.orderitem_set.all(),
+        'catalog_version': catalog_version(),
+        'existing_items': order.orderitem_set.select_related('product', 'product__unit'),
     }
     return render(request, 'orders/order_form.html', context)
 
@@ -419,7 +384,7 @@ def order_delete(request, pk):
     """Soft delete order - sets deleted_at and restores stock."""
     order = get_object_or_404(
         SalesOrder.objects.filter(deleted_at__isnull=True).prefetch_related(
-            'orderitem_set', 'payments', 'return_requests'
+            'orderitem_set', 'payments'
         ),
         pk=pk
     )
@@ -432,7 +397,7 @@ def order_delete(request, pk):
                 _('Cannot delete order with payments. Refund or void payments first.')
             )
             return redirect('orders:order_detail', pk=order.pk)
-        if order.return_requests.exists():
+        if order.has_active_return:
             messages.error(
                 request,
                 _('Cannot delete order with return requests. Process or cancel returns first.')
@@ -445,6 +410,8 @@ def order_delete(request, pk):
                 restore_stock_for_deleted_order(order, user)
             elif order.order_type == 'PRE_ORDER' and order.delivery_date:
                 restore_stock_for_deleted_order(order, user)
+            elif order.order_type == 'PRE_ORDER':
+                release_order_reservations(order)
             order.soft_delete()
         messages.success(request, _('Order deleted successfully.'))
         return redirect('orders:order_list')
@@ -458,21 +425,21 @@ def order_delete(request, pk):
 
 @login_required
 def quick_customer_search(request):
-    """AJAX endpoint for quick customer search"""
-    query = request.GET.get('q', '')
-    
-    if len(query) < 3:
-        return JsonResponse({'customers': []})
-    
+    """AJAX typeahead search over active customers (name, shop name or phone), paginated."""
+    query = request.GET.get('q', '').strip()
     customers = Customer.objects.filter(
         deleted_at__isnull=True, is_active=True
-    ).filter(
-        Q(name__icontains=query) |
-        Q(phone__icontains=query)
-    ).select_related('customer_type')[:LIMIT_CUSTOMER_SEARCH]
-    
+    ).select_related('customer_type').order_by('name', 'id')
+    if query:
+        customers = customers.filter(
+            Q(name__icontains=query) |
+            Q(shop_name__icontains=query) |
+            Q(phone__icontains=query)
+        )
+    rows, page, has_more = typeahead_page(customers, request.GET.get('page'))
+
     customer_data = []
-    for customer in customers:
+    for customer in rows:
         ct = customer.customer_type
         customer_data.append({
             'id': customer.id,
@@ -480,10 +447,10 @@ def quick_customer_search(request):
             'phone': customer.phone,
             'customer_type_id': ct.id if ct else None,
             'customer_type_name': ct.name_en if ct else '',
-            'display_name': customer.name,
+            'display_name': str(customer),
         })
-    
-    return JsonResponse({'customers': customer_data})
+
+    return JsonResponse({'results': customer_data, 'page': page, 'has_more': has_more})
 
 
 @login_required
@@ -498,23 +465,50 @@ def product_prices_by_customer(request):
             deleted_at__isnull=True, is_active=True
         ).get(pk=customer_id)
         
-        products = Product.objects.filter(is_active=True)
-        # Pre-fetch price tiers for this customer type to avoid N+1
-        price_tiers = {
-            pt.product_id: pt.price 
-            for pt in ProductPriceTier.objects.filter(customer_type=customer.customer_type)
+        product_ids = Product.objects.filter(is_active=True).values_list('id', flat=True)
+        prices = {
+            product_id: str(price)
+            for product_id, price in resolve_prices(product_ids, customer.customer_type_id).items()
         }
-        
-        prices = {}
-        for product in products:
-            price = price_tiers.get(product.id, product.base_price)
-            prices[product.id] = str(price)
             
         return JsonResponse({'prices': prices})
     except Customer.DoesNotExist:
         return JsonResponse({'prices': {}})
 
 
+@login_required
+def order_quote(request):
+    """
+    AJAX endpoint: price and validate a whole cart in one request (nothing is saved).
+    JSON body: {customer_id, order_type, discount_amount, lines: [{product_id, quantity}]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'POST required'}, status=405)
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    try:
+        customer = Customer.objects.select_related('township').get(
+            pk=payload.get('customer_id'), is_active=True
+        )
+    except (Customer.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Customer not found'}, status=400)
+    order_type = payload.get('order_type') or 'NORMAL'
+    if order_type not in ('NORMAL', 'PRE_ORDER'):
+        return JsonResponse({'success': False, 'message': 'Invalid order type'}, status=400)
+    try:
+        discount_amount = Decimal(str(payload.get('discount_amount') or 0))
+    except ArithmeticError:
+        return JsonResponse({'success': False, 'message': 'Invalid discount amount'}, status=400)
+    rows = [
+        (line.get('product_id'), line.get('quantity'))
+        for line in payload.get('lines') or [] if isinstance(line, dict)
+    ]
+    quote = quote_order(customer, rows, order_type, discount_amount)
+    return JsonResponse({'success': True, **quote})
+
+
 @login_required
 def get_product_info(request):
     """AJAX endpoint to get product info"""
@@ -523,13 +517,15 @@ def get_product_info(request):
     
     try:
         product = Product.objects.select_related('unit').get(pk=product_id, is_active=True)
-        customer_type = CustomerType.objects.filter(pk=customer_type_id).first() if customer_type_id else None
+        customer_type = int(customer_type_id) if customer_type_id.isdigit() else None
         unit_display = product.unit.name_en if product.unit else ''
+        unit_price = resolve_prices([product.id], customer_type).get(product.id, product.base_price)
         
         return JsonResponse({
             'success': True,
-            'unit_price': str(product.get_price_for_customer_type(customer_type)),
+            'unit_price': str(unit_price),
             'current_stock': product.current_stock,
+            'available_stock': product.available_quantity,
             'unit_type': unit_display,
         })
     except Product.DoesNotExist:
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import DailySalesSummary, DailyInventorySnapshot, DailyPaymentSummary, DailyExpenseSummary
+from .models import (
+    DailySalesSummary, DailyInventorySnapshot, DailyPaymentSummary, DailyExpenseSummary, ReturnRateRollup,
+)
 
 @admin.register(DailySalesSummary)
 class DailySalesSummaryAdmin(admin.ModelAdmin):
@@ -23,3 +25,10 @@ class DailyInventorySnapshotAdmin(admin.ModelAdmin):
     list_filter = ('date', 'product__category')
     search_fields = ('product__name', 'product__sku')
     date_hierarchy = 'date'
+
+@admin.register(ReturnRateRollup)
+class ReturnRateRollupAdmin(admin.ModelAdmin):
+    list_display = ('month', 'product', 'township', 'reason', 'sold_quantity', 'returned_quantity')
+    list_filter = ('month', 'reason')
+    search_fields = ('product__name', 'product__sku')
+    date_hierarchy = 'month'
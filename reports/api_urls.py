@@ -8,6 +8,7 @@ router.register(r'daily-sales', api_views.DailySalesSummaryViewSet)
 router.register(r'daily-inventory', api_views.DailyInventorySnapshotViewSet)
 router.register(r'daily-payments', api_views.DailyPaymentSummaryViewSet)
 router.register(r'daily-expenses', api_views.DailyExpenseSummaryViewSet)
+router.register(r'return-rates', api_views.ReturnRateViewSet, basename='return-rates')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -9,7 +9,7 @@ from .models import DailySalesSummary, DailyInventorySnapshot, DailyPaymentSumma
 from .serializers import (
     DailySalesSummarySerializer, DailyInventorySnapshotSerializer,
     DailyPaymentSummarySerializer, DailyExpenseSummarySerializer,
-    DashboardResponseSerializer
+    DashboardResponseSerializer, ReturnRateSerializer
 )
 
 class DashboardViewSet(viewsets.ViewSet):
@@ -105,3 +105,30 @@ class DailyExpenseSummaryViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['date']
     ordering_fields = ['date', 'total_expense']
+
+class ReturnRateViewSet(viewsets.ViewSet):
+    """
+    Return rate (returned / sold quantity, percent) from the monthly rollup.
+    Query: start_month, end_month (YYYY-MM, default: last 12 months),
+    group_by (comma list of month, product, township, reason; default month),
+    product, township, reason.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses=ReturnRateSerializer(many=True))
+    def list(self, request):
+        from .rollups import month_start, months_back, return_rates
+        params = request.query_params
+        try:
+            end = month_start(params['end_month']) if params.get('end_month') else month_start(timezone.localdate())
+            start = month_start(params['start_month']) if params.get('start_month') else months_back(end, 11)
+            group_by = tuple(name for name in params.get('group_by', 'month').split(',') if name)
+            rates = return_rates(
+                start, end, group_by=group_by,
+                product_id=params.get('product') or None,
+                township_id=params.get('township') or None,
+                reason_id=params.get('reason') or None,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReturnRateSerializer(rates, many=True).data)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.rollups import month_start, rebuild_return_rates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the return-rate rollup from delivered orders and approved returns (run once after migrating)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=str, help='First month to rebuild, YYYY-MM (default: all)')
+        parser.add_argument('--end', type=str, help='Last month to rebuild, YYYY-MM (default: all)')
+
+    def handle(self, *args, **options):
+        try:
+            start = month_start(options['start']) if options['start'] else None
+            end = month_start(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        count = rebuild_return_rates(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Return-rate rollup rebuilt: {count} rows."))
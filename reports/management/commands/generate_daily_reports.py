@@ -5,6 +5,7 @@ from reports.models import DailySalesSummary, DailyInventorySnapshot, DailyPayme
 from orders.models import SalesOrder, OrderItem, Payment
 from accounting.models import Expense
 from core.models import Product, StockMovement
+from core.services import stock_as_of
 import datetime
 
 class Command(BaseCommand):
@@ -124,31 +125,12 @@ class Command(BaseCommand):
         )
 
         # 4. Inventory Snapshot
-        # Logic: Stock @ Date = Current Stock - Sum(Movements AFTER Date)
-        
-        # Get movements strictly after the target date (starting from next day 00:00)
-        # Since created_at is DateTime, we compare against date + 1 day
-        next_day_start = date + datetime.timedelta(days=1)
-        
-        # Pre-calculate movement deltas for all products
-        # We need to sum quantities for all movements where created_at__date >= next_day_start
-        # Actually created_at__gte=next_day_start is more precise
-        
-        future_movements = StockMovement.objects.filter(
-            created_at__date__gte=next_day_start
-        ).values('product').annotate(total_change=Sum('quantity'))
-        
-        future_change_map = {m['product']: m['total_change'] for m in future_movements}
-        
-        products = Product.objects.all()
+        # Stock at end of day comes from the nearest StockCheckpoint, so the
+        # cost does not depend on how many movements happened since.
+        products = list(Product.objects.all())
+        stock_map = stock_as_of([p.id for p in products], date)
         for p in products:
-            current_stock = p.stock_quantity
-            # If we had movements after this date, subtract them to go back in time
-            # e.g. Current=10, Tomorrow we added 5. Stock today was 5. (10 - 5 = 5)
-            # e.g. Current=10, Tomorrow we sold 2 (qty=-2). Stock today was 12. (10 - (-2) = 12)
-            change_after = future_change_map.get(p.id, 0)
-            stock_at_date = current_stock - change_after
-            
+            stock_at_date = stock_map.get(p.id, 0)
             val_price = p.cost_price or p.base_price or 0
             
             DailyInventorySnapshot.objects.update_or_create(
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_product_version'),
+        ('master_data', '0012_supplierphonenumber'),
+        ('reports', '0002_dailypaymentsummary_dailyexpensesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReturnRateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month the order was delivered')),
+                ('sold_quantity', models.PositiveIntegerField(default=0)),
+                ('returned_quantity', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='return_rate_rollups', to='core.product')),
+                ('reason', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='master_data.returnreason')),
+                ('township', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='master_data.township')),
+            ],
+            options={
+                'verbose_name': 'Return Rate Rollup',
+                'verbose_name_plural': 'Return Rate Rollups',
+                'ordering': ['-month', 'product'],
+                'indexes': [models.Index(fields=['month', 'product'], name='reports_ret_month_69d609_idx'), models.Index(fields=['product', 'month'], name='reports_ret_product_6c7279_idx'), models.Index(fields=['township', 'month'], name='reports_ret_townshi_04513b_idx'), models.Index(fields=['reason', 'month'], name='reports_ret_reason__d3936c_idx')],
+            },
+        ),
+    ]
@@ -81,3 +81,35 @@ class DailyExpenseSummary(models.Model):
 
     def __str__(self):
         return f"Expense Summary: {self.date}"
+
+class ReturnRateRollup(models.Model):
+    """
+    Monthly sold and returned quantities per product, township and return
+    reason (reports.rollups keeps it current). Sold quantities sit on rows
+    without a reason, returned quantities on rows with one; reads always sum.
+    """
+    month = models.DateField(help_text=_("First day of the month the order was delivered"))
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='return_rate_rollups')
+    township = models.ForeignKey(
+        'master_data.Township', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    reason = models.ForeignKey(
+        'master_data.ReturnReason', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    sold_quantity = models.PositiveIntegerField(default=0)
+    returned_quantity = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Return Rate Rollup")
+        verbose_name_plural = _("Return Rate Rollups")
+        ordering = ['-month', 'product']
+        indexes = [
+            models.Index(fields=['month', 'product']),
+            models.Index(fields=['product', 'month']),
+            models.Index(fields=['township', 'month']),
+            models.Index(fields=['reason', 'month']),
+        ]
+
+    def __str__(self):
+        return f"Return rate: {self.product_id} in {self.month:%Y-%m}"
@@ -193,7 +193,7 @@ def outstanding_payments_report(request):
         'date_from': date_from,
         'date_to': date_to,
         'customer_id': customer_id,
-        'customers': Customer.objects.filter(deleted_at__isnull=True, is_active=True).order_by('name'),
+        'selected_customer': Customer.objects.filter(pk=customer_id).first() if customer_id.isdigit() else None,
     }
     return render(request, 'reports/outstanding_payments.html', context)
 
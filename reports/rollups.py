@@ -0,0 +1,232 @@
+"""
+Return-rate rollup - returned quantity over sold quantity per product,
+township, return reason and month, read from ReturnRateRollup only.
+
+Both quantities are booked against the month the order was delivered, so a
+month's rate says how much of what went out that month came back. Sold
+quantities are added whenever an order moves into DELIVERED or PAID (the
+SalesOrder save signal, plus the bulk UPDATE paths in orders.services),
+returned quantities when returns are approved (returns.services). The
+backfill_return_rates command rebuilds any range from the source tables.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DateField, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from core.models import Product
+from master_data.constants import ORDER_DELIVERED, ORDER_PAID, RETURN_APPROVED, RETURN_COMPLETED
+from orders.models import OrderItem
+from returns.models import ReturnItem
+from .models import ReturnRateRollup
+
+RATE_DIMENSIONS = ('month', 'product', 'township', 'reason')
+# dimension: (rollup column, {label alias: lookup})
+_DIMENSION_FIELDS = {
+    'month': ('month', {}),
+    'product': ('product_id', {'product_name': F('product__name')}),
+    'township': ('township_id', {'township_name': F('township__name_en')}),
+    'reason': ('reason_id', {'reason_name': F('reason__name_en')}),
+}
+_KEY = ('month', 'product_id', 'township_id', 'reason_id')
+
+
+def month_start(value):
+    """First day of value's month; value is a date or 'YYYY-MM' / 'YYYY-MM-DD'."""
+    if isinstance(value, str):
+        parts = value.split('-')
+        if len(parts) < 2:
+            raise ValueError(f"Invalid month: {value!r} (expected YYYY-MM)")
+        return date(int(parts[0]), int(parts[1]), 1)
+    return value.replace(day=1)
+
+
+def _delivery_month(order_path):
+    return TruncMonth(
+        Coalesce(f'{order_path}delivery_date', f'{order_path}order_date'), output_field=DateField()
+    )
+
+
+def _sold_rows(items):
+    return items.exclude(order__order_type='REPLACEMENT').values(
+        'product_id', month=_delivery_month('order__'), township_id=F('order__customer__township_id'),
+    ).annotate(quantity=Sum('quantity')).order_by()
+
+
+def _returned_rows(items):
+    return items.values(
+        'product_id', 'reason_id',
+        month=_delivery_month('return_request__order__'),
+        township_id=F('return_request__order__customer__township_id'),
+    ).annotate(quantity=Sum('quantity')).order_by()
+
+
+def _add(rows, field, sign=1):
+    """
+    Add grouped quantities (times sign) to the rollup: F() increments on
+    existing buckets, one INSERT for new ones. The products' row locks (the
+    ones the stock paths take) serialize writers, so two of them can't both
+    insert the same bucket.
+    """
+    deltas = {}
+    for row in rows:
+        key = (row['month'], row['product_id'], row['township_id'], row.get('reason_id'))
+        deltas[key] = deltas.get(key, 0) + sign * row['quantity']
+    if not deltas:
+        return
+    with transaction.atomic():
+        list(
+            Product.all_objects.select_for_update().filter(id__in={key[1] for key in deltas})
+            .order_by('id').values_list('id', flat=True)
+        )
+        existing = {}
+        for rollup in ReturnRateRollup.objects.filter(
+            month__in={key[0] for key in deltas}, product_id__in={key[1] for key in deltas},
+        ).only(*_KEY):
+            existing.setdefault(tuple(getattr(rollup, name) for name in _KEY), rollup)
+        to_update, to_create = [], []
+        for key, quantity in deltas.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                to_create.append(ReturnRateRollup(**dict(zip(_KEY, key)), **{field: quantity}))
+            else:
+                setattr(rollup, field, F(field) + quantity)
+                rollup.updated_at = timezone.now()
+                to_update.append(rollup)
+        ReturnRateRollup.objects.bulk_update(to_update, [field, 'updated_at'], batch_size=500)
+        ReturnRateRollup.objects.bulk_create(to_create, batch_size=500)
+
+
+def record_deliveries(order_ids, undo=False):
+    """
+    Book the sold quantities of orders that became DELIVERED or PAID
+    (replacement orders are not sales); undo takes them back off when an
+    order leaves those statuses.
+    """
+    _add(
+        _sold_rows(OrderItem.objects.filter(order_id__in=list(order_ids))), 'sold_quantity', sign=-1 if undo else 1
+    )
+
+
+def record_returns(return_ids):
+    """Book the returned quantities of newly approved returns."""
+    _add(_returned_rows(ReturnItem.objects.filter(return_request_id__in=list(return_ids))), 'returned_quantity')
+
+
+def rebuild_return_rates(start=None, end=None):
+    """
+    Recompute the rollup from orders and returns for months start..end
+    (inclusive, default: everything). Sold = DELIVERED or PAID orders,
+    returned = APPROVED or COMPLETED returns.
+    Returns: number of rollup rows written.
+    """
+    rollups = ReturnRateRollup.objects.all()
+    items = OrderItem.objects.filter(
+        order__deleted_at__isnull=True, order__status__code__in=[ORDER_DELIVERED, ORDER_PAID],
+    ).annotate(delivery_month=_delivery_month('order__'))
+    returned = ReturnItem.objects.filter(
+        return_request__deleted_at__isnull=True,
+        return_request__status__code__in=[RETURN_APPROVED, RETURN_COMPLETED],
+    ).annotate(delivery_month=_delivery_month('return_request__order__'))
+    if start:
+        rollups = rollups.filter(month__gte=month_start(start))
+        items = items.filter(delivery_month__gte=month_start(start))
+        returned = returned.filter(delivery_month__gte=month_start(start))
+    if end:
+        rollups = rollups.filter(month__lte=month_start(end))
+        items = items.filter(delivery_month__lte=month_start(end))
+        returned = returned.filter(delivery_month__lte=month_start(end))
+    with transaction.atomic():
+        rollups.delete()
+        created = ReturnRateRollup.objects.bulk_create([
+            ReturnRateRollup(
+                month=row['month'], product_id=row['product_id'], township_id=row['township_id'],
+                reason_id=row.get('reason_id'), **{field: row['quantity']}
+            )
+            for rows, field in ((_sold_rows(items), 'sold_quantity'), (_returned_rows(returned), 'returned_quantity'))
+            for row in rows
+        ], batch_size=1000)
+    return len(created)
+
+
+def _rate(returned, sold):
+    if not sold:
+        return None
+    return (Decimal(returned) * 100 / sold).quantize(Decimal('0.01'))
+
+
+def return_rates(start, end, group_by=('month',), product_id=None, township_id=None, reason_id=None):
+    """
+    Return rates for months start..end grouped by any of RATE_DIMENSIONS.
+    Grouping or filtering by reason divides that reason's returns by all
+    sales of the other dimensions.
+    Returns: list of dicts with the dimension ids/names, sold, returned and
+    rate (percent, None without sales), by month then most returned.
+    """
+    if not group_by:
+        raise ValueError("Group return rates by at least one of: " + ', '.join(RATE_DIMENSIONS))
+    unknown = set(group_by) - set(RATE_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Cannot group return rates by: {', '.join(sorted(unknown))}")
+    rows = ReturnRateRollup.objects.filter(month__range=(month_start(start), month_start(end)))
+    if product_id:
+        rows = rows.filter(product_id=product_id)
+    if township_id:
+        rows = rows.filter(township_id=township_id)
+    columns, labels = [], {}
+    for dimension in RATE_DIMENSIONS:
+        if dimension in group_by and dimension != 'reason':
+            columns.append(_DIMENSION_FIELDS[dimension][0])
+            labels.update(_DIMENSION_FIELDS[dimension][1])
+
+    if 'reason' not in group_by and not reason_id:
+        results = list(rows.values(*columns, **labels).annotate(
+            sold=Coalesce(Sum('sold_quantity'), 0), returned=Coalesce(Sum('returned_quantity'), 0),
+        ).order_by())
+    else:
+        sold_key = list(columns)
+        sold = {
+            tuple(row[name] for name in sold_key): row['sold']
+            for row in rows.values(*columns).annotate(sold=Sum('sold_quantity')).order_by()
+        } if columns else {(): rows.aggregate(sold=Sum('sold_quantity'))['sold']}
+        returned = rows.filter(reason_id=reason_id) if reason_id else rows.filter(reason__isnull=False)
+        if 'reason' in group_by:
+            columns.append(_DIMENSION_FIELDS['reason'][0])
+            labels.update(_DIMENSION_FIELDS['reason'][1])
+        results = list(returned.values(*columns, **labels).annotate(returned=Sum('returned_quantity')).order_by())
+        for row in results:
+            row['sold'] = sold.get(tuple(row[name] for name in sold_key)) or 0
+    for row in results:
+        row['rate'] = _rate(row['returned'], row['sold'])
+    results.sort(key=lambda row: (row.get('month') or date.min, -row['returned'], -row['sold']))
+    return results
+
+
+def months_back(month, count):
+    """First day of the month count months before month."""
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def rate_rows(rates, group_by):
+    """
+    Flatten return_rates() output for the export layer.
+    Returns: (headers, rows).
+    """
+    columns = {
+        'month': ('Month', lambda row: row['month'].strftime('%Y-%m')),
+        'product': ('Product', lambda row: row['product_name']),
+        'township': ('Township', lambda row: row['township_name'] or '-'),
+        'reason': ('Reason', lambda row: row['reason_name'] or '-'),
+    }
+    dimensions = [columns[dimension] for dimension in RATE_DIMENSIONS if dimension in group_by]
+    headers = [title for title, _value in dimensions] + ['Sold', 'Returned', 'Return Rate %']
+    rows = [
+        [value(row) for _title, value in dimensions]
+        + [row['sold'], row['returned'], '' if row['rate'] is None else str(row['rate'])]
+        for row in rates
+    ]
+    return headers, rows
@@ -50,3 +50,16 @@ class DashboardChartDataSerializer(serializers.Serializer):
 class DashboardResponseSerializer(serializers.Serializer):
     today_summary = DashboardSummarySerializer()
     chart_data = DashboardChartDataSerializer()
+
+class ReturnRateSerializer(serializers.Serializer):
+    """One return_rates() row; only the grouped dimensions are present."""
+    month = serializers.DateField(required=False)
+    product_id = serializers.IntegerField(required=False)
+    product_name = serializers.CharField(required=False)
+    township_id = serializers.IntegerField(required=False, allow_null=True)
+    township_name = serializers.CharField(required=False, allow_null=True)
+    reason_id = serializers.IntegerField(required=False, allow_null=True)
+    reason_name = serializers.CharField(required=False, allow_null=True)
+    sold = serializers.IntegerField()
+    returned = serializers.IntegerField()
+    rate = serializers.DecimalField(max_digits=7, decimal_places=2, allow_null=True)
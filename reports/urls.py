@@ -12,6 +12,8 @@ urlpatterns = [
     path('export/orders/', views.export_orders, name='export_orders'),
     path('export/returns/', views.export_returns, name='export_returns'),
     path('export/inventory/', views.export_inventory, name='export_inventory'),
+    path('manifest/', views.delivery_manifest, name='delivery_manifest'),
+    path('export/manifest/', views.export_manifest, name='export_manifest'),
     path('payments/', views.payment_report, name='payment_report'),
     path('export/payments/', views.export_payments, name='export_payments'),
     path('outstanding/', views.outstanding_payments_report, name='outstanding_payments'),
@@ -12,7 +12,6 @@ from datetime import timedelta, datetime
 
 from orders.models import SalesOrder, OrderItem, Payment
 from core.models import Product, StockMovement
-from returns.models import ReturnItem, ReturnRequest
 from master_data.models import OrderStatus, ReturnReason
 from master_data.constants import PURCHASE_RECEIVED
 from common.models import AuditLog
@@ -291,40 +290,22 @@ def export_orders(request):
 @login_required
 @permission_required('returns.view_returnrequest', raise_exception=True)
 def export_returns(request):
-    """Export returns to CSV or Excel or PDF."""
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-    reason_id = request.GET.get('reason', '')
-    product_id = request.GET.get('product', '')
-    
-    returns = ReturnRequest.objects.filter(
-        deleted_at__isnull=True
-    ).select_related(
-        'order', 'status', 'return_type'
-    ).order_by('-created_at')
-    
-    if start_date:
-        returns = returns.filter(created_at__date__gte=start_date)
-    if end_date:
-        returns = returns.filter(created_at__date__lte=end_date)
-    if reason_id:
-        returns = returns.filter(returnitem__reason_id=reason_id).distinct()
-    if product_id:
-        returns = returns.filter(returnitem__product_id=product_id).distinct()
-        
-    returns = returns[:LIMIT_EXPORT_ROWS]
+    """Export the return-rate breakdown to CSV or Excel or PDF."""
+    from reports.rollups import rate_rows, return_rates
+    params = _return_rate_params(request)
+    group_by = (params['group'],)
+    headers, rows = rate_rows(return_rates(
+        params['start'], params['end'], group_by=group_by, product_id=params['product_id'],
+        township_id=params['township_id'], reason_id=params['reason_id'],
+    ), group_by)
 
     fmt = request.GET.get('format', 'csv')
-    headers = ['Return #', 'Order #', 'Status', 'Type', 'Amount', 'Date']
-    rows = [[r.return_number, r.order.order_number, r.status.name_en if r.status else '',
-             r.return_type.name_en if r.return_type else '', str(r.total_amount),
-             r.created_at.strftime('%Y-%m-%d')] for r in returns]
-    
     if fmt == 'pdf':
         response = HttpResponse(content_type='application/pdf')
         response['Content-Disposition'] = 'attachment; filename="returns_export.pdf"'
         orientation = request.GET.get('orientation', 'landscape')
-        return _export_pdf(response, rows, headers, title="Returns Report", orientation=orientation)
+        title = f"Return Rates ({params['start']:%Y-%m} to {params['end']:%Y-%m})"
+        return _export_pdf(response, rows, headers, title=title, orientation=orientation)
 
     if fmt == 'xlsx':
         response = HttpResponse(
@@ -482,7 +463,7 @@ def sales_report(request):
 
     # Status options for filter
     statuses = OrderStatus.objects.all()
-    customers = Customer.objects.filter(is_active=True).order_by('name')
+    selected_customer = Customer.objects.filter(pk=customer_id).first() if str(customer_id).isdigit() else None
 
     return render(request, 'reports/sales_report.html', {
         'sales_total': total_sales,
@@ -494,7 +475,7 @@ def sales_report(request):
         'start_date': start,
         'end_date': end,
         'statuses': statuses,
-        'customers': customers,
+        'selected_customer': selected_customer,
         'current_status': int(status_id) if status_id else '',
         'current_customer': int(customer_id) if customer_id else '',
         'date_from': start_date,
@@ -509,46 +490,59 @@ def report_index(request):
     return render(request, 'reports/report_index.html')
 
 
+def _return_rate_params(request):
+    """Month range (default: the last 12 months), grouping and filters from GET."""
+    from reports.rollups import month_start, months_back, RATE_DIMENSIONS
+    try:
+        end = month_start(request.GET.get('end_month', ''))
+    except ValueError:
+        end = month_start(timezone.localdate())
+    try:
+        start = month_start(request.GET.get('start_month', ''))
+    except ValueError:
+        start = months_back(end, 11)
+    group = request.GET.get('group', '')
+    ids = {}
+    for name in ('product', 'township', 'reason'):
+        value = request.GET.get(name, '')
+        ids[f'{name}_id'] = int(value) if value.isdigit() else None
+    return {
+        'start': min(start, end),
+        'end': end,
+        'group': group if group in RATE_DIMENSIONS and group != 'month' else 'product',
+        **ids,
+    }
+
+
 @login_required
 @permission_required('returns.view_returnrequest', raise_exception=True)
 def return_report(request):
-    """Return analysis."""
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-    reason_id = request.GET.get('reason', '')
-    product_id = request.GET.get('product', '')
-    
-    returns_qs = ReturnItem.objects.filter(
-        return_request__deleted_at__isnull=True
-    )
-    
-    if start_date:
-        returns_qs = returns_qs.filter(return_request__created_at__date__gte=start_date)
-    if end_date:
-        returns_qs = returns_qs.filter(return_request__created_at__date__lte=end_date)
-    if reason_id:
-        returns_qs = returns_qs.filter(reason_id=reason_id)
-    if product_id:
-        returns_qs = returns_qs.filter(product_id=product_id)
-        
-    returns = returns_qs.values(
-        'product__name', 'reason__name_en'
-    ).annotate(
-        count=Count('id'),
-        total_qty=Sum('quantity')
-    ).order_by('-count')[:50]
+    """Return rate (returned / sold quantity) trend and breakdown, read from the monthly rollup."""
+    from master_data.models import Township
+    from reports.rollups import return_rates
+    params = _return_rate_params(request)
+    filters = {key: params[key] for key in ('product_id', 'township_id', 'reason_id')}
+    trend = return_rates(params['start'], params['end'], group_by=('month',), **filters)
+    breakdown = return_rates(params['start'], params['end'], group_by=(params['group'],), **filters)
+    breakdown.sort(key=lambda row: (-row['returned'], -row['sold']))
 
     reasons = ReturnReason.objects.filter(is_active=True).order_by('name_en')
-    products = Product.objects.filter(is_active=True).order_by('name')
+    townships = Township.objects.filter(is_active=True).order_by('name_en')
+    product_id = params['product_id']
+    selected_product = Product.objects.filter(pk=product_id).first() if product_id else None
 
     return render(request, 'reports/return_report.html', {
-        'returns': returns,
+        'trend': trend,
+        'breakdown': breakdown,
+        'group': params['group'],
         'reasons': reasons,
-        'products': products,
-        'date_from': start_date,
-        'date_to': end_date,
-        'current_reason': int(reason_id) if reason_id else '',
-        'current_product': int(product_id) if product_id else '',
+        'townships': townships,
+        'selected_product': selected_product,
+        'month_from': params['start'].strftime('%Y-%m'),
+        'month_to': params['end'].strftime('%Y-%m'),
+        'current_reason': params['reason_id'] or '',
+        'current_township': params['township_id'] or '',
+        'current_product': product_id or '',
     })
 
 
@@ -862,3 +856,65 @@ def export_audit_log(request):
     response['Content-Disposition'] = 'attachment; filename="audit_log.csv"'
     return _export_csv(response, rows, headers)
 
+
+def _manifest_params(request):
+    """Dispatch date range and route from GET (date defaults to today; route 0 = unrouted)."""
+    today = timezone.localdate()
+    try:
+        start = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start = today
+    try:
+        end = datetime.strptime(request.GET.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end = start
+    route = request.GET.get('route', '')
+    return start, max(start, end), int(route) if route.isdigit() else None
+
+
+@login_required
+@permission_required('orders.view_salesorder', raise_exception=True)
+def delivery_manifest(request):
+    """Confirmed orders per delivery route and day: pick list and drop list per stop."""
+    from master_data.models import DeliveryRoute
+    from orders.manifests import build_manifests
+    start, end, route_id = _manifest_params(request)
+    return render(request, 'reports/delivery_manifest.html', {
+        'manifests': build_manifests(start, end, route_id=route_id),
+        'routes': DeliveryRoute.objects.filter(is_active=True).order_by('name_en'),
+        'date_from': start.isoformat(),
+        'date_to': end.isoformat(),
+        'current_route': route_id,
+    })
+
+
+@login_required
+@permission_required('orders.view_salesorder', raise_exception=True)
+def export_manifest(request):
+    """Export the pick list (kind=pick) or drop list (kind=drop) to CSV, Excel or PDF."""
+    from orders.manifests import build_manifests, manifest_rows
+    start, end, route_id = _manifest_params(request)
+    kind = 'drop' if request.GET.get('kind') == 'drop' else 'pick'
+    headers, rows = manifest_rows(build_manifests(start, end, route_id=route_id), kind)
+    fmt = request.GET.get('format', 'csv')
+    filename = f"{kind}_list_{start:%Y%m%d}"
+
+    if fmt == 'pdf':
+        response = HttpResponse(content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
+        title = "Drop List" if kind == 'drop' else "Pick List"
+        period = f"{start}" if start == end else f"{start} to {end}"
+        orientation = request.GET.get('orientation', 'landscape')
+        return _export_pdf(response, rows, headers, title=f"{title} ({period})", orientation=orientation)
+
+    if fmt == 'xlsx':
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+        result = _export_excel(response, rows, headers, 'Drop List' if kind == 'drop' else 'Pick List')
+        if result:
+            return result
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return _export_csv(response, rows, headers)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils import timezone
 from master_data.constants import RETURN_APPROVED, RETURN_COMPLETED
 from .models import ReturnRequest, ReturnItem, ReturnProcessing
+from .services import sync_active_return_flags
 
 
 class ReturnItemInline(admin.TabularInline):
@@ -24,7 +25,9 @@ class ReturnRequestAdmin(admin.ModelAdmin):
     def delete_queryset(self, request, queryset):
         """Soft delete: set deleted_at instead of hard delete. Skip APPROVED/COMPLETED."""
         to_soft_delete = queryset.exclude(status__code__in=(RETURN_APPROVED, RETURN_COMPLETED))
-        count, _ = to_soft_delete.update(deleted_at=timezone.now())
+        order_ids = list(to_soft_delete.values_list('order_id', flat=True))
+        count = to_soft_delete.update(deleted_at=timezone.now())
+        sync_active_return_flags(order_ids)
         skipped = queryset.count() - count
         if skipped > 0:
             from django.contrib import messages
@@ -1,7 +1,12 @@
 from rest_framework import viewsets, permissions, filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import ReturnRequest, ReturnItem, ReturnProcessing
-from .serializers import ReturnRequestSerializer, ReturnRequestCreateSerializer, ReturnItemSerializer, ReturnProcessingSerializer
+from .serializers import (
+    ReturnApprovalSerializer, ReturnItemSerializer, ReturnProcessingSerializer, ReturnRequestCreateSerializer,
+    ReturnRequestSerializer,
+)
 
 class ReturnRequestViewSet(viewsets.ModelViewSet):
     queryset = ReturnRequest.objects.all()
@@ -16,6 +21,17 @@ class ReturnRequestViewSet(viewsets.ModelViewSet):
             return ReturnRequestCreateSerializer
         return ReturnRequestSerializer
 
+    @action(detail=False, methods=['post'])
+    def approve(self, request):
+        """Approve many pending returns: {"returns": [id, ...], "notes": ""}. Reports per-return failures."""
+        from returns.services import approve_returns
+        serializer = ReturnApprovalSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = approve_returns(
+            serializer.validated_data['returns'], notes=serializer.validated_data['notes'], user=request.user,
+        )
+        return Response(result)
+
 class ReturnItemViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ReturnItem.objects.all()
     serializer_class = ReturnItemSerializer
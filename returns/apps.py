@@ -6,3 +6,6 @@ class ReturnsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'returns'
     verbose_name = _("Returns")
+
+    def ready(self):
+        import returns.signals  # noqa: F401
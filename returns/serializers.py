@@ -29,6 +29,11 @@ class ReturnProcessingSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['processed_at', 'processed_by']
 
+class ReturnApprovalSerializer(serializers.Serializer):
+    """Many pending returns approved at once (see returns.services.approve_returns)."""
+    returns = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
 class ReturnRequestSerializer(serializers.ModelSerializer):
     status_detail = ReturnRequestStatusSerializer(source='status', read_only=True)
     return_type_detail = ReturnTypeSerializer(source='return_type', read_only=True)
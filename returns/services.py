@@ -2,17 +2,21 @@
 Return services - create, approve, reject.
 """
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Exists, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext as _
 from django.conf import settings
 
+from common.audit import log_bulk_create, log_bulk_update
+from common.sequences import max_issued, next_number
 from returns.models import ReturnRequest, ReturnItem, ReturnProcessing
 from orders.models import SalesOrder, OrderItem
-from core.services import restore_stock, deduct_stock
+from core.services import deduct_stock_many, restore_stock_for_documents
 from master_data.models import ReturnRequestStatus, ReturnType, OrderStatus
-from master_data.constants import RETURN_PENDING, RETURN_APPROVED, RETURN_REJECTED, RETURN_COMPLETED, ORDER_PENDING
+from master_data.constants import RETURN_PENDING, RETURN_REJECTED, RETURN_COMPLETED, ORDER_PENDING
 from orders.services import get_next_order_number
+from reports.rollups import record_returns
 
 
 def formset_to_items_with_reasons(formset, order_items):
@@ -41,17 +45,14 @@ def formset_to_items_with_reasons(formset, order_items):
 
 
 def _get_next_return_number():
-    """Generate return number: RET-YYYY-NNNN."""
+    """Generate return number: RET-YYYY-NNNN (from the year's DocumentSequence)."""
     from django.conf import settings
     prefix = getattr(settings, 'RETURN_NUMBER_PREFIX', 'RET')
-    year = timezone.now().year
-    last = ReturnRequest.objects.filter(
-        return_number__startswith=f"{prefix}-{year}-"
-    ).order_by('-return_number').values_list('return_number', flat=True).first()
-    if last:
-        seq = int(last.split('-')[-1]) + 1
-    else:
-        seq = 1
+    year = str(timezone.now().year)
+    seq = next_number(
+        'RETURN', year,
+        seed=lambda: max_issued(ReturnRequest.all_objects, 'return_number', f"{prefix}-{year}-"),
+    )
     return f"{prefix}-{year}-{seq:04d}"
 
 
@@ -74,80 +75,133 @@ def create_return_request(order, items_with_reasons, return_type, notes=''):
         if days_since > return_days:
             raise ValueError(f"Return window exceeded. Limit: {return_days} days")
 
-    # Check if active return request exists
-    if order.return_requests.filter(deleted_at__isnull=True).exists():
-        raise ValueError(_("This order already has a return request."))
-
     with transaction.atomic():
+        # The order row lock serialises concurrent requests for the same order
+        has_active_return = SalesOrder.all_objects.select_for_update().filter(
+            pk=order.pk
+        ).values_list('has_active_return', flat=True).first()
+        if has_active_return:
+            raise ValueError(_("This order already has a return request."))
+
+        requested = {}
+        for item_data in items_with_reasons:
+            requested[item_data['order_item_id']] = requested.get(item_data['order_item_id'], 0) + item_data['quantity']
+        order_items = {
+            item.id: item
+            for item in OrderItem.objects.filter(order=order, id__in=list(requested)).select_related(
+                'product'
+            ).annotate(returned_qty=Coalesce(Sum('return_items__quantity'), Value(0)))
+        }
+        for order_item_id, quantity in requested.items():
+            order_item = order_items.get(order_item_id)
+            if order_item is None:
+                raise ValueError(_("Order item %(id)s is not part of this order.") % {'id': order_item_id})
+            available_to_return = order_item.quantity - order_item.returned_qty
+            if quantity > available_to_return:
+                raise ValueError(
+                    _("Return quantity exceeds available for %(product)s (max: %(max)s)") % {
+                        'product': order_item.product.name,
+                        'max': available_to_return
+                    }
+                )
+
         pending = ReturnRequestStatus.get_by_code(RETURN_PENDING)
         ret = ReturnRequest.objects.create(
             order=order,
             return_number=_get_next_return_number(),
             status=pending,
             return_type=return_type,
-            total_amount=0,
+            total_amount=sum(
+                order_items[item_data['order_item_id']].unit_price * item_data['quantity']
+                for item_data in items_with_reasons
+            ),
             notes=notes,
         )
-        total = 0
-        for item_data in items_with_reasons:
-            from orders.models import OrderItem
-            order_item = OrderItem.objects.get(id=item_data['order_item_id'])
-            already_returned = order_item.return_items.aggregate(total=Sum('quantity'))['total'] or 0
-            available_to_return = order_item.quantity - already_returned
-            if item_data['quantity'] > available_to_return:
-                raise ValueError(
-                    _("Return quantity exceeds available for %(product)s (max: %(max)s)") % {
-                        'product': order_item.product.name,
-                        'max': available_to_return
-                    }
-                )
-            ReturnItem.objects.create(
+        items = ReturnItem.objects.bulk_create([
+            ReturnItem(
                 return_request=ret,
-                order_item=order_item,
-                product=order_item.product,
+                order_item=order_items[item_data['order_item_id']],
+                product_id=order_items[item_data['order_item_id']].product_id,
                 quantity=item_data['quantity'],
                 reason_id=item_data['reason_id'],
                 return_to_stock=item_data.get('return_to_stock', True),
                 condition_notes=item_data.get('condition_notes', ''),
             )
-            total += order_item.unit_price * item_data['quantity']
-        ret.total_amount = total
-        ret.save(update_fields=['total_amount'])
+            for item_data in items_with_reasons
+        ])
+        log_bulk_create(items)
+        order.has_active_return = True
     return ret
 
 
-def approve_return(return_id, notes='', user=None):
-    """Approve return, restore stock."""
+def sync_active_return_flags(order_ids):
+    """Recompute SalesOrder.has_active_return for the given orders in one UPDATE."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    SalesOrder.all_objects.filter(id__in=order_ids).update(has_active_return=Exists(
+        ReturnRequest.objects.filter(order=OuterRef('pk'), deleted_at__isnull=True)
+    ))
+
+
+def approve_returns(return_ids, notes='', user=None):
+    """
+    Approve several pending returns in one transaction: one items query, one
+    stock restoration and one status UPDATE for all of them.
+    Returns: {'approved': [return ids], 'failed': {return_id: message}}.
+    """
+    return_ids = list(dict.fromkeys(return_ids))
+    failed = {}
     with transaction.atomic():
-        ret = ReturnRequest.objects.filter(
+        returns = ReturnRequest.objects.filter(
             deleted_at__isnull=True
-        ).select_for_update().get(id=return_id)
-        approved = ReturnRequestStatus.get_by_code(RETURN_APPROVED)
-        completed = ReturnRequestStatus.get_by_code(RETURN_COMPLETED)
+        ).select_for_update().select_related('status').in_bulk(return_ids)
+        approvable = []
+        for return_id in return_ids:
+            ret = returns.get(return_id)
+            if ret is None:
+                failed[return_id] = str(_("Return request not found."))
+            elif ret.status.code != RETURN_PENDING:
+                failed[return_id] = str(_("Only pending returns can be approved."))
+            else:
+                approvable.append(ret)
+        if not approvable:
+            return {'approved': [], 'failed': failed}
 
-        ReturnProcessing.objects.create(
-            return_request=ret,
-            action='Approved',
-            notes=notes,
-            processed_by=user,
-        )
+        lines = {ret.id: [] for ret in approvable}
+        partial = set()
+        for return_id, product_id, quantity, return_to_stock in ReturnItem.objects.filter(
+            return_request_id__in=list(lines)
+        ).values_list('return_request_id', 'product_id', 'quantity', 'return_to_stock'):
+            if return_to_stock:
+                lines[return_id].append((product_id, quantity))
+            else:
+                partial.add(return_id)
+        restore_stock_for_documents(lines, 'ReturnRequest', user=user)
 
-        for item in ret.items.all():
-            if item.return_to_stock:
-                restore_stock(
-                    item.product.id, item.quantity, 'ReturnRequest', ret.id,
-                    user=user
-                )
+        processing = ReturnProcessing.objects.bulk_create([
+            ReturnProcessing(return_request=ret, action=action, notes=notes, processed_by=user)
+            for ret in approvable
+            for action in ('Approved', 'Stock Restored (Partial)' if ret.id in partial else 'Stock Restored')
+        ])
+        log_bulk_create(processing, user=user)
+        completed = ReturnRequestStatus.get_by_code(RETURN_COMPLETED)
+        ReturnRequest.objects.filter(id__in=list(lines)).update(status=completed, updated_at=timezone.now())
+        old_values = {}
+        for ret in approvable:
+            old_values[ret.id] = {'status': ret.status}
+            ret.status = completed
+        log_bulk_update(approvable, old_values, user=user)
+        record_returns(list(lines))
+    return {'approved': [ret.id for ret in approvable], 'failed': failed}
 
-        ReturnProcessing.objects.create(
-            return_request=ret,
-            action='Stock Restored (Partial)' if ret.items.filter(return_to_stock=False).exists() else 'Stock Restored',
-            notes=notes,
-            processed_by=user,
-        )
-        ret.status = completed
-        ret.save(update_fields=['status'])
-    return ret
+
+def approve_return(return_id, notes='', user=None):
+    """Approve one return and restore its stock. Raises ValueError if it cannot be approved."""
+    result = approve_returns([return_id], notes=notes, user=user)
+    if result['failed']:
+        raise ValueError(result['failed'][return_id])
+    return ReturnRequest.objects.get(id=return_id)
 
 
 def reject_return(return_id, notes='', user=None):
@@ -198,7 +252,8 @@ def create_replacement_order(return_request, user=None):
         )
 
         # Create Order Items
-        for return_item in return_request.items.all():
+        return_items = list(return_request.items.all())
+        for return_item in return_items:
             OrderItem.objects.create(
                 order=new_order,
                 product=return_item.product,
@@ -206,15 +261,14 @@ def create_replacement_order(return_request, user=None):
                 unit_price=0,  # Free replacement
                 total_price=0
             )
-            
-            # Deduct stock for replacement items
-            deduct_stock(
-                product_id=return_item.product.id,
-                quantity=return_item.quantity,
-                reference_type='SalesOrder',
-                reference_id=new_order.id,
-                user=user
-            )
+
+        # Deduct stock for replacement items
+        deduct_stock_many(
+            [(return_item.product_id, return_item.quantity) for return_item in return_items],
+            reference_type='SalesOrder',
+            reference_id=new_order.id,
+            user=user
+        )
         
         # Link back
         return_request.replacement_order = new_order
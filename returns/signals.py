@@ -0,0 +1,21 @@
+"""
+Return signals - keep SalesOrder.has_active_return in sync with return requests.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ReturnRequest
+from .services import sync_active_return_flags
+
+
+@receiver(post_save, sender=ReturnRequest)
+def return_request_post_save(sender, instance, created, update_fields=None, **kwargs):
+    """Flag the order when a return is created, soft deleted or restored."""
+    if created or update_fields is None or 'deleted_at' in update_fields:
+        sync_active_return_flags([instance.order_id])
+
+
+@receiver(post_delete, sender=ReturnRequest)
+def return_request_post_delete(sender, instance, **kwargs):
+    """Clear the flag when a return request is hard deleted."""
+    sync_active_return_flags([instance.order_id])
@@ -1,9 +1,11 @@
 from decimal import Decimal
+from io import StringIO
 from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
 from django.utils import timezone
 
+from common.models import AuditLog
 from customers.models import Customer
 from core.models import Product, ProductPriceTier
 from master_data.models import CustomerType, ProductCategory, UnitOfMeasure, ReturnType, ReturnReason
@@ -142,3 +144,129 @@ class ReturnRestrictionTests(TestCase):
         response = self.client.get(reverse('returns:return_create'))
         orders_in_context = response.context['orders']
         self.assertIn(order2, orders_in_context)
+
+    def test_batched_return_approval_and_active_flag(self):
+        from rest_framework.test import APIClient
+        other = SalesOrder.objects.create(
+            customer=self.customer, order_number='ORD-003', status=self.delivered_status,
+            delivery_date=timezone.now().date(), total_amount=3000, created_by=self.user
+        )
+        other_item = OrderItem.objects.create(
+            order=other, product=self.product, quantity=3, unit_price=1000, total_price=3000
+        )
+
+        def line(item, qty):
+            return {'order_item_id': item.id, 'quantity': qty, 'reason_id': self.return_reason.id}
+
+        first = create_return_request(self.order, [line(self.order_item, 2)], self.return_type)
+        second = create_return_request(other, [line(other_item, 1)], self.return_type)
+        self.assertEqual((first.total_amount, second.total_amount), (Decimal('2000'), Decimal('1000')))
+        self.assertEqual(SalesOrder.objects.filter(has_active_return=True).count(), 2)
+        with self.assertRaises(ValueError):
+            create_return_request(other, [line(self.order_item, 1)], self.return_type)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            '/api/return-requests/approve/', {'returns': [first.id, second.id, 0]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['approved']), sorted([first.id, second.id]))
+        self.assertIn(0, response.data['failed'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 103)
+        self.assertEqual(
+            AuditLog.objects.filter(model_name='returns.returnprocessing', action='create').count(), 4
+        )
+        # Approving again must not restore the stock twice
+        response = client.post('/api/return-requests/approve/', {'returns': [first.id]}, format='json')
+        self.assertEqual(response.data['approved'], [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 103)
+
+        pending = create_return_request(
+            SalesOrder.objects.create(
+                customer=self.customer, order_number='ORD-004', status=self.delivered_status,
+                delivery_date=timezone.now().date(), created_by=self.user
+            ), [], self.return_type
+        )
+        pending.delete()
+        self.assertFalse(SalesOrder.objects.get(pk=pending.order_id).has_active_return)
+
+    def test_sales_booked_on_every_move_into_delivered_or_paid(self):
+        from django.db.models import Sum
+        from orders.forms import OrderUpdateForm
+        from orders.models import Payment
+        from reports.models import ReturnRateRollup
+
+        def sold():
+            return ReturnRateRollup.objects.aggregate(total=Sum('sold_quantity'))['total'] or 0
+
+        order = SalesOrder.objects.create(
+            customer=self.customer, order_number='ORD-006', created_by=self.user, subtotal=3000,
+            status=OrderStatus.objects.get(code='PENDING'),
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=3, unit_price=1000, total_price=3000)
+        self.assertEqual(sold(), 0)
+
+        # Status edited on the order form
+        form = OrderUpdateForm(
+            {'status': self.delivered_status.id, 'notes': '', 'version': order.version}, instance=order
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        order = form.save()
+        self.assertEqual(sold(), 3)
+        order.status = OrderStatus.objects.get(code='PENDING')
+        order.save(update_fields=['status'])
+        self.assertEqual(sold(), 0)
+
+        # Paid in full without a delivery
+        Payment.objects.create(order=order, amount=order.total_amount)
+        order.refresh_from_db()
+        self.assertEqual((order.status.code, sold()), (ORDER_PAID, 3))
+
+    def test_return_rate_rollup(self):
+        from rest_framework.test import APIClient
+        from orders.services import deliver_order
+        from reports.models import ReturnRateRollup
+        from reports.rollups import return_rates
+        from returns.services import approve_return
+
+        call_command('backfill_return_rates', stdout=StringIO())
+        ret = create_return_request(self.order, [{
+            'order_item_id': self.order_item.id, 'quantity': 1, 'reason_id': self.return_reason.id,
+        }], self.return_type)
+        approve_return(ret.id, user=self.user)
+        confirmed = SalesOrder.objects.create(
+            customer=self.customer, order_number='ORD-005', created_by=self.user,
+            status=OrderStatus.objects.get(code='CONFIRMED'),
+        )
+        OrderItem.objects.create(order=confirmed, product=self.product, quantity=2, unit_price=1000, total_price=2000)
+        deliver_order(confirmed.id, user=self.user)
+
+        month = timezone.now().date()
+        [row] = return_rates(month, month, group_by=('month',))
+        self.assertEqual((row['sold'], row['returned'], row['rate']), (4, 1, Decimal('25.00')))
+        [row] = return_rates(month, month, group_by=('product', 'reason'))
+        self.assertEqual((row['reason_id'], row['sold'], row['rate']), (self.return_reason.id, 4, Decimal('25.00')))
+
+        # A rebuild from the source tables agrees with the incremental rollup
+        call_command('backfill_return_rates', stdout=StringIO())
+        self.assertEqual(ReturnRateRollup.objects.count(), 2)
+        [row] = return_rates(month, month, group_by=('month',))
+        self.assertEqual((row['sold'], row['returned']), (4, 1))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/reports/return-rates/', {'group_by': 'township,reason'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['rate'], '25.00')
+        self.assertEqual(client.get('/api/reports/return-rates/', {'group_by': 'color'}).status_code, 400)
+
+        from django.contrib.auth.models import Permission
+        self.user.user_permissions.add(Permission.objects.get(codename='view_returnrequest'))
+        self.client.force_login(self.user)
+        response = self.client.get('/reports/returns/', {'group': 'reason'})
+        self.assertContains(response, '25.00%')
+        response = self.client.get('/reports/export/returns/', {'group': 'reason'})
+        self.assertIn(self.return_reason.name_en, response.content.decode())
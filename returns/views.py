@@ -130,9 +130,7 @@ def return_create(request):
     base_qs = SalesOrder.objects.filter(
         deleted_at__isnull=True,
         status__in=returnable_statuses,
-    ).exclude(
-        return_requests__isnull=False,
-        return_requests__deleted_at__isnull=True
+        has_active_return=False,
     ).order_by('-created_at')
     
     recent_ids = list(base_qs.values_list('pk', flat=True)[:20])
@@ -143,13 +143,15 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Caching
+# Caching - per-process memory by default. Set CACHE_URL (e.g. dbcache://django_cache
+# or rediscache://host:6379/1) so workers and management commands share invalidations.
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    }
+    'default': env.cache('CACHE_URL', default='locmemcache://unique-snowflake'),
 }
+# Lifetime of the cache version tokens (prices, promotions, order statuses, catalog).
+# An invalidation that doesn't reach a process (per-process cache) is picked up
+# by it at the latest when its token expires.
+CACHE_VERSION_TIMEOUT = env.int('CACHE_VERSION_TIMEOUT', default=300)
 
 # Login
 LOGIN_REDIRECT_URL = '/'
@@ -160,6 +162,8 @@ LOGOUT_REDIRECT_URL = 'login'
 ORDER_NUMBER_PREFIX = env('ORDER_NUMBER_PREFIX', default='ORD')
 RETURN_NUMBER_PREFIX = env('RETURN_NUMBER_PREFIX', default='RET')
 RETURN_DAYS_LIMIT = env.int('RETURN_DAYS_LIMIT', default=7)
+PRE_ORDER_RESERVATION_DAYS = env.int('PRE_ORDER_RESERVATION_DAYS', default=30)  # 0 = never expire
+DOCUMENT_SEQUENCE_BLOCK_SIZE = env.int('DOCUMENT_SEQUENCE_BLOCK_SIZE', default=1)  # numbers reserved per worker at a time
 
 # Project Version
 VERSION = '1.0.0'
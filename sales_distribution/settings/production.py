@@ -9,6 +9,12 @@ SECRET_KEY = env('SECRET_KEY')
 DEBUG = False
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS')
 
+# Shared cache: gunicorn workers and management commands must see the same
+# invalidations. The database cache needs `python manage.py createcachetable`.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://django_cache'),
+}
+
 # Security
 SECURE_SSL_REDIRECT = env.bool('SECURE_SSL_REDIRECT', default=True)
 SECURE_HSTS_SECONDS = 31536000
@@ -15,6 +15,7 @@ if not exist "logs" mkdir logs
 REM Run reconciliation and log output
 REM Use --fix to automatically correct mismatches, or omit to just report
 echo Running Stock Reconciliation at %date% %time% >> logs\reconcile_log.txt
+python manage.py expire_reservations >> logs\reconcile_log.txt 2>&1
 python manage.py reconcile_stock >> logs\reconcile_log.txt 2>&1
 
 if errorlevel 1 (
@@ -19,6 +19,9 @@ mkdir -p logs
 # Run reconciliation and log output
 # Use --fix to automatically correct mismatches, or omit to just report
 echo "Running Stock Reconciliation at $(date)" >> logs/reconcile_log.txt
+python manage.py expire_reservations >> logs/reconcile_log.txt 2>&1
+python manage.py backfill_batch_summary --expired >> logs/reconcile_log.txt 2>&1
+python manage.py purge_idempotency_keys >> logs/reconcile_log.txt 2>&1
 python manage.py reconcile_stock >> logs/reconcile_log.txt 2>&1
 
 if [ $? -ne 0 ]; then
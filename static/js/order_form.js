@@ -1,6 +1,8 @@
 /**
  * Enhanced Order Form Logic
  * Handles dynamic item rows, price fetching, stock hints, and live total calculation.
+ * Product options come from the cached catalog JSON (config.catalogUrl); live
+ * stock comes from the quote (create page) or product search by ids (edit page).
  */
 
 (function () {
@@ -29,6 +31,66 @@
 
     let itemCount = config.itemCount;
     let productPrices = {}; // Store product prices
+    const stockByProduct = {}; // Live available quantities by product id
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function loadCatalog() {
+        if (!config.catalogUrl) return;
+        const firstSelect = document.querySelector('.product-select');
+        const emptyLabel = firstSelect && firstSelect.options.length ? firstSelect.options[0].text : '';
+        fetch(config.catalogUrl)
+            .then(r => r.json())
+            .then(data => {
+                const col = {};
+                (data.columns || []).forEach((name, i) => { col[name] = i; });
+                productOptions = `<option value="">${escapeHtml(emptyLabel)}</option>` + data.products.map(p => {
+                    const unit = p[col.unit] ? ` (${escapeHtml(p[col.unit])})` : '';
+                    return `<option value="${p[col.id]}" data-base="${p[col.base_price]}">${escapeHtml(p[col.name])}${unit}</option>`;
+                }).join('');
+                document.querySelectorAll('.product-select').forEach(sel => {
+                    const currentVal = sel.value;
+                    const currentOpt = sel.options[sel.selectedIndex];
+                    sel.innerHTML = productOptions;
+                    sel.value = currentVal;
+                    if (currentVal && sel.value !== currentVal && currentOpt) {
+                        // Selected product no longer in the catalog (e.g. deactivated): keep it
+                        sel.add(currentOpt);
+                        sel.value = currentVal;
+                    }
+                });
+                updatePrices();
+                scheduleStockRefresh();
+            })
+            .catch(err => console.error('Error fetching product catalog:', err));
+    }
+
+    function refreshStock() {
+        if (!config.stockUrl || config.quoteUrl) return;
+        const ids = new Set();
+        document.querySelectorAll('.product-select').forEach(sel => {
+            if (sel.value) ids.add(sel.value);
+        });
+        if (!ids.size) return;
+        fetch(config.stockUrl + '?ids=' + Array.from(ids).join(','))
+            .then(r => r.json())
+            .then(data => {
+                (data.results || []).forEach(p => { stockByProduct[p.id] = p.available; });
+                document.querySelectorAll('.item-row').forEach(renderStockHint);
+            })
+            .catch(err => console.error('Error fetching stock:', err));
+    }
+    const scheduleStockRefresh = (function () {
+        let timer = null;
+        return function () {
+            clearTimeout(timer);
+            timer = setTimeout(refreshStock, 300);
+        };
+    })();
 
     function formatCurrency(amount) {
         return new Intl.NumberFormat('en-US', {
@@ -74,9 +136,102 @@
         if (subtotalEl) subtotalEl.textContent = formatCurrency(subtotal);
         if (discountDisplayEl) discountDisplayEl.textContent = formatCurrency(discount);
         if (grandTotalEl) grandTotalEl.textContent = formatCurrency(grandTotal);
+
+        scheduleQuote();
+    }
+
+    // Server-side quote: one request per edit prices the whole cart and reports
+    // stock, delivery fee, promotion and credit limit problems before submit.
+    let quoteTimer = null;
+    let quoteSeq = 0;
+
+    function scheduleQuote() {
+        if (!config.quoteUrl) return;
+        clearTimeout(quoteTimer);
+        quoteTimer = setTimeout(fetchQuote, 300);
+    }
+
+    function fetchQuote() {
+        const customerField = document.getElementById('customer_id') || document.getElementById('id_customer');
+        const cid = customerField ? customerField.value : '';
+        const lines = [];
+        document.querySelectorAll('.item-row').forEach(row => {
+            const sel = row.querySelector('.product-select');
+            const qty = row.querySelector('.qty-input');
+            if (sel && sel.value && qty && qty.value) {
+                lines.push({ product_id: sel.value, quantity: qty.value });
+            }
+        });
+        if (!cid || !lines.length) {
+            quoteSeq++;
+            const btn = document.getElementById('submitBtn');
+            if (btn) btn.disabled = false;
+            return;
+        }
+
+        const preOrderEl = document.querySelector('[name="is_pre_order"]');
+        const discountEl = document.querySelector('[name="discount_amount"]');
+        const csrfEl = document.querySelector('[name="csrfmiddlewaretoken"]');
+        const seq = ++quoteSeq;
+
+        fetch(config.quoteUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfEl ? csrfEl.value : ''
+            },
+            body: JSON.stringify({
+                customer_id: cid,
+                order_type: preOrderEl && preOrderEl.checked ? 'PRE_ORDER' : 'NORMAL',
+                discount_amount: discountEl ? discountEl.value : 0,
+                lines: lines
+            })
+        })
+            .then(r => r.json())
+            .then(data => {
+                if (seq !== quoteSeq || !data.success) return;
+                (data.lines || []).forEach(line => { stockByProduct[line.product_id] = line.available; });
+                document.querySelectorAll('.item-row').forEach(renderStockHint);
+                showQuote(data);
+            })
+            .catch(err => console.error('Error fetching quote:', err));
+    }
+
+    function showQuote(data) {
+        const setText = (id, text) => {
+            const el = document.getElementById(id);
+            if (el) el.textContent = text;
+        };
+        setText('orderSubtotal', formatCurrency(data.subtotal));
+        setText('orderDiscount', formatCurrency(data.discount_amount));
+        setText('orderDeliveryFee', formatCurrency(data.delivery_fee));
+        setText('orderGrandTotal', formatCurrency(data.total_amount));
+        setText('orderPromotion', data.promotion
+            ? `${data.promotion.name} (-${parseFloat(data.promotion.discount_percent)}%)` : '');
+        setText('orderCreditHeadroom', data.credit.headroom === null
+            ? '-' : formatCurrency(data.credit.headroom));
+
+        const errorsEl = document.getElementById('quoteErrors');
+        if (errorsEl) {
+            errorsEl.innerHTML = '';
+            data.errors.forEach(err => {
+                const li = document.createElement('li');
+                li.innerHTML = '<i class="bi bi-exclamation-triangle me-1"></i>';
+                li.appendChild(document.createTextNode(err.message));
+                errorsEl.appendChild(li);
+            });
+        }
+        const btn = document.getElementById('submitBtn');
+        if (btn) btn.disabled = !data.ok;
     }
 
     function updateStockHint(row) {
+        renderStockHint(row);
+        scheduleStockRefresh();
+        updateGrandTotal();
+    }
+
+    function renderStockHint(row) {
         const sel = row.querySelector('.product-select');
         const qty = row.querySelector('.qty-input');
         const hint = row.querySelector('.stock-hint');
@@ -84,7 +239,8 @@
         if (!sel || !qty || !hint) return;
 
         const opt = sel.options[sel.selectedIndex];
-        const stock = opt && opt.dataset.stock ? parseInt(opt.dataset.stock) : null;
+        let stock = sel.value in stockByProduct ? stockByProduct[sel.value] : null;
+        if (stock === null && opt && opt.dataset.stock) stock = parseInt(opt.dataset.stock);
 
         if (stock !== null) {
             const qtyVal = parseInt(qty.value) || 0;
@@ -109,8 +265,6 @@
             qty.classList.remove('is-invalid', 'is-valid');
             hint.classList.remove('text-danger', 'text-success');
         }
-
-        updateGrandTotal();
     }
 
     function createRow() {
@@ -240,6 +394,11 @@
             });
     }
 
+    const preOrderEl = document.querySelector('[name="is_pre_order"]');
+    if (preOrderEl) {
+        preOrderEl.addEventListener('change', scheduleQuote);
+    }
+
     if (customerEl) {
         customerEl.addEventListener('change', updatePrices);
         if (customerEl.value) {
@@ -286,6 +445,7 @@
     // Initial check
     checkRemoveButtons();
     updateGrandTotal();
+    loadCatalog();
 
     // Form submit loading state
     const orderForm = document.getElementById('orderForm');
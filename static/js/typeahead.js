@@ -0,0 +1,120 @@
+/**
+ * Typeahead for large selects
+ * Upgrades <select data-typeahead-url="..."> into a search box. The server renders
+ * only the empty and selected options; matches come from the URL
+ * (?q=...&page=N -> {results: [{id, display_name}], has_more}).
+ * Picking a result sets the select's value and fires "change", so forms and
+ * other scripts keep working with the original select.
+ */
+document.addEventListener('DOMContentLoaded', function () {
+    function debounce(fn, wait) {
+        let timer = null;
+        return function (...args) {
+            clearTimeout(timer);
+            timer = setTimeout(() => fn.apply(this, args), wait);
+        };
+    }
+
+    function setupTypeahead(select) {
+        const url = select.dataset.typeaheadUrl;
+        const minChars = parseInt(select.dataset.minChars || '2');
+        const emptyOption = Array.from(select.options).find(opt => opt.value === '');
+
+        const wrapper = document.createElement('div');
+        wrapper.className = 'position-relative';
+        const input = document.createElement('input');
+        input.type = 'search';
+        input.className = 'form-control';
+        input.autocomplete = 'off';
+        input.placeholder = emptyOption ? emptyOption.text : '';
+        const selected = select.options[select.selectedIndex];
+        input.value = selected && selected.value ? selected.text.trim() : '';
+        const menu = document.createElement('div');
+        menu.className = 'dropdown-menu w-100 shadow-sm';
+        menu.style.maxHeight = '18rem';
+        menu.style.overflowY = 'auto';
+
+        select.classList.add('d-none');
+        select.parentNode.insertBefore(wrapper, select);
+        wrapper.appendChild(input);
+        wrapper.appendChild(menu);
+        wrapper.appendChild(select);
+
+        let seq = 0;
+        let page = 1;
+
+        function choose(value, label) {
+            let option = Array.from(select.options).find(opt => opt.value === String(value));
+            if (!option) {
+                option = new Option(label, value);
+                select.add(option);
+            }
+            select.value = String(value);
+            input.value = value ? label : '';
+            menu.classList.remove('show');
+            select.dispatchEvent(new Event('change', { bubbles: true }));
+        }
+
+        function addItem(text, onClick, extraClass) {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'dropdown-item text-truncate' + (extraClass ? ' ' + extraClass : '');
+            item.textContent = text;
+            item.addEventListener('mousedown', e => e.preventDefault());
+            item.addEventListener('click', onClick);
+            menu.appendChild(item);
+            return item;
+        }
+
+        function load(query, nextPage) {
+            const current = ++seq;
+            const params = new URLSearchParams({ q: query, page: nextPage });
+            fetch(url + '?' + params.toString())
+                .then(r => r.json())
+                .then(data => {
+                    if (current !== seq) return;
+                    page = data.page || nextPage;
+                    if (page === 1) menu.innerHTML = '';
+                    const more = menu.querySelector('.typeahead-more');
+                    if (more) more.remove();
+                    (data.results || []).forEach(row => {
+                        addItem(row.display_name || row.name, () => choose(row.id, row.display_name || row.name));
+                    });
+                    if (data.has_more) {
+                        addItem('…', () => load(query, page + 1), 'typeahead-more text-center text-muted');
+                    }
+                    if (!menu.children.length) {
+                        const none = document.createElement('span');
+                        none.className = 'dropdown-item-text text-muted';
+                        none.textContent = '—';
+                        menu.appendChild(none);
+                    }
+                    menu.classList.add('show');
+                })
+                .catch(err => console.error('Typeahead search failed:', err));
+        }
+
+        input.addEventListener('input', debounce(function () {
+            const query = input.value.trim();
+            if (!query) {
+                seq++;
+                menu.classList.remove('show');
+                if (select.value && emptyOption) choose('', '');
+                return;
+            }
+            if (query.length < minChars) {
+                menu.classList.remove('show');
+                return;
+            }
+            load(query, 1);
+        }, 250));
+
+        input.addEventListener('blur', () => {
+            menu.classList.remove('show');
+            const current = select.options[select.selectedIndex];
+            input.value = current && current.value ? current.text.trim() : '';
+        });
+    }
+
+    document.querySelectorAll('select[data-typeahead-url]').forEach(setupTypeahead);
+});